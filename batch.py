@@ -0,0 +1,113 @@
+import concurrent.futures
+import glob
+import os
+import sys
+import traceback
+
+import destroyer
+
+
+def FindDocuments(paths, fileList=None):
+    """
+    FindDocuments expands the given files, directories (searched recursively for .pdf files) and glob patterns, plus
+    the paths listed one per line in fileList ('-' reads standard input), into a sorted list without duplicates.
+    """
+    if fileList != None:
+        if fileList == '-':
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(fileList, 'r') as f:
+                lines = f.read().splitlines()
+        paths = list(paths) + [line.strip() for line in lines if line.strip() != '']
+
+    documents = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, filenames in os.walk(path):
+                for filename in filenames:
+                    if filename.lower().endswith('.pdf'):
+                        documents.add(os.path.join(directory, filename))
+        elif os.path.isfile(path):
+            documents.add(path)
+        else:
+            for match in glob.glob(path, recursive=True):
+                if os.path.isfile(match):
+                    documents.add(match)
+    return sorted(documents)
+
+
+def OutputPaths(documents, outputDirectory):
+    """
+    OutputPaths maps each document to a file in outputDirectory with the same name, adding a counter when two
+    documents have the same name.
+    """
+    outputs = {}
+    used = set()
+    for document in documents:
+        name, extension = os.path.splitext(os.path.basename(document))
+        candidate = name + extension
+        counter = 1
+        while candidate in used:
+            candidate = '%s-%d%s' % (name, counter, extension)
+            counter += 1
+        used.add(candidate)
+        outputs[document] = os.path.join(outputDirectory, candidate)
+    return outputs
+
+
+def ProcessDocument(options, document, output):
+    """
+    ProcessDocument runs the font destroyer on one document and returns (document, output, error), where error is
+    None on success. It never raises, so that one bad document does not stop a batch, and removes the output of a
+    failed document.
+    """
+    try:
+        if destroyer.FontDestroyer(options).UpdatePDF(document, output) != False:
+            return (document, output, None)
+        error = 'document catalog not found'
+    except KeyboardInterrupt:
+        raise
+    except BaseException:
+        error = traceback.format_exc().strip().splitlines()[-1]
+    # do not leave a partial output behind
+    if os.path.exists(output):
+        os.remove(output)
+    return (document, output, error)
+
+
+def Run(options, documents, outputDirectory, jobs=None):
+    """
+    Run processes the documents with a pool of jobs worker processes (all cores by default), writing the results
+    to outputDirectory and reporting each document as it finishes. It returns the number of failed documents.
+    """
+    if not os.path.isdir(outputDirectory):
+        os.makedirs(outputDirectory)
+    outputs = OutputPaths(documents, outputDirectory)
+    failures = 0
+
+    def Report(result):
+        document, output, error = result
+        if error == None:
+            print('OK      %s -> %s' % (document, output))
+            return 0
+        print('FAILED  %s: %s' % (document, error))
+        return 1
+
+    if jobs == 1:
+        for document in documents:
+            failures += Report(ProcessDocument(options, document, outputs[document]))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {}
+            for document in documents:
+                futures[executor.submit(ProcessDocument, options, document, outputs[document])] = document
+            for future in concurrent.futures.as_completed(futures):
+                document = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = (document, outputs[document], 'worker failed: %s' % e)
+                failures += Report(result)
+
+    print('%d documents processed, %d failed' % (len(documents), failures))
+    return failures
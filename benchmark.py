@@ -0,0 +1,312 @@
+import io
+import json
+import optparse
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import zlib
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import decode
+import generate
+import parser
+import pdf_objects
+import write
+
+__description__ = 'benchmark measures the throughput and peak memory of each processing phase over a set of PDF documents'
+
+TEST_FILES = ['cs380s_report.pdf', 'icml2006.pdf', 'nips.pdf']
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.10
+
+# the filter phases encode this much of the document, so that they measure the decoders on realistic data
+FILTER_SAMPLE_SIZE = 512 * 1024
+# the decode phase decodes every stream, not only the ones the font destroyer needs
+ALL_STREAMS = pdf_objects.DecodePolicy(pdf_objects.STREAM_CLASSES)
+
+PDF_ELEMENT_COMMENT = 1
+PDF_ELEMENT_INDIRECT_OBJECT = 2
+
+
+def ParseObjects(document):
+    """
+    ParseObjects returns every element of the document, fully tokenized.
+    """
+    document.seek(0)
+    oPDFParser = parser.Parser(document)
+    elements = []
+    object = oPDFParser.GetObject()
+    while object != None:
+        elements.append(object)
+        object = oPDFParser.GetObject()
+    return elements
+
+
+# Each phase is a (setup, run) pair: setup(document) prepares the input of run and is not timed, run(input) does the
+# measured work and returns (items, bytes) processed.
+
+def SetupDocument(document):
+    return document
+
+
+def RunTokenize(document):
+    document.seek(0)
+    tokens = parser.RegexTokenizer(document).Tokens()
+    return (len(tokens), document.size)
+
+
+def RunTokenizeLoop(document):
+    document.seek(0)
+    tokens = parser.Tokenizer(document).Tokens()
+    return (len(tokens), document.size)
+
+
+def RunParse(document, lazy=False):
+    document.seek(0)
+    oPDFParser = parser.Parser(document, lazy=lazy)
+    count = 0
+    object = oPDFParser.GetObject()
+    while object != None:
+        if object.type == PDF_ELEMENT_INDIRECT_OBJECT:
+            count += 1
+        object = oPDFParser.GetObject()
+    return (count, document.size)
+
+
+def RunParseLazy(document):
+    return RunParse(document, True)
+
+
+def SetupDecode(document):
+    return [object for object in ParseObjects(document) if object.type == PDF_ELEMENT_INDIRECT_OBJECT and object.ContainsStream()]
+
+
+def RunDecode(objects):
+    size = 0
+    for object in objects:
+        data = object.Stream(policy=ALL_STREAMS)
+        if data != 'No filters':
+            size += len(data)
+    return (len(objects), size)
+
+
+def SetupFilter(filter, decoder):
+    """
+    SetupFilter returns the setup of the phase that measures one decoder: it encodes the start of the document with
+    the matching encoder of generate, and checks that the decoder gives the original data back.
+    """
+    def Setup(document):
+        sample = bytes(document.data[:FILTER_SAMPLE_SIZE])
+        encoded = generate.Encode(sample, filter)
+        if decoder(encoded) != sample:
+            raise Exception('%s does not decode its own encoding' % decoder.__name__)
+        return (decoder, encoded, len(sample))
+    return Setup
+
+
+def RunFilter(prepared):
+    decoder, encoded, size = prepared
+    decoder(encoded)
+    return (1, size)
+
+
+def SetupDamagedFlate(document):
+    """
+    SetupDamagedFlate compresses the start of the document with Flate and damages the checksum at the end, so that
+    zlib fails after inflating all the data, and checks that FlateRecover bisects to the damaged bytes.
+    """
+    sample = bytes(document.data[:FILTER_SAMPLE_SIZE])
+    encoded = zlib.compress(sample)
+    damaged = encoded[:-4] + bytes(byte ^ 0xFF for byte in encoded[-4:])
+    output, lost = decode.FlateRecover(damaged)
+    if output != sample or lost == 0 or lost > 4:
+        raise Exception('FlateRecover does not recover the damaged data')
+    return damaged
+
+
+def RunDamagedFlate(damaged):
+    output, lost = decode.FlateRecover(damaged)
+    return (1, len(damaged))
+
+
+def SetupWrite(document):
+    return [object for object in ParseObjects(document) if object.type in (PDF_ELEMENT_COMMENT, PDF_ELEMENT_INDIRECT_OBJECT)]
+
+
+def RunWrite(elements):
+    outfile = io.BytesIO()
+    writer = write.Writer(outfile, lambda object: write.FormatOutput(object.content, True))
+    count = 0
+    for element in elements:
+        if element.type == PDF_ELEMENT_COMMENT:
+            writer.writeComment(element)
+        else:
+            writer.writeObject(element)
+            count += 1
+    writer.writeXrefAndTrailer(1, 0)
+    writer.close()
+    return (count, len(outfile.getvalue()))
+
+
+PHASES = {
+    'tokenize': (SetupDocument, RunTokenize, 'tokens'),
+    'tokenize-loop': (SetupDocument, RunTokenizeLoop, 'tokens'),
+    'parse': (SetupDocument, RunParse, 'objects'),
+    'parse-lazy': (SetupDocument, RunParseLazy, 'objects'),
+    'decode': (SetupDecode, RunDecode, 'streams'),
+    'write': (SetupWrite, RunWrite, 'objects'),
+    'filter-flate': (SetupFilter('flate', decode.FlateDecode), RunFilter, 'streams'),
+    'filter-lzw': (SetupFilter('lzw', decode.LZWDecode), RunFilter, 'streams'),
+    'filter-ascii85': (SetupFilter('ascii85', decode.ASCII85Decode), RunFilter, 'streams'),
+    'filter-asciihex': (SetupFilter('asciihex', decode.ASCIIHexDecode), RunFilter, 'streams'),
+    'filter-runlength': (SetupFilter('runlength', decode.RunLengthDecode), RunFilter, 'streams'),
+    'filter-flate-damaged': (SetupDamagedFlate, RunDamagedFlate, 'streams'),
+}
+DEFAULT_PHASES = ['tokenize', 'parse', 'decode', 'write']
+
+
+def PeakRSS():
+    """
+    PeakRSS returns the peak resident set size of this process in kilobytes, or None when it is not available.
+    """
+    if resource == None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # macOS reports bytes instead of kilobytes
+        peak //= 1024
+    return peak
+
+
+def MeasurePhase(phase, filename, repeat):
+    """
+    MeasurePhase runs one phase over one document repeat times and returns the fastest run, together with the peak
+    memory traced by tracemalloc during an extra run and the peak RSS of the process. It is meant to run in a fresh
+    process (see RunPhase), so that the peak RSS belongs to this phase alone.
+    """
+    setup, run, unit = PHASES[phase]
+    document = parser.Document(filename)
+    best = None
+    for i in range(repeat):
+        prepared = setup(document)
+        start = time.perf_counter()
+        items, size = run(prepared)
+        seconds = time.perf_counter() - start
+        if best == None or seconds < best:
+            best = seconds
+        prepared = None
+
+    prepared = setup(document)
+    tracemalloc.start()
+    run(prepared)
+    tracedPeak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'file': os.path.basename(filename),
+        'phase': phase,
+        'unit': unit,
+        'items': items,
+        'bytes': size,
+        'seconds': best,
+        'mb_per_second': size / best / 1e6 if best > 0 else None,
+        'items_per_second': items / best if best > 0 else None,
+        'peak_traced_kb': tracedPeak // 1024,
+        'peak_rss_kb': PeakRSS(),
+    }
+
+
+def RunPhase(phase, filename, repeat):
+    """
+    RunPhase measures one phase over one document in a child process and returns its result.
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--child', phase, '--repeat', str(repeat), filename]
+    oProcess = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if oProcess.returncode != 0:
+        raise Exception('Phase %s failed on %s:\n%s' % (phase, filename, oProcess.stderr))
+    return json.loads(oProcess.stdout.strip().splitlines()[-1])
+
+
+def Compare(results, baseline, tolerance):
+    """
+    Compare prints the change of every result against the matching result of the baseline and returns the number of
+    regressions: runs slower, or peak RSS higher, than the baseline by more than tolerance (a fraction).
+    """
+    previous = dict(((result['file'], result['phase']), result) for result in baseline['results'])
+    regressions = 0
+    print('')
+    print('%-20s %-20s %10s %10s %8s %10s %10s %8s' % ('file', 'phase', 'base s', 'new s', 'change', 'base RSS', 'new RSS', 'change'))
+    for result in results:
+        base = previous.get((result['file'], result['phase']))
+        if base == None:
+            print('%-20s %-20s %s' % (result['file'], result['phase'], 'not in baseline'))
+            continue
+        flags = []
+        timeChange = result['seconds'] / base['seconds'] - 1 if base['seconds'] > 0 else 0
+        if timeChange > tolerance:
+            flags.append('SLOWER')
+        rssChange = 0
+        if result['peak_rss_kb'] != None and base['peak_rss_kb']:
+            rssChange = result['peak_rss_kb'] / base['peak_rss_kb'] - 1
+            if rssChange > tolerance:
+                flags.append('MORE MEMORY')
+        if flags != []:
+            regressions += 1
+        print('%-20s %-20s %10.4f %10.4f %+7.1f%% %10s %10s %+7.1f%% %s' % (result['file'], result['phase'], base['seconds'], result['seconds'], timeChange * 100, base['peak_rss_kb'], result['peak_rss_kb'], rssChange * 100, ' '.join(flags)))
+    return regressions
+
+
+def Main():
+    """Main runs the selected phases over the given documents (the test files by default) and reports the results."""
+
+    oParser = optparse.OptionParser(usage='usage: %prog [options] [pdf-file ...]\n' + __description__)
+    oParser.add_option('-p', '--phases', type='string', default=','.join(DEFAULT_PHASES), help='comma-separated phases to run, from: %s (default: %%default)' % ', '.join(sorted(PHASES)))
+    oParser.add_option('-r', '--repeat', type='int', default=DEFAULT_REPEAT, help='runs per phase, the fastest is reported (default: %default)')
+    oParser.add_option('-o', '--output', type='string', default=None, help='save the results as JSON to this file')
+    oParser.add_option('-b', '--baseline', type='string', default=None, help='compare the results against the JSON results saved in this file')
+    oParser.add_option('-t', '--tolerance', type='float', default=DEFAULT_TOLERANCE, help='fraction by which a phase may be slower or use more memory than the baseline (default: %default)')
+    oParser.add_option('--child', type='string', default=None, help=optparse.SUPPRESS_HELP)
+    (options, args) = oParser.parse_args()
+
+    if options.child != None:
+        print(json.dumps(MeasurePhase(options.child, args[0], options.repeat)))
+        return
+
+    phases = [phase.strip() for phase in options.phases.split(',') if phase.strip() != '']
+    for phase in phases:
+        if phase not in PHASES:
+            oParser.error('unknown phase %s' % phase)
+    if args == []:
+        directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_files')
+        args = [os.path.join(directory, filename) for filename in TEST_FILES]
+
+    results = []
+    print('%-20s %-20s %10s %10s %14s %12s %12s' % ('file', 'phase', 'seconds', 'MB/s', 'items/s', 'traced KB', 'RSS KB'))
+    for filename in args:
+        for phase in phases:
+            result = RunPhase(phase, filename, options.repeat)
+            results.append(result)
+            print('%-20s %-20s %10.4f %10.2f %14s %12d %12s' % (result['file'], result['phase'], result['seconds'], result['mb_per_second'] or 0, '%.0f %s' % (result['items_per_second'] or 0, result['unit']), result['peak_traced_kb'], result['peak_rss_kb']))
+
+    if options.output != None:
+        with open(options.output, 'w') as f:
+            json.dump({'python': platform.python_version(), 'platform': platform.platform(), 'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'repeat': options.repeat, 'results': results}, f, indent=1)
+
+    if options.baseline != None:
+        with open(options.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = Compare(results, baseline, options.tolerance)
+        print('%d regressions' % regressions)
+        if regressions > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    Main()
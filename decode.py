@@ -1,163 +1,518 @@
 import binascii
-import sys
+import itertools
+import stats
+import struct
+import time
 import zlib
-from io import StringIO
+
+# The decoders take bytes, bytearray, memoryview or (for compatibility with the tokenizer) Latin-1 str data, and
+# always return bytes. Each filter also has a decoder class that decodes data given in chunks, for DecodeChunks.
+
+WHITESPACE = b'\x00\t\n\x0c\r '
+# the value of every ASCII85 digit, and 255 for the bytes that are not digits
+ASCII85_VALUES = bytes(byte - 33 if 33 <= byte <= 117 else 255 for byte in range(256))
+LZW_CLEAR = 256
+LZW_END = 257
+LZW_MAX_TABLE = 4096
+# the largest number of codes the LZW decoder reads at a time
+LZW_BATCH = 16
+# data that zlib cannot inflate is accepted when it is longer than FLATE_MIN_RECOVERED bytes and inflates up to its
+# last FLATE_MAX_LOST bytes
+FLATE_MIN_RECOVERED = 10
+FLATE_MAX_LOST = 2
+FLATE_RECOVERY_CHUNK_SIZE = 64 * 1024
+# the default size of the chunks read and yielded by DecodeChunks
+CHUNK_SIZE = 64 * 1024
+
+
+def AsBytes(data):
+    """
+    AsBytes returns data as a bytes-like object, encoding str as Latin-1.
+    """
+    if type(data) == str:
+        return data.encode('latin-1')
+    return data
+
+
+def ASCII85Digits(data):
+    """
+    ASCII85Digits decodes ASCII85 digits without whitespace, z abbreviations or end marker. The groups of five digits
+    are converted all at once: the digits are translated to their values and the columns of the groups zipped
+    together.
+    """
+    padding = -len(data) % 5
+    if padding == 4:
+        raise ValueError('ASCII85 data ends with a single digit')
+    digits = (data + b'u' * padding).translate(ASCII85_VALUES)
+    if len(digits) > 0 and max(digits) >= 85:
+        raise ValueError('Invalid ASCII85 digit')
+    words = [(((a * 85 + b) * 85 + c) * 85 + d) * 85 + e for a, b, c, d, e in zip(digits[0::5], digits[1::5], digits[2::5], digits[3::5], digits[4::5])]
+    result = struct.pack('>%dL' % len(words), *words)
+    return result[:len(result) - padding]
 
 
-# http://code.google.com/p/pdfminerr/source/browse/trunk/pdfminer/pdfminer/ascii85.py
 def ASCII85Decode(data):
-  import struct
-  n = b = 0
-  out = ''
-  for c in data:
-    if '!' <= c and c <= 'u':
-      n += 1
-      b = b*85+(ord(c)-33)
-      if n == 5:
-        out += struct.pack('>L',b)
-        n = b = 0
-    elif c == 'z':
-      assert n == 0
-      out += '\0\0\0\0'
-    elif c == '~':
-      if n:
-        for _ in range(5-n):
-          b = b*85+84
-        out += struct.pack('>L',b)[:n-1]
-      break
-  return out
+    """
+    ASCII85Decode decodes data up to the ~> end marker, ignoring whitespace.
+    """
+    data = bytes(AsBytes(data))
+    end = data.find(b'~')
+    if end != -1:
+        data = data[:end]
+    return ASCII85Digits(data.translate(None, WHITESPACE).replace(b'z', b'!!!!!'))
+
 
 def ASCIIHexDecode(data):
-    return binascii.unhexlify(''.join([c for c in data if c not in ' \t\n\r']).rstrip('>'))
+    """
+    ASCIIHexDecode decodes data up to the > end marker, ignoring whitespace. A missing last digit is taken to be 0.
+    """
+    data = bytes(AsBytes(data))
+    end = data.find(b'>')
+    if end != -1:
+        data = data[:end]
+    data = data.translate(None, WHITESPACE)
+    if len(data) % 2 == 1:
+        data += b'0'
+    return binascii.unhexlify(data)
 
-#Convert 2 Bytes If Python 3
-def C2BIP3(string):
-    if sys.version_info[0] > 2:
-        if type(string) == bytes:
-            return string
-        else:
-            return bytes([ord(x) for x in string])
-    else:
-        return string
 
-# if inflating fails, we try to inflate byte per byte (sample 4da299d6e52bbb79c0ac00bad6a1d51d4d5fe42965a8d94e88a359e5277117e2)
+# if inflating fails, we recover what can be inflated (sample 4da299d6e52bbb79c0ac00bad6a1d51d4d5fe42965a8d94e88a359e5277117e2)
 def FlateDecode(data):
+    data = AsBytes(data)
     try:
-        return zlib.decompress(C2BIP3(data))
-    except:
-        if len(data) <= 10:
+        return zlib.decompress(data)
+    except zlib.error:
+        if len(data) <= FLATE_MIN_RECOVERED:
             raise
-        oDecompress = zlib.decompressobj()
-        oStringIO = StringIO()
-        count = 0
-        for byte in C2BIP3(data):
-            try:
-                oStringIO.write(oDecompress.decompress(byte))
-                count += 1
-            except:
-                break
-        if len(data) - count <= 2:
-            return oStringIO.getvalue()
+        result, lost = FlateRecover(data)
+        if stats.collector != None:
+            stats.collector.Count('flate streams recovered')
+            stats.collector.Count('flate bytes lost', lost)
+        if lost <= FLATE_MAX_LOST:
+            return result
         else:
             raise
 
+
+def FlateRecover(data, chunkSize=FLATE_RECOVERY_CHUNK_SIZE):
+    """
+    FlateRecover inflates damaged or truncated data as far as it can be inflated, and returns the output with the
+    number of bytes lost after the last decodable offset. The data is fed to the decompressor in chunks, and only the
+    chunk on which it fails is bisected.
+    """
+    data = memoryview(AsBytes(data))
+    oDecompress = zlib.decompressobj()
+    result = []
+    for start in range(0, len(data), chunkSize):
+        chunk = data[start:start + chunkSize]
+        # a decompressor that failed cannot be used any more, the bisection starts from a copy
+        oBackup = oDecompress.copy()
+        try:
+            result.append(oDecompress.decompress(chunk))
+        except zlib.error:
+            output, decoded = FlateDecodablePrefix(oBackup, chunk)
+            result.append(output)
+            return b''.join(result), len(data) - start - decoded
+    return b''.join(result), 0
+
+
+def FlateDecodablePrefix(oDecompress, data):
+    """
+    FlateDecodablePrefix feeds the longest prefix of data that inflates without error to the decompressor, which
+    fails on all of data, and returns its output and the length of the prefix. As every prefix that includes the first
+    bad byte fails too, the length is found by bisection on copies of the decompressor.
+    """
+    # the prefix of length low inflates, the one of length high fails
+    low = 0
+    high = len(data)
+    while high - low > 1:
+        middle = (low + high) // 2
+        try:
+            oDecompress.copy().decompress(data[:middle])
+            low = middle
+        except zlib.error:
+            high = middle
+    return oDecompress.decompress(data[:low]), low
+
+
+def UndoPredictor(data, predictor, columns=1, colors=1, bitsPerComponent=8):
+    """Reverses the TIFF (2) or PNG (10-15) predictor described by a /DecodeParms dictionary."""
+    if predictor == 1:
+        return data
+    bytesPerPixel = max(1, colors * bitsPerComponent // 8)
+    rowSize = (columns * colors * bitsPerComponent + 7) // 8
+    data = bytearray(data)
+    if predictor == 2:
+        if bitsPerComponent != 8:
+            raise ValueError('Unsupported TIFF predictor with %d bits per component' % bitsPerComponent)
+        for start in range(0, len(data), rowSize):
+            for i in range(start + bytesPerPixel, min(start + rowSize, len(data))):
+                data[i] = (data[i] + data[i - bytesPerPixel]) & 0xFF
+        return bytes(data)
+    if predictor < 10:
+        raise ValueError('Unsupported predictor %d' % predictor)
+    result = bytearray()
+    previous = bytearray(rowSize)
+    for start in range(0, len(data) - rowSize, rowSize + 1):
+        pngFilter = data[start]
+        row = data[start + 1:start + 1 + rowSize]
+        if pngFilter == 1:
+            for i in range(bytesPerPixel, rowSize):
+                row[i] = (row[i] + row[i - bytesPerPixel]) & 0xFF
+        elif pngFilter == 2:
+            for i in range(rowSize):
+                row[i] = (row[i] + previous[i]) & 0xFF
+        elif pngFilter == 3:
+            for i in range(rowSize):
+                left = row[i - bytesPerPixel] if i >= bytesPerPixel else 0
+                row[i] = (row[i] + ((left + previous[i]) >> 1)) & 0xFF
+        elif pngFilter == 4:
+            for i in range(rowSize):
+                left = row[i - bytesPerPixel] if i >= bytesPerPixel else 0
+                upperLeft = previous[i - bytesPerPixel] if i >= bytesPerPixel else 0
+                estimate = left + previous[i] - upperLeft
+                distanceLeft = abs(estimate - left)
+                distanceUp = abs(estimate - previous[i])
+                distanceUpperLeft = abs(estimate - upperLeft)
+                if distanceLeft <= distanceUp and distanceLeft <= distanceUpperLeft:
+                    row[i] = (row[i] + left) & 0xFF
+                elif distanceUp <= distanceUpperLeft:
+                    row[i] = (row[i] + previous[i]) & 0xFF
+                else:
+                    row[i] = (row[i] + upperLeft) & 0xFF
+        elif pngFilter != 0:
+            raise ValueError('Unsupported PNG filter type %d' % pngFilter)
+        result += row
+        previous = row
+    return bytes(result)
+
+
 def RunLengthDecode(data):
-    f = StringIO(data)
-    decompressed = ''
-    runLength = ord(f.read(1))
-    while runLength:
-        if runLength < 128:
-            decompressed += f.read(runLength + 1)
-        if runLength > 128:
-            decompressed += f.read(1) * (257 - runLength)
-        if runLength == 128:
-            break
-        runLength = ord(f.read(1))
-#    return sub(r'(\d+)(\D)', lambda m: m.group(2) * int(m.group(1)), data)
-    return decompressed
-
-#### LZW code sourced from pdfminer
-# Copyright (c) 2004-2009 Yusuke Shinyama <yusuke at cs dot nyu dot edu>
-#
-# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
-# documentation files (the "Software"), to deal in the Software without restriction, including without limitation
-# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
-# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
-
-class LZWDecoder(object):
-    def __init__(self, fp):
-        self.fp = fp
-        self.buff = 0
-        self.bpos = 8
-        self.nbits = 9
-        self.table = None
-        self.prevbuf = None
-        return
-
-    def readbits(self, bits):
-        v = 0
-        while 1:
-            # the number of remaining bits we can get from the current buffer.
-            r = 8-self.bpos
-            if bits <= r:
-                # |-----8-bits-----|
-                # |-bpos-|-bits-|  |
-                # |      |----r----|
-                v = (v<<bits) | ((self.buff>>(r-bits)) & ((1<<bits)-1))
-                self.bpos += bits
+    """
+    RunLengthDecode decodes data up to the 128 end marker: a length byte below 128 is followed by that many plus one
+    literal bytes, one above 128 by a byte repeated 257 minus length times.
+    """
+    return DecodeAll(RunLengthDecoder(), data)
+
+
+def LZWDecode(data, earlyChange=1):
+    """
+    LZWDecode decodes data compressed with the LZW variant of PDF.
+    """
+    return DecodeAll(LZWDecoder(earlyChange=earlyChange), data)
+
+
+def DecodeAll(decoder, data):
+    """
+    DecodeAll returns all the output of a decoder class for data given at once.
+    """
+    return b''.join(list(decoder.Decode(AsBytes(data))) + list(decoder.Flush()))
+
+
+# The decoder classes below decode data given in chunks. Decode(data) and, after the last chunk, Flush() yield the
+# output in pieces of about chunkSize bytes, keeping between calls only the end of a chunk that cannot be decoded yet.
+# Everything after the end marker of a filter is ignored.
+
+class FlateDecoder:
+    def __init__(self, chunkSize=CHUNK_SIZE):
+        self.decompressor = zlib.decompressobj()
+        self.chunkSize = chunkSize
+        # like FlateDecode, the output is accepted when only the last few bytes of a long stream cannot be inflated
+        self.size = 0
+        self.lost = None
+
+    def Decode(self, data):
+        self.size += len(data)
+        if self.lost != None:
+            self.lost += len(data)
+            return
+        decompressor = self.decompressor
+        while not decompressor.eof and len(data) > 0:
+            backup = decompressor.copy()
+            try:
+                # at most chunkSize bytes are inflated at a time, the rest of the input is kept in unconsumed_tail
+                output = decompressor.decompress(data, self.chunkSize)
+            except zlib.error:
+                output, decoded = FlateDecodablePrefix(backup, data)
+                self.lost = len(data) - decoded
+                if len(output) > 0:
+                    yield output
+                return
+            data = decompressor.unconsumed_tail
+            if len(output) > 0:
+                yield output
+
+    def Flush(self):
+        if self.lost == None and self.decompressor.eof:
+            return
+        # the data is damaged or truncated, and recovered on the same conditions as in FlateDecode
+        if self.size <= FLATE_MIN_RECOVERED:
+            raise zlib.error('Error inflating stream of %d bytes' % self.size)
+        lost = self.lost if self.lost != None else 0
+        if stats.collector != None:
+            stats.collector.Count('flate streams recovered')
+            stats.collector.Count('flate bytes lost', lost)
+        if lost > FLATE_MAX_LOST:
+            raise zlib.error('Error inflating stream, %d bytes lost' % lost)
+        if self.lost == None:
+            output = self.decompressor.flush()
+            if len(output) > 0:
+                yield output
+
+
+class ASCIIHexDecoder:
+    def __init__(self, chunkSize=CHUNK_SIZE):
+        # two digits give one byte
+        self.step = max(2, chunkSize * 2)
+        self.pending = b''
+        self.done = False
+
+    def Decode(self, data):
+        if self.done:
+            return
+        data = bytes(AsBytes(data))
+        end = data.find(b'>')
+        if end != -1:
+            data = data[:end]
+            self.done = True
+        data = self.pending + data.translate(None, WHITESPACE)
+        even = len(data) - len(data) % 2
+        self.pending = data[even:]
+        for start in range(0, even, self.step):
+            yield binascii.unhexlify(data[start:min(start + self.step, even)])
+
+    def Flush(self):
+        if len(self.pending) > 0:
+            yield binascii.unhexlify(self.pending + b'0')
+
+
+class ASCII85Decoder:
+    def __init__(self, chunkSize=CHUNK_SIZE):
+        # five digits give four bytes
+        self.step = max(5, chunkSize // 4 * 5)
+        self.pending = b''
+        self.done = False
+
+    def Decode(self, data):
+        if self.done:
+            return
+        data = bytes(AsBytes(data))
+        end = data.find(b'~')
+        if end != -1:
+            data = data[:end]
+            self.done = True
+        data = self.pending + data.translate(None, WHITESPACE).replace(b'z', b'!!!!!')
+        whole = len(data) - len(data) % 5
+        self.pending = data[whole:]
+        for start in range(0, whole, self.step):
+            yield ASCII85Digits(data[start:min(start + self.step, whole)])
+
+    def Flush(self):
+        if len(self.pending) > 0:
+            yield ASCII85Digits(self.pending)
+
+
+class RunLengthDecoder:
+    def __init__(self, chunkSize=CHUNK_SIZE):
+        self.chunkSize = chunkSize
+        self.pending = b''
+        self.done = False
+
+    def Decode(self, data):
+        if self.done:
+            return
+        data = self.pending + bytes(AsBytes(data))
+        result = bytearray()
+        size = len(data)
+        i = 0
+        while i < size:
+            length = data[i]
+            if length < 128:
+                if i + 2 + length > size:
+                    break
+                result += data[i + 1:i + 2 + length]
+                i += length + 2
+            elif length > 128:
+                if i + 2 > size:
+                    break
+                result += data[i + 1:i + 2] * (257 - length)
+                i += 2
+            else:
+                self.done = True
+                i = size
                 break
+            if len(result) >= self.chunkSize:
+                yield bytes(result)
+                result = bytearray()
+        self.pending = data[i:]
+        if len(result) > 0:
+            yield bytes(result)
+
+    def Flush(self):
+        # of a run cut off by the end of the data, the literal bytes that are there are kept
+        if len(self.pending) > 1 and self.pending[0] < 128:
+            yield self.pending[1:]
+
+
+class LZWDecoder:
+    """
+    LZWDecoder decodes the LZW variant of PDF. The table holds the byte string of every code, and the codes are
+    extracted in batches of the same width from integers read several bytes at a time.
+    """
+
+    def __init__(self, chunkSize=CHUNK_SIZE, earlyChange=1):
+        self.earlyChange = earlyChange
+        self.chunkSize = chunkSize
+        self.table = [bytes([i]) for i in range(256)] + [b'', b'']
+        self.previous = None
+        self.width = 9
+        # with early change, the code width grows one code before the table needs it
+        self.widen = (1 << self.width) - earlyChange
+        # the bytes that were not decoded yet, and the number of bits of their first byte that were
+        self.pending = b''
+        self.pendingBits = 0
+        self.done = False
+
+    def Decode(self, data):
+        if self.done:
+            return
+        data = AsBytes(data)
+        if len(self.pending) > 0:
+            data = self.pending + data
+        earlyChange = self.earlyChange
+        table = self.table
+        append = table.append
+        previous = self.previous
+        width = self.width
+        widen = self.widen
+        totalBits = len(data) * 8
+        position = self.pendingBits
+        result = bytearray()
+        while True:
+            # the table grows by at most one entry per code, so the width cannot change during the next
+            # widen - len(table) codes: they are cut out of one integer read from the data. At 12 bits only a clear
+            # code, which ends the batch, changes the width
+            if width < 12:
+                count = min(LZW_BATCH, max(1, widen - len(table)), (totalBits - position) // width)
             else:
-                # |-----8-bits-----|
-                # |-bpos-|---bits----...
-                # |      |----r----|
-                v = (v<<r) | (self.buff & ((1<<r)-1))
-                bits -= r
-                x = self.fp.read(1)
-                if not x: raise EOFError
-                self.buff = ord(x)
-                self.bpos = 0
-        return v
-
-    def feed(self, code):
-        x = ''
-        if code == 256:
-            self.table = [ chr(c) for c in range(256) ] # 0-255
-            self.table.append(None) # 256
-            self.table.append(None) # 257
-            self.prevbuf = ''
-            self.nbits = 9
-        elif code == 257:
-            pass
-        elif not self.prevbuf:
-            x = self.prevbuf = self.table[code]
+                count = min(LZW_BATCH, (totalBits - position) // width)
+            if count <= 0:
+                break
+            start = position >> 3
+            end = (position + count * width + 7) >> 3
+            bits = int.from_bytes(data[start:end], 'big')
+            shift = (end - start) * 8 - (position & 7)
+            mask = (1 << width) - 1
+            for i in range(count):
+                shift -= width
+                code = (bits >> shift) & mask
+                tableSize = len(table)
+                if code < LZW_CLEAR or LZW_END < code < tableSize:
+                    entry = table[code]
+                    if previous != None and tableSize < LZW_MAX_TABLE:
+                        append(previous + entry[:1])
+                elif code == LZW_CLEAR:
+                    count = i + 1
+                    del table[258:]
+                    previous = None
+                    break
+                elif code == LZW_END:
+                    self.done = True
+                    break
+                elif code == tableSize and previous != None:
+                    entry = previous + previous[:1]
+                    append(entry)
+                else:
+                    raise ValueError('Invalid LZW code %d' % code)
+                result += entry
+                previous = entry
+            if self.done:
+                break
+            position += count * width
+            if previous == None:
+                width = 9
+                widen = (1 << width) - earlyChange
+            elif len(table) >= widen and width < 12:
+                width += 1
+                widen = (1 << width) - earlyChange
+            if len(result) >= self.chunkSize:
+                yield bytes(result)
+                result = bytearray()
+        self.previous = previous
+        self.width = width
+        self.widen = widen
+        self.pending = bytes(data[position >> 3:])
+        self.pendingBits = position & 7
+        if len(result) > 0:
+            yield bytes(result)
+
+    def Flush(self):
+        return iter(())
+
+
+DECODERS = {
+    '/FlateDecode': FlateDecoder,
+    '/Fl': FlateDecoder,
+    '/ASCIIHexDecode': ASCIIHexDecoder,
+    '/AHx': ASCIIHexDecoder,
+    '/ASCII85Decode': ASCII85Decoder,
+    '/A85': ASCII85Decoder,
+    '/LZWDecode': LZWDecoder,
+    '/LZW': LZWDecoder,
+    '/RunLengthDecode': RunLengthDecoder,
+    '/R': RunLengthDecoder,
+}
+
+
+def Pipe(decoder, chunks):
+    for chunk in chunks:
+        for output in decoder.Decode(chunk):
+            yield output
+    for output in decoder.Flush():
+        yield output
+
+
+def TimedPipe(name, decoder, chunks):
+    """
+    TimedPipe is Pipe that adds the time spent in the decoder, without the time of the other filters, to the timer
+    'decode <name>' of the active statistics.
+    """
+    seconds = 0.0
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is None:
+            outputs = decoder.Flush()
         else:
-            if code < len(self.table):
-                x = self.table[code]
-                self.table.append(self.prevbuf+x[0])
-            else:
-                self.table.append(self.prevbuf+self.prevbuf[0])
-                x = self.table[code]
-            l = len(self.table)
-            if l == 511:
-                self.nbits = 10
-            elif l == 1023:
-                self.nbits = 11
-            elif l == 2047:
-                self.nbits = 12
-            self.prevbuf = x
-        return x
-
-    def run(self):
-        while 1:
-            try:
-                code = self.readbits(self.nbits)
-            except EOFError:
+            outputs = decoder.Decode(chunk)
+        while True:
+            start = time.perf_counter()
+            output = next(outputs, None)
+            seconds += time.perf_counter() - start
+            if output == None:
                 break
-            x = self.feed(code)
-            yield x
-        return
+            yield output
+    if stats.collector != None:
+        stats.collector.AddTime('decode %s' % name, seconds)
+
+
+def DecodeChunks(chunks, filters, chunkSize=CHUNK_SIZE):
+    """
+    DecodeChunks decodes data given as an iterable of chunks with the filters (canonical names) in turn, and returns
+    an iterator over the decoded chunks. Every filter works on one chunk at a time, so that memory is bounded by the
+    chunk size instead of by the size of the data.
+    """
+    for filter in filters:
+        if filter not in DECODERS:
+            raise Exception('Unsupported filter: %s' % filter)
+        if stats.collector != None:
+            chunks = TimedPipe(filter, DECODERS[filter](chunkSize), chunks)
+        else:
+            chunks = Pipe(DECODERS[filter](chunkSize), chunks)
+    return chunks
 
-####
 
-def LZWDecode(data):
-    return ''.join(LZWDecoder(StringIO(data)).run())
+def Chunks(data, chunkSize=CHUNK_SIZE):
+    """
+    Chunks yields data in slices of chunkSize bytes, encoding str as Latin-1 one slice at a time.
+    """
+    for start in range(0, len(data), chunkSize):
+        yield AsBytes(data[start:start + chunkSize])
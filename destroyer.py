@@ -1,9 +1,20 @@
 
+import array
+import collections
+import concurrent.futures
+import cProfile
+import io
+import os
+import queue
+import threading
+import time
+import graph
 import parser
 import write
 import pdf_objects
+import xref
+import stats
 import sys
-from io import StringIO
 import re
 
 CHAR_WHITESPACE = 1
@@ -17,13 +28,22 @@ PDF_ELEMENT_TRAILER = 4
 PDF_ELEMENT_STARTXREF = 5
 PDF_ELEMENT_MALFORMED = 6
 
-#Convert 2 String If Python 3
-def C2SIP3(bytes):
-    if sys.version_info[0] > 2:
-        return ''.join([chr(byte) for byte in bytes])
-    else:
-        return bytes
-
+OUTPUT_FILE = 'font-output.pdf'
+TO_UNICODE_ID = 524
+COPY_CHUNK_SIZE = 1024 * 1024
+# objects of these types are always re-serialized from their tokens, all others can be copied from the input
+REWRITTEN_TYPES = ('/Font', '/Catalog')
+# with worker processes, each worker gets about this many chunks of the document, and chunks are at least and at
+# most this large
+CHUNKS_PER_WORKER = 4
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+# the chunks per worker that WriteElementsParallel submits ahead of the one it appends
+FUTURES_PER_WORKER = 2
+# in pipelined mode, the stages are connected by queues of this many items, and the transform stage serializes
+# batches of about this many bytes
+PIPELINE_QUEUE_SIZE = 64
+PIPELINE_BATCH_SIZE = 64 * 1024
 
 class FontDestroyer:
     """
@@ -35,17 +55,73 @@ class FontDestroyer:
         __init__ constructs the necessary attributes for a new FontDestroyer.
         """
         self.print = options.print
+        self.xref = getattr(options, 'xref', False)
+        self.compress = getattr(options, 'compress', False)
+        self.incremental = getattr(options, 'incremental', False)
+        self.passthrough = not getattr(options, 'reserialize', False)
+        self.workers = getattr(options, 'workers', None) or 1
+        self.pipeline = getattr(options, 'pipeline', False)
+        self.gc = getattr(options, 'gc', False)
+        self.stats = getattr(options, 'stats', None)
+        self.profile = getattr(options, 'profile', None)
+        self.options = options
+        # statsHook, when set, is called with the document and its stats.Statistics after each document, and
+        # statistics keeps the collector of the last document
+        self.statsHook = None
+        self.statistics = None
 
     @staticmethod
-    def FormatFont(obj):
-        # Add /ToUnicode 524 0 R
-        emptyToUnicode = [(CHAR_REGULAR, '/ToUnicode'), (CHAR_WHITESPACE, ' '), (CHAR_REGULAR, '524'), (CHAR_WHITESPACE, ' '), (CHAR_REGULAR, '0'), \
+    def FormatFont(obj, toUnicodeId=TO_UNICODE_ID):
+        # Add /ToUnicode <toUnicodeId> 0 R
+        emptyToUnicode = [(CHAR_REGULAR, '/ToUnicode'), (CHAR_WHITESPACE, ' '), (CHAR_REGULAR, str(toUnicodeId)), (CHAR_WHITESPACE, ' '), (CHAR_REGULAR, '0'), \
             (CHAR_WHITESPACE, ' '), (CHAR_REGULAR, 'R'), (CHAR_WHITESPACE, ' ')]
         for token in emptyToUnicode:
             obj.content.insert(len(obj.content) - 2, token)
+        if stats.collector != None:
+            stats.collector.Count('fonts rewritten')
 
         return FontDestroyer.FormatOutput(obj.content, True)
 
+    @staticmethod
+    def ToUnicodePosition(obj):
+        """
+        ToUnicodePosition returns the offset in the document of the >> before which FormatFont inserts /ToUnicode, for
+        a lazy font without a stream that was not tokenized, or None when the font has to be tokenized to find it. Like
+        the tokenizer, it reads >> pairs from the start of a run of > and stops at a comment on the last line.
+        """
+        if not isinstance(obj, pdf_objects.LazyIndirectObject) or obj.IsMaterialized() or obj.dictionaryEnd != obj.end:
+            return None
+        data = obj.document.data
+        # the content has to end with >> and a whitespace token, the last two tokens that FormatFont inserts before
+        end = obj.end
+        while end > obj.start and data[end - 1] in parser.WHITESPACE_BYTES:
+            end -= 1
+        if end == obj.end:
+            return None
+        start = end
+        while start > obj.start and data[start - 1] == 0x3E:
+            start -= 1
+        if end - start < 2 or (end - start) % 2 != 0:
+            return None
+        line = max(data.rfind(b'\n', obj.start, end), data.rfind(b'\r', obj.start, end), obj.start)
+        if data.find(b'%', line, end) != -1:
+            return None
+        return end - 2
+
+    @staticmethod
+    def WriteFont(writer, obj, toUnicodeId=TO_UNICODE_ID):
+        """
+        WriteFont writes a font with /ToUnicode added like FormatFont. When ToUnicodePosition finds where to add it,
+        the font is copied from the input around the addition instead of being tokenized.
+        """
+        position = FontDestroyer.ToUnicodePosition(obj)
+        if position == None:
+            writer.writeObject(obj)
+            return
+        writer.spliceObject(obj, position, '/ToUnicode %d 0 R ' % toUnicodeId)
+        if stats.collector != None:
+            stats.collector.Count('fonts rewritten')
+
     @staticmethod
     def FormatObject(obj):
         if obj.GetType() == "/Font":
@@ -56,7 +132,9 @@ class FontDestroyer:
     @staticmethod
     def FormatOutput(data, raw):
         if raw:
-            if type(data) == type([]):
+            if isinstance(data, pdf_objects.TokenList):
+                return ''.join(data.values)
+            elif type(data) == type([]):
                 return ''.join(map(lambda x: x[1], data))
             else:
                 return data
@@ -65,87 +143,506 @@ class FontDestroyer:
         else:
             return repr(data)
 
-    def UpdatePDF(self, document):
-        """pdf-parser, use it to parse a PDF document
+    @staticmethod
+    def LinearElements(oPDFParser):
         """
-        oPDFParser = parser.Parser(document)
-        writer = write.Writer("font-output.pdf", FontDestroyer.FormatObject)
-        rootId = None
-        rootVersion = None
+        LinearElements yields every element of the document, scanning it from front to back.
+        """
+        object = oPDFParser.GetObject()
+        while object != None:
+            yield object
+            object = oPDFParser.GetObject()
 
-        oPDFParserOBJSTM = None
-        while True:
-            if oPDFParserOBJSTM == None:
-                object = oPDFParser.GetObject()
-            else:
-                object = oPDFParserOBJSTM.GetObject()
-                if object == None:
-                    oPDFParserOBJSTM = None
-                    object = oPDFParser.GetObject()
+    @staticmethod
+    def XrefElements(oPDFParser, oCrossReference):
+        """
+        XrefElements yields the header comments of the document followed by the objects listed in its
+        cross-reference sections in file order. The objects are delimited from their offsets without being tokenized,
+        and only their /Type is read, so that only the catalog, the fonts and the object streams are tokenized when
+        they are written, and every other object is copied by its range.
+        """
+        oPDFParser.Seek(0)
+        object = oPDFParser.GetObject()
+        while object != None and object.type == PDF_ELEMENT_COMMENT:
+            yield object
+            object = oPDFParser.GetObject()
+        for object in oCrossReference.InUseObjects():
+            yield object
 
-            if object == None:
-                break
-            
-            if object.GetType() == '/ObjStm' and object.ContainsStream():
-                # parsing objects inside an /ObjStm object by extracting & parsing the stream content to create a synthesized PDF document, that is then itself parsed
-                oPDFParseDictionary = pdf_objects.ParseDictionary(object.ContainsStream(), False)
-                numberOfObjects = int(oPDFParseDictionary.Get('/N')[0])
-                offsetFirstObject = int(oPDFParseDictionary.Get('/First')[0])
-                indexes = list(map(int, C2SIP3(object.Stream())[:offsetFirstObject].strip().split(' ')))
-                if len(indexes) % 2 != 0 or len(indexes) / 2 != numberOfObjects:
-                    raise Exception('Error in index of /ObjStm stream')
-                streamObject = C2SIP3(object.Stream()[offsetFirstObject:])
-                synthesizedPDF = ''
-                while len(indexes) > 0:
-                    objectNumber = indexes[0]
-                    offset = indexes[1]
-                    indexes = indexes[2:]
-                    if len(indexes) >= 2:
-                        offsetNextObject = indexes[1]
-                    else:
-                        offsetNextObject = len(streamObject)
-                    synthesizedPDF += '%d 0 obj\n%s\nendobj\n' % (objectNumber, streamObject[offset:offsetNextObject])
-                oPDFParserOBJSTM = parser.Parser(StringIO(synthesizedPDF), (object.id, object.version))
-
-
-            # Handle writing to PDF file
-            if object.type == PDF_ELEMENT_COMMENT:
-                writer.writeComment(object)
-
-            # If we see a trailer object, try to get the root value from it. If that fails for some reason, stick with
-            # the root value pulled from the catalog object
-            elif object.type == PDF_ELEMENT_TRAILER:
-                oPDFParseDictionary = pdf_objects.ParseDictionary(object.content[1:], False)
-                result = oPDFParseDictionary.Get('/Root')
-                if result != None and len(result) > 1:
-                    try:
-                        objectId = int(result[0])
-                        objectVersion = int(result[1])
-                        rootId = objectId
-                        rootVersion = objectVersion
-                        # print("Got root from trailer")
-                    except ValueError:
-                        pass
-            
-            elif object.type == PDF_ELEMENT_INDIRECT_OBJECT:
-                writer.writeObject(object)
+    def UpdatePDFIncremental(self, oPDFParser, oCrossReference, output=OUTPUT_FILE):
+        """
+        UpdatePDFIncremental copies the document unchanged and appends an incremental update holding only the
+        rewritten fonts, the empty ToUnicode object, a cross-reference section and a trailer pointing back to the
+        original one with /Prev.
+        """
+        root = xref.Integers(oCrossReference.trailer.Get('/Root'))
+        if len(root) < 2:
+            print('ERROR: Failed to find document catalog')
+            return False
 
-            # Search for document catalog to use as root reference
-            if object.GetType() == "/Catalog":
-                # print("Found object catalog: %d %d R" % (object.id, object.version))
-                rootId = object.id
-                rootVersion = object.version
+        toUnicodeId = len(oCrossReference)
+        writer = write.Writer(output, lambda obj: FontDestroyer.FormatFont(obj, toUnicodeId), compress=self.compress or oCrossReference.xrefStream)
+        writer.size = toUnicodeId + 1
+        document = oPDFParser.tokenizer.pdf
+        for start in range(0, document.size, COPY_CHUNK_SIZE):
+            chunk = document.data[start:start + COPY_CHUNK_SIZE]
+            if start == 0 and writer.compress:
+                chunk = write.UpgradeHeader(chunk)
+            writer.appendBinary(chunk)
+        if document.size > 0 and document.data[document.size - 1] not in (10, 13):
+            writer.appendString("\n")
 
+        for object in oCrossReference.Objects():
+            FontDestroyer.CountObject(object)
+            if object.GetType() == '/Font':
+                FontDestroyer.WriteFont(writer, object, toUnicodeId)
             if self.print:
                 object.Print()
-            
+
+        with open('EmptyToUnicode.txt', 'r') as f:
+            writer.writeIndirectObject(toUnicodeId, 0, f.read())
+
+        info = xref.Integers(oCrossReference.trailer.Get('/Info'))
+        documentId = oCrossReference.trailer.Get('/ID')
+        writer.writeUpdateXrefAndTrailer('%d %d R' % (root[0], root[1]), oCrossReference.startxref, \
+            '%d %d R' % (info[0], info[1]) if len(info) > 1 else None, ''.join(documentId).strip() if documentId else None)
+        FontDestroyer.CloseWriter(writer)
+        return True
+
+    @staticmethod
+    def ExpandObjectStreams(elements, objectStreams=None):
+        """
+        ExpandObjectStreams yields the given elements, following each /ObjStm object by the objects it holds. When
+        objectStreams is a list, the numbers of the objects of each /ObjStm object are appended to it as a list.
+        """
+        for object in elements:
+            yield object
+            if object.GetType() == '/ObjStm':
+                # the objects inside an /ObjStm object are cut out of its stream as it is decoded chunk by chunk
+                numbers = []
+                for objectStreamObject in pdf_objects.ObjectStream.StreamObjects(object):
+                    numbers.append(objectStreamObject.id)
+                    yield objectStreamObject
+                if objectStreams != None:
+                    objectStreams.append(numbers)
+                if stats.collector != None and len(numbers) > 0:
+                    stats.collector.Count('object streams expanded')
+                    stats.collector.Count('objects from object streams', len(numbers))
+
+    @staticmethod
+    def LiveElements(elements, oGraph, objectStreams):
+        """
+        LiveElements yields the given elements and the objects of their object streams, leaving out the indirect
+        objects that a later revision of the same number supersedes, those not reachable from the /Root and /Info of
+        oGraph, and the /ObjStm and /XRef streams, which are never reachable. oGraph and objectStreams must come from
+        ExpandObjectStreams over the same elements, so that the objects left out of object streams are not parsed and
+        object streams holding no live object are not decoded.
+        """
+        live = oGraph.Reachable(oGraph.Roots())
+        seen = array.array('l', [0]) * oGraph.size
+        objectStreams = iter(objectStreams)
+
+        def Keep(number):
+            if number >= oGraph.size:
+                return False
+            seen[number] += 1
+            if seen[number] < oGraph.Revisions(number):
+                if stats.collector != None:
+                    stats.collector.Count('objects collected (superseded)')
+                return False
+            if not live[number]:
+                if stats.collector != None:
+                    stats.collector.Count('objects collected (unreachable)')
+                return False
+            return True
+
+        for object in elements:
+            if object.type != PDF_ELEMENT_INDIRECT_OBJECT:
+                yield object
+                continue
+            if object.GetType() != '/ObjStm':
+                if Keep(object.id):
+                    yield object
+            else:
+                # the object stream itself is dropped, its objects are yielded in its place
+                Keep(object.id)
+                keep = [Keep(number) for number in next(objectStreams)]
+                if True not in keep:
+                    if stats.collector != None:
+                        stats.collector.Count('object streams collected')
+                    continue
+                for objectStreamObject in pdf_objects.ObjectStream.StreamObjects(object, wanted=keep):
+                    yield objectStreamObject
+
+    @staticmethod
+    def CountObject(object):
+        """
+        CountObject counts an indirect object by type in the active statistics.
+        """
+        if stats.collector != None and object.type == PDF_ELEMENT_INDIRECT_OBJECT:
+            stats.collector.Count('objects %s' % (pdf_objects.Canonicalize(object.GetType()) or '(no type)'))
+
+    @staticmethod
+    def CloseWriter(writer):
+        """
+        CloseWriter closes the writer of the output document, counting the bytes written in the active statistics.
+        """
+        if stats.collector != None:
+            stats.collector.Count('bytes written', writer.filesize())
+        writer.close()
+
+    def WriteElement(self, writer, object):
+        """
+        WriteElement writes one element of the document with the given writer. It returns the root reference named
+        by the element as (id, version), or None.
+        """
+        root = None
+
+        # Handle writing to PDF file
+        if object.type == PDF_ELEMENT_COMMENT:
+            writer.writeComment(object)
+
+        # If we see a trailer object, try to get the root value from it. If that fails for some reason, stick with
+        # the root value pulled from the catalog object
+        elif object.type == PDF_ELEMENT_TRAILER:
+            oPDFParseDictionary = pdf_objects.ParseDictionary(object.content[1:], False)
+            result = oPDFParseDictionary.Get('/Root')
+            if result != None and len(result) > 1:
+                try:
+                    root = (int(result[0]), int(result[1]))
+                except ValueError:
+                    pass
+
+        elif object.type == PDF_ELEMENT_INDIRECT_OBJECT:
+            FontDestroyer.CountObject(object)
+            if self.passthrough and object.GetType() not in REWRITTEN_TYPES:
+                writer.copyObject(object)
+            elif object.GetType() == '/Font':
+                FontDestroyer.WriteFont(writer, object)
+            else:
+                writer.writeObject(object)
+
+        # Search for document catalog to use as root reference
+        if object.GetType() == "/Catalog":
+            root = (object.id, object.version)
+
+        if self.print:
+            object.Print()
+
+        return root
+
+    def SerializeElements(self, elements):
+        """
+        SerializeElements writes the given elements and the objects of their object streams into memory. It returns
+        the bytes written with the offsets, compressed objects and generations recorded by the writer, in the order of
+        the arguments of Writer.writeSerializedObjects, and the last root reference found.
+        """
+        outfile = io.BytesIO()
+        writer = write.Writer(outfile, FontDestroyer.FormatObject, compress=self.compress)
+        root = None
+        for object in FontDestroyer.ExpandObjectStreams(elements):
+            root = self.WriteElement(writer, object) or root
+        writer.close()
+        return (outfile.getvalue(), writer.indirectObjects, writer.compressedObjects, writer.generations, root)
+
+    def WriteElementsPipelined(self, writer, elements):
+        """
+        WriteElementsPipelined writes the elements like WriteElement, in three stages connected by bounded queues: a
+        thread parses the elements, a second thread expands object streams and serializes batches of elements into
+        memory, and the calling thread appends the batches with the writer. Large lazy objects skip the transform
+        stage, so that the writer can still copy them with copyRange. It returns the last root reference found.
+        """
+        parsed = queue.Queue(PIPELINE_QUEUE_SIZE)
+        transformed = queue.Queue(PIPELINE_QUEUE_SIZE)
+        end = object()
+        errors = []
+
+        # after an error every stage keeps consuming its input until the end marker, so that no stage blocks on a
+        # full queue
+        def Parse():
+            try:
+                for element in elements:
+                    if errors != []:
+                        break
+                    parsed.put(element)
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                parsed.put(end)
+
+        def Transform():
+            batch = []
+            batchBytes = 0
+            try:
+                element = parsed.get()
+                while element is not end:
+                    if errors == []:
+                        if isinstance(element, pdf_objects.LazyIndirectObject):
+                            size = element.end - element.start
+                        else:
+                            size = 0
+                        if size >= write.COPY_RANGE_THRESHOLD:
+                            if batch != []:
+                                transformed.put(self.SerializeElements(batch))
+                                batch = []
+                                batchBytes = 0
+                            transformed.put(element)
+                        else:
+                            batch.append(element)
+                            batchBytes += size
+                            if batchBytes >= PIPELINE_BATCH_SIZE:
+                                transformed.put(self.SerializeElements(batch))
+                                batch = []
+                                batchBytes = 0
+                    element = parsed.get()
+                if batch != [] and errors == []:
+                    transformed.put(self.SerializeElements(batch))
+            except BaseException as e:
+                errors.append(e)
+                while element is not end:
+                    element = parsed.get()
+            finally:
+                transformed.put(end)
+
+        threads = [threading.Thread(target=Parse), threading.Thread(target=Transform)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        root = None
+        try:
+            item = transformed.get()
+            while item is not end:
+                if errors == []:
+                    if type(item) == tuple:
+                        data, indirectObjects, compressedObjects, generations, batchRoot = item
+                        writer.writeSerializedObjects(data, indirectObjects, compressedObjects, generations)
+                        root = batchRoot or root
+                    else:
+                        for element in FontDestroyer.ExpandObjectStreams([item]):
+                            root = self.WriteElement(writer, element) or root
+                item = transformed.get()
+        except BaseException as e:
+            errors.append(e)
+            while item is not end:
+                item = transformed.get()
+        for thread in threads:
+            thread.join()
+        if errors != []:
+            raise errors[0]
+        return root
+
+    def WriteElementsParallel(self, writer, path, size, elements):
+        """
+        WriteElementsParallel writes the elements like WriteElement, but hands runs of consecutive lazy objects to
+        self.workers worker processes. The workers map the document at path themselves, rebuild the objects from the
+        same spans the parser found, tokenize, expand and serialize them, and return the serialized bytes, which are
+        appended in document order so that offsets are assigned exactly as in a sequential run. Large objects, and
+        objects whose tokens were already built, are written by the calling process. At most
+        FUTURES_PER_WORKER chunks per worker are in flight, so that the serialized chunks waiting to be appended stay
+        bounded. It returns the last root reference found.
+        """
+        chunkSize = min(MAX_CHUNK_SIZE, max(MIN_CHUNK_SIZE, size // (self.workers * CHUNKS_PER_WORKER)))
+        maxFutures = FUTURES_PER_WORKER * self.workers
+        root = None
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            # futures for chunks of lazy objects and the other elements, in document order
+            items = collections.deque()
+            futures = 0
+
+            def WriteItem(item):
+                if isinstance(item, concurrent.futures.Future):
+                    data, indirectObjects, compressedObjects, generations, chunkRoot, snapshot = item.result()
+                    writer.writeSerializedObjects(data, indirectObjects, compressedObjects, generations)
+                    if snapshot != None and stats.collector != None:
+                        stats.collector.Merge(snapshot)
+                    return chunkRoot
+                itemRoot = None
+                for object in FontDestroyer.ExpandObjectStreams([item]):
+                    itemRoot = self.WriteElement(writer, object) or itemRoot
+                return itemRoot
+
+            spans = []
+            spanBytes = 0
+            for object in elements:
+                # large objects are copied by the writer with copyRange, like in a sequential run, and the tokens of a
+                # materialized object are written as they are
+                if isinstance(object, pdf_objects.LazyIndirectObject) and not object.IsMaterialized() and object.end - object.start < write.COPY_RANGE_THRESHOLD:
+                    spans.append((object.id, object.version, object.start, object.dictionaryEnd, object.end, object.objectType, object.objstm))
+                    spanBytes += object.end - object.start
+                    if spanBytes < chunkSize:
+                        continue
+                    object = None
+                if spans != []:
+                    items.append(executor.submit(WriteObjects, self.options, path, spans))
+                    futures += 1
+                    spans = []
+                    spanBytes = 0
+                if object != None:
+                    items.append(object)
+                # the items are appended as soon as they are ready, and the oldest chunk is waited for when too many
+                # are in flight
+                while items and (futures > maxFutures or not isinstance(items[0], concurrent.futures.Future) or items[0].done()):
+                    item = items.popleft()
+                    if isinstance(item, concurrent.futures.Future):
+                        futures -= 1
+                    root = WriteItem(item) or root
+            if spans != []:
+                items.append(executor.submit(WriteObjects, self.options, path, spans))
+
+            while items:
+                root = WriteItem(items.popleft()) or root
+        return root
+
+    def UpdatePDF(self, document, output=OUTPUT_FILE):
+        """pdf-parser, use it to parse a PDF document and write the result to output. Returns False when the
+        document catalog could not be found. With the stats option or a statsHook, counters and timers are collected
+        while the document is processed, and with the profile option a cProfile of the run is saved.
+        """
+        if not self.stats and self.statsHook == None and self.profile == None:
+            return self.RewritePDF(document, output)
+
+        collector = None
+        if self.stats or self.statsHook != None:
+            collector = stats.Start()
+        oProfile = None
+        if self.profile != None:
+            oProfile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            if oProfile != None:
+                result = oProfile.runcall(self.RewritePDF, document, output)
+            else:
+                result = self.RewritePDF(document, output)
+        finally:
+            stats.Stop()
+            if oProfile != None:
+                oProfile.dump_stats(self.ProfilePath(document))
+        if collector == None:
+            return result
+
+        collector.AddTime('total', time.perf_counter() - start)
+        self.statistics = collector
+        if self.statsHook != None:
+            self.statsHook(document, collector)
+        name = document if type(document) == str else getattr(document, 'name', '<document>')
+        if self.stats == 'json':
+            print(collector.JSONLine(name))
+        elif self.stats:
+            print(collector.Summary(name))
+        return result
+
+    def ProfilePath(self, document):
+        """
+        ProfilePath returns a new .pstats file in the profile directory, named after the document.
+        """
+        if not os.path.isdir(self.profile):
+            os.makedirs(self.profile)
+        if type(document) == str:
+            name = os.path.splitext(os.path.basename(document))[0]
+        else:
+            name = 'document'
+        path = os.path.join(self.profile, name + '.pstats')
+        counter = 1
+        while os.path.exists(path):
+            path = os.path.join(self.profile, '%s-%d.pstats' % (name, counter))
+            counter += 1
+        return path
+
+    def ElementSource(self, oPDFParser, useXref):
+        """
+        ElementSource returns the elements of the document from its start, through the cross-reference sections when
+        useXref is set and they can be read, with the root reference named by their trailer as (id, version) or None,
+        and that trailer as a ParseDictionary, None when the cross-reference sections are not used.
+        """
+        oPDFParser.Seek(0)
+        if useXref:
+            try:
+                oCrossReference = xref.CrossReference(oPDFParser)
+                root = xref.Integers(oCrossReference.trailer.Get('/Root'))
+                return (FontDestroyer.XrefElements(oPDFParser, oCrossReference), tuple(root[:2]) if len(root) > 1 else None, oCrossReference.trailer)
+            except Exception as e:
+                print('Unable to use the cross-reference sections, scanning the whole file: %s' % e)
+                oPDFParser.Seek(0)
+        return (FontDestroyer.LinearElements(oPDFParser), None, None)
+
+    def RewritePDF(self, document, output=OUTPUT_FILE):
+        """
+        RewritePDF does the work of UpdatePDF.
+        """
+        oPDFParser = parser.Parser(document, lazy=True)
+        if stats.collector != None:
+            stats.collector.Count('bytes read', oPDFParser.tokenizer.pdf.size)
+        if self.incremental:
+            try:
+                oCrossReference = xref.CrossReference(oPDFParser)
+            except Exception as e:
+                print('Unable to use the cross-reference sections, rewriting the whole file: %s' % e)
+                oPDFParser.Seek(0)
+            else:
+                return self.UpdatePDFIncremental(oPDFParser, oCrossReference, output)
+
+        writer = write.Writer(output, FontDestroyer.FormatObject, compress=self.compress)
+        rootId = None
+        rootVersion = None
+
+        elements, root, trailer = self.ElementSource(oPDFParser, self.xref)
+        if root != None:
+            rootId, rootVersion = root
+        info = None
+        if self.gc:
+            objectStreams = []
+            oGraph = graph.BuildGraph(FontDestroyer.ExpandObjectStreams(elements, objectStreams))
+            # XrefElements yields no trailers, the merged trailer of the cross-reference sections names /Root and /Info
+            if trailer != None:
+                oGraph.AddTrailer(trailer)
+            elements, root, trailer = self.ElementSource(oPDFParser, trailer != None)
+            if oGraph.root == None or not oGraph.Contains(oGraph.root):
+                print('Unable to find the document catalog through the trailer, writing every object')
+            else:
+                elements = FontDestroyer.LiveElements(elements, oGraph, objectStreams)
+                if oGraph.Contains(oGraph.info):
+                    info = '%d %d R' % (oGraph.info, oGraph.infoVersion)
+
+        if self.workers > 1 and type(document) == str and not self.print:
+            root = self.WriteElementsParallel(writer, document, oPDFParser.tokenizer.pdf.size, elements)
+        elif self.pipeline and not self.print:
+            root = self.WriteElementsPipelined(writer, elements)
+        else:
+            root = None
+            for object in FontDestroyer.ExpandObjectStreams(elements):
+                root = self.WriteElement(writer, object) or root
+        if root != None:
+            rootId, rootVersion = root
 
         if rootId == None or rootVersion == None:
             print('ERROR: Failed to find document catalog')
-            return
+            FontDestroyer.CloseWriter(writer)
+            return False
 
         with open('EmptyToUnicode.txt', 'r') as f:
             emptyToUnicode = f.read()
-            writer.writeIndirectObject(524, 0, emptyToUnicode)
+            writer.writeIndirectObject(TO_UNICODE_ID, 0, emptyToUnicode)
             
-        writer.writeXrefAndTrailer(rootId, rootVersion)
+        writer.writeXrefAndTrailer(rootId, rootVersion, info)
+        FontDestroyer.CloseWriter(writer)
+        return True
+
+
+def WriteObjects(options, path, spans):
+    """
+    WriteObjects runs in a worker process of FontDestroyer.WriteElementsParallel. It rebuilds the lazy objects at the
+    given spans of the document at path, writes them and the objects of their object streams into memory, and returns
+    the bytes written with the offsets, compressed objects and generations recorded by the writer, the last root
+    reference found and, with the stats option, a snapshot of the statistics collected in the worker.
+    """
+    document = parser.Document(path)
+    objects = (pdf_objects.LazyIndirectObject(id, version, document, start, dictionaryEnd, end, type, objstm) for id, version, start, dictionaryEnd, end, type, objstm in spans)
+    oFontDestroyer = FontDestroyer(options)
+    if oFontDestroyer.stats:
+        stats.Start()
+    try:
+        result = oFontDestroyer.SerializeElements(objects)
+    finally:
+        collector = stats.Stop()
+    return result + ((collector.Snapshot() if collector != None else None),)
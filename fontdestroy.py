@@ -2,6 +2,7 @@ import optparse
 import os
 import sys
 
+import batch
 import destroyer
 
 __description__ = 'fontdestroy makes all fonts in a PDF document non-extractable'
@@ -17,10 +18,29 @@ def GetArguments():
 def Main():
     """Main handles reading flags/arguments from the command line, and passes those to the destroyer."""
 
-    oParser = optparse.OptionParser(usage='usage: %prog [options] pdf-file\n' + __description__, version='%prog ' + __version__)
+    oParser = optparse.OptionParser(usage='usage: %prog [options] pdf-file\n       %prog [options] -o output-dir [pdf-file|directory|glob ...]\n' + __description__, version='%prog ' + __version__)
     oParser.add_option('-p', '--print', action='store_true', default=False, help='print each object found in the PDF')
+    oParser.add_option('-c', '--compress', action='store_true', default=False, help='pack objects into object streams and write a cross-reference stream')
+    oParser.add_option('-i', '--incremental', action='store_true', default=False, help='append the rewritten fonts to a copy of the PDF as an incremental update')
+    oParser.add_option('-r', '--reserialize', action='store_true', default=False, help='re-serialize every object from its tokens instead of copying unchanged objects from the input')
+    oParser.add_option('-x', '--xref', action='store_true', default=False, help='locate objects through the cross-reference sections instead of scanning the whole file')
+    oParser.add_option('-g', '--gc', action='store_true', default=False, help='write only the latest revision of the objects reachable from the /Root and /Info of the trailer')
+    oParser.add_option('-t', '--pipeline', action='store_true', default=False, help='parse, transform and write in separate threads connected by bounded queues')
+    oParser.add_option('-w', '--workers', type='int', default=1, help='split each document into chunks of objects that are parsed and serialized by this many worker processes')
+    oParser.add_option('-s', '--stats', action='store_const', const='summary', default=None, help='print counters and timers for each document')
+    oParser.add_option('--stats-json', action='store_const', const='json', dest='stats', help='print counters and timers for each document as one line of JSON')
+    oParser.add_option('--profile', type='string', default=None, help='save a cProfile of each document as a .pstats file in this directory')
+    oParser.add_option('-o', '--output-dir', type='string', default=None, help='batch mode: process every given PDF, directory and glob, writing the results to this directory')
+    oParser.add_option('-l', '--file-list', type='string', default=None, help='batch mode: also process the PDFs listed in this file, one per line (- for stdin)')
+    oParser.add_option('-j', '--jobs', type='int', default=None, help='batch mode: number of worker processes (default: number of CPUs)')
     (options, args) = oParser.parse_args(GetArguments())
 
+    if options.output_dir != None:
+        documents = batch.FindDocuments(args, options.file_list)
+        if batch.Run(options, documents, options.output_dir, options.jobs) > 0:
+            sys.exit(1)
+        return
+
     if len(args) != 1:
         oParser.print_help()
         print('')
@@ -0,0 +1,319 @@
+import base64
+import binascii
+import optparse
+import random
+import zlib
+
+__description__ = 'generate writes synthetic PDF documents of configurable size and structure, for stress tests'
+
+FILTERS = {
+    'none': None,
+    'flate': '/FlateDecode',
+    'lzw': '/LZWDecode',
+    'ascii85': '/ASCII85Decode',
+    'asciihex': '/ASCIIHexDecode',
+    'runlength': '/RunLengthDecode',
+}
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do', 'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua']
+BASE_FONTS = ['/Helvetica', '/Times-Roman', '/Courier', '/Helvetica-Bold', '/Times-Bold', '/Courier-Oblique']
+LZW_CLEAR = 256
+LZW_END = 257
+LZW_MAX_ENTRIES = 4000
+LZW_MAX_TABLE = 4096
+
+
+def LZWEncode(data, clear=True):
+    """
+    LZWEncode compresses data with the LZW variant of PDF (8-bit input, early change), clearing the table before it
+    is full, or with clear False, keeping the full table and writing 12-bit codes until the end.
+    """
+    output = bytearray()
+    buffer = 0
+    bufferBits = 0
+    # the decoder adds a table entry for every code but the first after a clear code, one code behind the encoder,
+    # and widens its codes when its own table reaches 511, 1023 and 2047 entries
+    decoderEntries = 258
+    first = True
+    table = None
+    entries = 0
+
+    def Emit(code):
+        nonlocal buffer, bufferBits, decoderEntries, first
+        if decoderEntries < 511:
+            width = 9
+        elif decoderEntries < 1023:
+            width = 10
+        elif decoderEntries < 2047:
+            width = 11
+        else:
+            width = 12
+        buffer = (buffer << width) | code
+        bufferBits += width
+        while bufferBits >= 8:
+            bufferBits -= 8
+            output.append((buffer >> bufferBits) & 0xFF)
+        buffer &= (1 << bufferBits) - 1
+        if code == LZW_CLEAR:
+            decoderEntries = 258
+            first = True
+        elif first:
+            first = False
+        else:
+            decoderEntries += 1
+
+    def Clear():
+        nonlocal table, entries
+        Emit(LZW_CLEAR)
+        table = dict((bytes([i]), i) for i in range(256))
+        entries = 258
+
+    Clear()
+    word = b''
+    for i in range(len(data)):
+        extended = data[i:i + 1] if word == b'' else word + data[i:i + 1]
+        if extended in table:
+            word = extended
+            continue
+        Emit(table[word])
+        if entries < LZW_MAX_TABLE:
+            table[extended] = entries
+            entries += 1
+        if clear and entries >= LZW_MAX_ENTRIES:
+            Clear()
+        word = data[i:i + 1]
+    if word != b'':
+        Emit(table[word])
+    Emit(LZW_END)
+    if bufferBits > 0:
+        output.append((buffer << (8 - bufferBits)) & 0xFF)
+    return bytes(output)
+
+
+def RunLengthEncode(data):
+    """
+    RunLengthEncode compresses data with the PackBits scheme of the RunLengthDecode filter.
+    """
+    output = bytearray()
+    i = 0
+    while i < len(data):
+        run = 1
+        while i + run < len(data) and run < 128 and data[i + run] == data[i]:
+            run += 1
+        if run > 1:
+            output.append(257 - run)
+            output.append(data[i])
+            i += run
+            continue
+        start = i
+        i += 1
+        while i < len(data) and i - start < 128 and (i + 1 >= len(data) or data[i + 1] != data[i]):
+            i += 1
+        output.append(i - start - 1)
+        output += data[start:i]
+    output.append(128)
+    return bytes(output)
+
+
+def Encode(data, filter):
+    """
+    Encode returns data encoded with the named filter (a key of FILTERS).
+    """
+    if filter == 'flate':
+        return zlib.compress(data)
+    elif filter == 'lzw':
+        return LZWEncode(data)
+    elif filter == 'ascii85':
+        return base64.a85encode(data, wrapcol=72) + b'~>'
+    elif filter == 'asciihex':
+        return binascii.hexlify(data) + b'>'
+    elif filter == 'runlength':
+        return RunLengthEncode(data)
+    return data
+
+
+def ContentStream(oRandom, size, fonts):
+    """
+    ContentStream returns a page description of about size bytes that shows random words in the given fonts.
+    """
+    lines = [b'BT']
+    total = 2
+    y = 760
+    while total < size:
+        font = oRandom.randrange(fonts) + 1 if fonts > 0 else 0
+        words = ' '.join(oRandom.choice(WORDS) for i in range(oRandom.randrange(3, 12)))
+        if font > 0:
+            line = ('/F%d %d Tf 72 %d Td (%s) Tj' % (font, oRandom.choice([9, 10, 12]), y, words)).encode('latin-1')
+        else:
+            line = ('72 %d Td (%s) Tj' % (y, words)).encode('latin-1')
+        # runs of spaces give the RunLength filter something to compress
+        if oRandom.random() < 0.2:
+            line += b' ' * oRandom.randrange(4, 40)
+        lines.append(line)
+        total += len(line) + 1
+        y = y - 14 if y > 40 else 760
+    lines.append(b'ET')
+    return b'\n'.join(lines)
+
+
+class Generator:
+    """
+    Generator writes a PDF document object by object, keeping the offset of every object for the cross-reference
+    table, and the objects to be packed into object streams until the end.
+    """
+
+    def __init__(self, file, objectsPerStream=0):
+        self.outfile = open(file, 'wb')
+        self.offset = 0
+        self.offsets = {}
+        self.compressed = {}
+        self.pending = []
+        self.objectsPerStream = objectsPerStream
+        self.size = 1
+        if objectsPerStream > 0:
+            self.write(b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n')
+        else:
+            self.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def write(self, data):
+        self.outfile.write(data)
+        self.offset += len(data)
+
+    def reserve(self):
+        """
+        reserve returns a new object number.
+        """
+        number = self.size
+        self.size += 1
+        return number
+
+    def writeObject(self, number, dictionary):
+        if self.objectsPerStream > 0:
+            self.pending.append((number, dictionary.encode('latin-1')))
+            if len(self.pending) >= self.objectsPerStream:
+                self.writeObjectStream()
+            return
+        self.offsets[number] = self.offset
+        self.write(('%d 0 obj\n%s\nendobj\n' % (number, dictionary)).encode('latin-1'))
+
+    def writeStream(self, number, data, filter, dictionary=''):
+        encoded = Encode(data, filter)
+        if FILTERS[filter] != None:
+            dictionary += ' /Filter %s' % FILTERS[filter]
+        self.offsets[number] = self.offset
+        self.write(('%d 0 obj\n<< /Length %d%s >>\nstream\n' % (number, len(encoded), dictionary)).encode('latin-1'))
+        self.write(encoded)
+        self.write(b'\nendstream\nendobj\n')
+
+    def writeObjectStream(self):
+        if self.pending == []:
+            return
+        number = self.reserve()
+        header = []
+        body = []
+        position = 0
+        for index, (objectNumber, data) in enumerate(self.pending):
+            header.append('%d %d' % (objectNumber, position))
+            body.append(data)
+            position += len(data) + 1
+            self.compressed[objectNumber] = (number, index)
+        header = ' '.join(header).encode('latin-1') + b'\n'
+        data = header + b'\n'.join(body) + b'\n'
+        self.writeStream(number, data, 'flate', ' /Type /ObjStm /N %d /First %d' % (len(self.pending), len(header)))
+        self.pending = []
+
+    def close(self, root, info):
+        """
+        close writes the pending object stream, the cross-reference section (an xref stream when objects were packed
+        into object streams) and the trailer.
+        """
+        self.writeObjectStream()
+        if self.objectsPerStream > 0:
+            number = self.reserve()
+            self.offsets[number] = self.offset
+            rows = bytearray(b'\x00\x00\x00\x00\x00\xff\xff')
+            for i in range(1, self.size):
+                if i in self.offsets:
+                    rows += b'\x01' + self.offsets[i].to_bytes(4, 'big') + b'\x00\x00'
+                else:
+                    objstm, index = self.compressed[i]
+                    rows += b'\x02' + objstm.to_bytes(4, 'big') + index.to_bytes(2, 'big')
+            startxref = self.offset
+            self.writeStream(number, bytes(rows), 'flate', ' /Type /XRef /W [1 4 2] /Size %d /Root %d 0 R /Info %d 0 R' % (self.size, root, info))
+        else:
+            startxref = self.offset
+            lines = ['xref', '0 %d' % self.size, '0000000000 65535 f ']
+            for i in range(1, self.size):
+                lines.append('%010d 00000 n ' % self.offsets[i])
+            lines.append('trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\n' % (self.size, root, info))
+            self.write('\n'.join(lines).encode('latin-1'))
+        self.write(('startxref\n%d\n%%%%EOF\n' % startxref).encode('latin-1'))
+        self.outfile.close()
+
+
+def GeneratePDF(output, objects=1000, pages=10, fonts=10, streamSize=4096, filters=('flate',), objectsPerStream=0, widths=0, seed=0):
+    """
+    GeneratePDF writes a valid PDF document to output with the given number of pages, fonts (each with a /Widths
+    array of widths entries) and extra filler objects. Every page has a content stream of about streamSize bytes,
+    encoded with the filters in turn. With objectsPerStream, objects without a stream are packed that many to an
+    object stream. It returns the total number of objects.
+    """
+    oRandom = random.Random(seed)
+    oGenerator = Generator(output, objectsPerStream)
+    catalog = oGenerator.reserve()
+    pageTree = oGenerator.reserve()
+    info = oGenerator.reserve()
+    fontNumbers = [oGenerator.reserve() for i in range(fonts)]
+    pageNumbers = [oGenerator.reserve() for i in range(pages)]
+
+    oGenerator.writeObject(catalog, '<< /Type /Catalog /Pages %d 0 R >>' % pageTree)
+    oGenerator.writeObject(info, '<< /Producer (generate.py) /Title (Synthetic document %d) >>' % seed)
+    kids = ' '.join('%d 0 R' % number for number in pageNumbers)
+    oGenerator.writeObject(pageTree, '<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, pages))
+    for i, number in enumerate(fontNumbers):
+        dictionary = '<< /Type /Font /Subtype /Type1 /BaseFont %s /Encoding /WinAnsiEncoding' % BASE_FONTS[i % len(BASE_FONTS)]
+        if widths > 0:
+            dictionary += ' /FirstChar 0 /LastChar %d /Widths [%s]' % (widths - 1, ' '.join(str(oRandom.randrange(200, 1000)) for j in range(widths)))
+        oGenerator.writeObject(number, dictionary + ' >>')
+
+    fontResources = ' '.join('/F%d %d 0 R' % (i + 1, number) for i, number in enumerate(fontNumbers))
+    for i, number in enumerate(pageNumbers):
+        contents = oGenerator.reserve()
+        oGenerator.writeStream(contents, ContentStream(oRandom, streamSize, fonts), filters[i % len(filters)])
+        oGenerator.writeObject(number, '<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Resources << /Font << %s >> >> /Contents %d 0 R >>' % (pageTree, fontResources, contents))
+
+    while oGenerator.size <= objects:
+        number = oGenerator.reserve()
+        values = ' '.join(str(oRandom.randrange(100000)) for j in range(oRandom.randrange(1, 16)))
+        oGenerator.writeObject(number, '<< /Filler %d /Name /%s /Values [%s] /Text (%s) >>' % (number, oRandom.choice(WORDS), values, oRandom.choice(WORDS)))
+
+    oGenerator.close(catalog, info)
+    return oGenerator.size - 1
+
+
+def Main():
+    """Main reads the document parameters from the command line and generates the document."""
+
+    oParser = optparse.OptionParser(usage='usage: %prog [options] output-pdf\n' + __description__)
+    oParser.add_option('-n', '--objects', type='int', default=1000, help='minimum number of objects (default: %default)')
+    oParser.add_option('-p', '--pages', type='int', default=10, help='number of pages (default: %default)')
+    oParser.add_option('-f', '--fonts', type='int', default=10, help='number of fonts (default: %default)')
+    oParser.add_option('-w', '--widths', type='int', default=0, help='number of entries in the /Widths array of each font (default: %default)')
+    oParser.add_option('-s', '--stream-size', type='int', default=4096, help='approximate decoded size of each content stream in bytes (default: %default)')
+    oParser.add_option('-F', '--filters', type='string', default='flate', help='comma-separated filters used in turn for the content streams, from: %s (default: %%default)' % ', '.join(sorted(FILTERS)))
+    oParser.add_option('-o', '--objstm', type='int', default=0, help='pack objects without a stream into object streams of this many objects, with an xref stream (default: no object streams)')
+    oParser.add_option('-r', '--seed', type='int', default=0, help='random seed (default: %default)')
+    (options, args) = oParser.parse_args()
+
+    if len(args) != 1:
+        oParser.print_help()
+        return
+    filters = [filter.strip() for filter in options.filters.split(',') if filter.strip() != '']
+    for filter in filters:
+        if filter not in FILTERS:
+            oParser.error('unknown filter %s' % filter)
+    count = GeneratePDF(args[0], options.objects, options.pages, options.fonts, options.stream_size, filters, options.objstm, options.widths, options.seed)
+    print('%s: %d objects' % (args[0], count))
+
+
+if __name__ == '__main__':
+    Main()
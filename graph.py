@@ -0,0 +1,307 @@
+import array
+
+import pdf_objects
+
+PDF_ELEMENT_INDIRECT_OBJECT = 2
+PDF_ELEMENT_TRAILER = 4
+
+NO_SEGMENT = -1
+
+
+def BuildGraph(elements):
+    """
+    BuildGraph returns the ReferenceGraph of the given elements, in one pass. The objects inside object streams are
+    only included when the elements include them, e.g. through FontDestroyer.ExpandObjectStreams.
+    """
+
+    oGraph = ReferenceGraph()
+    for element in elements:
+        if element.type == PDF_ELEMENT_INDIRECT_OBJECT:
+            oGraph.Add(element)
+        elif element.type == PDF_ELEMENT_TRAILER:
+            oGraph.AddTrailer(pdf_objects.ParseDictionary(element.content[1:], False))
+    oGraph.Finish()
+    return oGraph
+
+
+def ReferenceNumber(value):
+    """
+    ReferenceNumber returns the first value of a ParseDictionary value like 12 0 R as an integer, or None.
+    """
+
+    if value == None or len(value) == 0 or type(value[0]) != str or not value[0].isdigit():
+        return None
+    return int(value[0])
+
+
+class ReferenceGraph:
+    """
+    ReferenceGraph holds the references between the indirect objects of a document in compressed sparse row form,
+    indexed by object number: the numbers of the objects referenced by object n are targets[offsets[n]:offsets[n + 1]],
+    and the numbers of the objects referencing it are sources[incomingOffsets[n]:incomingOffsets[n + 1]].
+    Objects are added in file order, so that the last revision of an object number is the one that counts. Types are
+    kept as indexes into a list of type names.
+    """
+
+    def __init__(self):
+        # until Finish, the references of every object added are collected as a segment of references
+        self.segmentNumbers = array.array('l')
+        self.segmentStarts = array.array('q')
+        self.segmentTypes = array.array('H')
+        self.references = array.array('l')
+        self.typeNames = ['']
+        self.typeIndexes = {'': 0}
+        self.root = None
+        self.info = None
+        self.infoVersion = 0
+
+        self.size = 0
+        self.offsets = array.array('q', [0])
+        self.targets = array.array('l')
+        self.incomingOffsets = array.array('q', [0])
+        self.sources = array.array('l')
+        self.types = array.array('H')
+        self.present = bytearray()
+        self.revisions = array.array('l')
+
+    def TypeIndex(self, typeName):
+        index = self.typeIndexes.get(typeName)
+        if index == None:
+            index = len(self.typeNames)
+            self.typeNames.append(typeName)
+            self.typeIndexes[typeName] = index
+        return index
+
+    def Add(self, object):
+        """
+        Add records the type and references of an indirect object. An /XRef stream also counts as a trailer.
+        """
+
+        objectType = pdf_objects.Canonicalize(object.GetType())
+        self.segmentNumbers.append(object.id)
+        self.segmentStarts.append(len(self.references))
+        self.segmentTypes.append(self.TypeIndex(objectType))
+        for reference in object.GetReferences():
+            if reference[0].isdigit():
+                self.references.append(int(reference[0]))
+        if objectType == '/XRef':
+            self.AddTrailer(object.GetDictionary())
+
+    def AddTrailer(self, oPDFParseDictionary):
+        """
+        AddTrailer records the /Root and /Info of a trailer dictionary; a later trailer overrides an earlier one.
+        """
+
+        root = ReferenceNumber(oPDFParseDictionary.Get('/Root'))
+        if root != None:
+            self.root = root
+        value = oPDFParseDictionary.Get('/Info')
+        info = ReferenceNumber(value)
+        if info != None:
+            self.info = info
+            self.infoVersion = int(value[1]) if len(value) > 1 and type(value[1]) == str and value[1].isdigit() else 0
+
+    def Finish(self):
+        """
+        Finish builds the compressed sparse rows from the collected segments, keeping the last segment of every
+        object number, and the reverse rows of the referencing objects, each listed once and in ascending order.
+        Objects can no longer be added afterwards.
+        """
+
+        segments = len(self.segmentNumbers)
+        size = max(max(self.segmentNumbers, default=-1), max(self.references, default=-1)) + 1
+        latest = array.array('l', [NO_SEGMENT]) * size
+        revisions = array.array('l', [0]) * size
+        for segment in range(segments):
+            number = self.segmentNumbers[segment]
+            latest[number] = segment
+            revisions[number] += 1
+
+        offsets = array.array('q', [0]) * (size + 1)
+        targets = array.array('l')
+        types = array.array('H', [0]) * size
+        present = bytearray(size)
+        for number in range(size):
+            segment = latest[number]
+            if segment != NO_SEGMENT:
+                start = self.segmentStarts[segment]
+                end = self.segmentStarts[segment + 1] if segment + 1 < segments else len(self.references)
+                targets.extend(self.references[start:end])
+                types[number] = self.segmentTypes[segment]
+                present[number] = 1
+            offsets[number + 1] = len(targets)
+
+        # the sources of every target are counted, then filled in by a second pass over the rows in the same order
+        last = array.array('l', [-1]) * size
+        incomingOffsets = array.array('q', [0]) * (size + 1)
+        for source in range(size):
+            for target in targets[offsets[source]:offsets[source + 1]]:
+                if last[target] != source:
+                    last[target] = source
+                    incomingOffsets[target + 1] += 1
+        for number in range(size):
+            incomingOffsets[number + 1] += incomingOffsets[number]
+        sources = array.array('l', [0]) * incomingOffsets[size]
+        positions = incomingOffsets[:size]
+        last = array.array('l', [-1]) * size
+        for source in range(size):
+            for target in targets[offsets[source]:offsets[source + 1]]:
+                if last[target] != source:
+                    last[target] = source
+                    sources[positions[target]] = source
+                    positions[target] += 1
+
+        self.size = size
+        self.offsets = offsets
+        self.targets = targets
+        self.incomingOffsets = incomingOffsets
+        self.sources = sources
+        self.types = types
+        self.present = present
+        self.revisions = revisions
+        self.segmentNumbers = None
+        self.segmentStarts = None
+        self.segmentTypes = None
+        self.references = None
+
+    def Contains(self, number):
+        return 0 <= number < self.size and self.present[number] == 1
+
+    def Revisions(self, number):
+        """
+        Revisions returns the number of times an object with the given number was added, 0 when it is not present.
+        """
+
+        if not self.Contains(number):
+            return 0
+        return self.revisions[number]
+
+    def Type(self, number):
+        """
+        Type returns the canonical /Type of the object with the given number, '' when it has none or is not present.
+        """
+
+        if not self.Contains(number):
+            return ''
+        return self.typeNames[self.types[number]]
+
+    def References(self, number):
+        """
+        References returns the numbers of the objects referenced by the given object, in document order.
+        """
+
+        if not self.Contains(number):
+            return array.array('l')
+        return self.targets[self.offsets[number]:self.offsets[number + 1]]
+
+    def Reachable(self, numbers, stopTypes=()):
+        """
+        Reachable returns a bytearray that flags, by object number, the objects that are present and reachable from
+        the given ones. Objects of a type in stopTypes are reached but their references are not followed, unless they
+        are one of the given objects.
+        """
+
+        stop = set(self.typeIndexes[typeName] for typeName in stopTypes if typeName in self.typeIndexes)
+        offsets = self.offsets
+        targets = self.targets
+        present = self.present
+        types = self.types
+        size = self.size
+        visited = bytearray(size)
+        stack = array.array('l')
+        for number in numbers:
+            if self.Contains(number) and not visited[number]:
+                visited[number] = 1
+                stack.append(number)
+        starts = set(stack)
+        while stack:
+            number = stack.pop()
+            if types[number] in stop and number not in starts:
+                continue
+            for target in targets[offsets[number]:offsets[number + 1]]:
+                if target < size and present[target] and not visited[target]:
+                    visited[target] = 1
+                    stack.append(target)
+        return visited
+
+    def Roots(self):
+        """
+        Roots returns the numbers of the /Root and /Info objects of the last trailer that are present.
+        """
+
+        return [number for number in (self.root, self.info) if number != None and self.Contains(number)]
+
+    def ReachableFromRoot(self):
+        """
+        ReachableFromRoot returns the flags of Reachable for the objects reachable from the document catalog.
+        """
+
+        return self.Reachable([self.root] if self.root != None else [])
+
+    def Referencing(self, number):
+        """
+        Referencing returns the numbers of the objects that reference the given object, in ascending order.
+        """
+
+        if number < 0 or number >= self.size:
+            return array.array('l')
+        return self.sources[self.incomingOffsets[number]:self.incomingOffsets[number + 1]]
+
+    def Pages(self):
+        """
+        Pages returns the numbers of the /Page objects in document order, found by walking the page tree from the
+        /Pages object of the catalog through the /Kids of each /Pages node.
+        """
+
+        return self.PageTree()[0]
+
+    def PageTree(self):
+        """
+        PageTree walks the page tree like Pages, and returns the numbers of the /Page objects in document order with a
+        dictionary that maps the number of every node below the top /Pages node to the number of its parent node.
+        """
+
+        pageTypes = set(self.typeIndexes[typeName] for typeName in ('/Page', '/Pages') if typeName in self.typeIndexes)
+        pagesType = self.typeIndexes.get('/Pages')
+        pageType = self.typeIndexes.get('/Page')
+        if self.root == None:
+            return [], {}
+        tree = [number for number in self.References(self.root) if self.Contains(number) and self.types[number] == pagesType]
+        if tree == []:
+            return [], {}
+        pages = []
+        parents = {}
+        visited = bytearray(self.size)
+        stack = [tree[0]]
+        while stack:
+            number = stack.pop()
+            if visited[number]:
+                continue
+            visited[number] = 1
+            if self.types[number] == pageType:
+                pages.append(number)
+                continue
+            # the /Parent of a node was visited before it, so only its kids are left
+            kids = [target for target in self.References(number) if self.Contains(target) and self.types[target] in pageTypes and not visited[target]]
+            for kid in kids:
+                parents.setdefault(kid, number)
+            stack.extend(reversed(kids))
+        return pages, parents
+
+    def FontsOfPage(self, index):
+        """
+        FontsOfPage returns the numbers of the /Font objects reachable from the page with the given index (0 for the
+        first page) or from the /Pages nodes on its /Parent chain, whose /Resources the page inherits, without
+        following references to other pages or to the rest of the page tree. The graph does not record dictionary
+        keys, so the fonts of the ancestors are included even when the page has /Resources of its own.
+        """
+
+        pages, parents = self.PageTree()
+        if index < 0 or index >= len(pages):
+            raise Exception('Page index %d out of range, the document has %d pages' % (index, len(pages)))
+        chain = [pages[index]]
+        while chain[-1] in parents:
+            chain.append(parents[chain[-1]])
+        reached = self.Reachable(chain, ('/Page', '/Pages'))
+        fontType = self.typeIndexes.get('/Font')
+        return [number for number in range(self.size) if reached[number] and self.types[number] == fontType]
@@ -1,11 +1,14 @@
-from io import StringIO
+import io
+import mmap
 import sys
 import pdf_objects
 import re
+import stats
 
 CHAR_WHITESPACE = 1
 CHAR_DELIMITER = 2
 CHAR_REGULAR = 3
+CHAR_STREAM = 4
 
 CONTEXT_NONE = 1
 CONTEXT_OBJ = 2
@@ -19,10 +22,187 @@ PDF_ELEMENT_TRAILER = 4
 PDF_ELEMENT_STARTXREF = 5
 PDF_ELEMENT_MALFORMED = 6
 
+WHITESPACE_BYTES = frozenset([0, 9, 10, 12, 13, 32])
+DELIMITER_BYTES = frozenset([0x28, 0x29, 0x3C, 0x3E, 0x5B, 0x5D, 0x7B, 0x7D, 0x2F, 0x25])
+
+CHARACTER_CLASSES = [CHAR_WHITESPACE if byte in WHITESPACE_BYTES else CHAR_DELIMITER if byte in DELIMITER_BYTES else CHAR_REGULAR for byte in range(256)]
+DOUBLE_BRACKETS = {0x3C: b'<', 0x3E: b'>'}
+
+# A comment runs up to and including the first EOL character, plus one line feed directly following it
+COMMENT_PATTERN = re.compile(rb'%[^\r\n]*(?:[\r\n]\n?)?')
+RUN_PATTERNS = {
+    CHAR_WHITESPACE: re.compile(rb'[\x00\t\n\x0c\r ]+'),
+    CHAR_REGULAR: re.compile(rb'[^\x00\t\n\x0c\r ()<>\[\]{}/%]+'),
+}
+TOKEN_PATTERN = re.compile(rb'([\x00\t\n\x0c\r ]+)|([^\x00\t\n\x0c\r ()<>\[\]{}/%]+)|(%[^\r\n]*(?:[\r\n]\n?)?|<<|>>|[()<>\[\]{}/])')
+TOKEN_GROUP_CLASSES = [None, CHAR_WHITESPACE, CHAR_REGULAR, CHAR_DELIMITER]
+ENDSTREAM_PATTERN = re.compile(rb'[\x00\t\n\x0c\r ]*endstream')
+# stream and endobj as regular tokens: not part of a longer regular run and not a name
+KEYWORD_PATTERN = re.compile(rb'(?<![^\x00\t\n\x0c\r ()<>\[\]{}%])(?:stream|endobj)(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])')
+# the bytes that change how the keywords are read: the keywords, strings, dictionaries and comments
+STRUCTURE_PATTERN = re.compile(KEYWORD_PATTERN.pattern + rb'|<<|>>|[()\\%<]')
+# the bytes without which a dictionary has no /Type entry
+TYPE_HINT_PATTERN = re.compile(rb'/Type|#')
+
 def IsNumeric(str):
     return re.match('^[0-9]+', str)
 
 
+def NameTokens(data):
+    """
+    NameTokens tokenizes the given bytes and joins each / with the regular characters following it, like the parser
+    does for the content of objects.
+    """
+
+    tokens = pdf_objects.TokenList()
+    for token in IterateNameTokens(data):
+        tokens.add(token[0], token[1])
+    if stats.collector != None:
+        stats.collector.Count('tokens', len(tokens))
+    return tokens
+
+
+def IterateNameTokens(data, start=0, end=None):
+    """
+    IterateNameTokens yields the tokens of NameTokens for the bytes start to end of data one at a time, without
+    copying the bytes or keeping the tokens.
+    """
+
+    previous = None
+    for oMatch in TOKEN_PATTERN.finditer(data, start, len(data) if end == None else end):
+        token = (TOKEN_GROUP_CLASSES[oMatch.lastindex], str(oMatch.group(), 'latin-1'))
+        if previous != None and previous[1] == '/' and token[0] == CHAR_REGULAR:
+            previous = (previous[0], '/' + token[1])
+            continue
+        if previous != None:
+            yield previous
+        previous = token
+    if previous != None:
+        yield previous
+
+
+def FindType(data, start, end):
+    """
+    FindType returns the /Type of the dictionary in the bytes start to end of data like pdf_objects.FindType on their
+    NameTokens, but stops reading tokens at the /Type entry, so that a large dictionary is not tokenized as a whole.
+    Bytes that hold neither /Type nor a # escape, which could spell it, are not tokenized at all.
+    """
+
+    if TYPE_HINT_PATTERN.search(data, start, end) == None:
+        return ''
+    result = ''
+    dictionary = 0
+    tokens = IterateNameTokens(data, start, end)
+    for kind, value in tokens:
+        if kind != CHAR_DELIMITER:
+            continue
+        if value == '<<':
+            dictionary += 1
+        elif value == '>>':
+            dictionary -= 1
+        elif dictionary == 1 and pdf_objects.Canonicalize(value) == '/Type':
+            # the value is the next token that is not whitespace
+            for kind, value in tokens:
+                if kind != CHAR_WHITESPACE:
+                    result = value
+                    break
+            break
+    return pdf_objects.Canonicalize(result)
+
+
+def DirectLength(content):
+    """
+    DirectLength returns the /Length of the stream dictionary in the given tokens, or None when it is missing or an
+    indirect reference.
+    """
+
+    content = pdf_objects.CopyWithoutWhiteSpace(content)
+    kinds = content.kinds
+    values = content.values
+    dictionary = 0
+    for i in range(0, len(values)):
+        if kinds[i] != CHAR_DELIMITER:
+            continue
+        if values[i] == '<<':
+            dictionary += 1
+        elif values[i] == '>>':
+            dictionary -= 1
+        elif dictionary == 1 and pdf_objects.Canonicalize(values[i]) == '/Length':
+            if i + 1 >= len(values) or kinds[i+1] != CHAR_REGULAR or not values[i+1].isdigit():
+                return None
+            if i + 3 < len(values) and values[i+2].isdigit() and values[i+3] == 'R':
+                return None
+            return int(values[i+1])
+    return None
+
+
+def FindKeyword(data, start):
+    """
+    FindKeyword returns the match of the first endobj or stream keyword in the object content starting at start, or
+    None. Keywords inside literal strings, hexadecimal strings and comments are skipped, and stream only counts as
+    the keyword directly after the >> that closes the outer dictionary.
+    """
+
+    depth = 0
+    strings = 0
+    position = start
+    while True:
+        oMatch = STRUCTURE_PATTERN.search(data, position)
+        if oMatch == None:
+            return None
+        found = oMatch.group()
+        position = oMatch.end()
+        if strings > 0:
+            if found == b'\\':
+                position += 1
+            elif found == b'(':
+                strings += 1
+            elif found == b')':
+                strings -= 1
+        elif found == b'endobj':
+            return oMatch
+        elif found == b'stream':
+            end = oMatch.start()
+            while end > start and data[end - 1] in WHITESPACE_BYTES:
+                end -= 1
+            if depth == 0 and end - 2 >= start and data[end - 2:end] == b'>>':
+                return oMatch
+        elif found == b'(':
+            strings = 1
+        elif found == b'<<':
+            depth += 1
+        elif found == b'>>':
+            depth -= 1
+        elif found == b'<':
+            end = data.find(b'>', position)
+            if end == -1:
+                return None
+            position = end + 1
+        elif found == b'%':
+            position = COMMENT_PATTERN.match(data, oMatch.start()).end()
+
+
+def StreamBody(data, size, start, length):
+    """
+    StreamBody returns the (start, end) offsets of the body of the stream whose stream keyword ends at start. The end
+    is found by jumping over length bytes when that lands on endstream, and by searching for endstream otherwise.
+    StreamBody returns None when there is no endstream.
+    """
+
+    if data[start:start + 2] == b'\r\n':
+        bodyStart = start + 2
+    elif data[start:start + 1] in (b'\n', b'\r'):
+        bodyStart = start + 1
+    else:
+        bodyStart = start
+    if length != None and bodyStart + length <= size and ENDSTREAM_PATTERN.match(data, bodyStart + length):
+        return (bodyStart, bodyStart + length)
+    bodyEnd = data.find(b'endstream', bodyStart)
+    if bodyEnd == -1:
+        return None
+    return (bodyStart, bodyEnd)
+
+
 class Document:
     """
     Document provides functions to read bytes from a PDF file.
@@ -30,41 +210,103 @@ class Document:
 
     def __init__(self, file):
         """
-        __init__ opens the given file and creates necessary structures to provide byte reading.
+        __init__ maps the given file (a path, a file object or a bytes-like object) into one contiguous buffer and
+        positions the cursor at its start.
         """
 
-        self.ungetted = []
-        if type(file) != str:
-            self.infile = file
+        self.position = 0
+        self.infile = None
+        if isinstance(file, (bytes, bytearray, memoryview, mmap.mmap)):
+            self.data = file
+        elif type(file) != str:
+            self.data = Document.Load(file)
+            if isinstance(self.data, mmap.mmap):
+                self.infile = file
         else:
             try:
-                self.infile = open(file, 'rb')
+                infile = open(file, 'rb')
             except:
                 print('Error opening file %s' % file)
                 print(sys.exc_info()[1])
                 sys.exit()
+            try:
+                self.data = Document.Load(infile)
+            except:
+                infile.close()
+                raise
+            if isinstance(self.data, mmap.mmap):
+                self.infile = infile
+            else:
+                infile.close()
+        self.size = len(self.data)
 
-    def byte(self):
+    @staticmethod
+    def Load(infile):
         """
-        byte returns a single byte from the PDF file. byte returns None if the file has been completely read.
+        Load returns the content of the given file object as a buffer, memory-mapping it when it is backed by a real
+        file and reading it in one call otherwise.
         """
 
-        if len(self.ungetted) > 0:
-            return self.ungetted.pop()
+        try:
+            return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            pass
+        data = infile.read()
+        if type(data) == str:
+            data = data.encode('latin-1')
+        return data
 
-        inbyte = self.infile.read(1)
-        if not inbyte or inbyte == '':
-            self.infile.close()
+    def fileno(self):
+        """
+        fileno returns the file descriptor of the memory-mapped file, or None when the document is not backed by one.
+        """
+
+        try:
+            return self.infile.fileno()
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
             return None
 
-        return ord(inbyte)
+    def byte(self):
+        """
+        byte returns a single byte from the PDF file. byte returns None if the file has been completely read.
+        """
+
+        if self.position >= self.size:
+            return None
+        byte = self.data[self.position]
+        self.position += 1
+        return byte
 
     def unget(self, byte):
         """
-        unget saves the given byte to be returned in the next call to byte.
+        unget moves the cursor back over the given byte, so that it is returned in the next call to byte.
         """
 
-        self.ungetted.append(byte)
+        if byte != None:
+            self.position -= 1
+
+    def read(self, size):
+        """
+        read returns the next size bytes (fewer at the end of the file) as a bytes object and advances the cursor.
+        """
+
+        data = self.data[self.position:self.position + size]
+        self.position += len(data)
+        return bytes(data)
+
+    def seek(self, position):
+        """
+        seek moves the cursor to the given absolute position.
+        """
+
+        self.position = max(0, min(position, self.size))
+
+    def tell(self):
+        """
+        tell returns the current position of the cursor.
+        """
+
+        return self.position
 
 
 class Tokenizer:
@@ -77,7 +319,10 @@ class Tokenizer:
         __init__ creates data structures needed to tokenize the file.
         """
 
-        self.pdf = Document(file)
+        if isinstance(file, Document):
+            self.pdf = file
+        else:
+            self.pdf = Document(file)
         self.ungetted = []
         self.finished = False
 
@@ -87,9 +332,9 @@ class Tokenizer:
         Returns whether the given byte is whitespace, delimiter or normal character.
         """
 
-        if byte == 0 or byte == 9 or byte == 10 or byte == 12 or byte == 13 or byte == 32:
+        if byte in WHITESPACE_BYTES:
             return CHAR_WHITESPACE
-        if byte == 0x28 or byte == 0x29 or byte == 0x3C or byte == 0x3E or byte == 0x5B or byte == 0x5D or byte == 0x7B or byte == 0x7D or byte == 0x2F or byte == 0x25:
+        if byte in DELIMITER_BYTES:
             return CHAR_DELIMITER
         return CHAR_REGULAR
 
@@ -104,66 +349,44 @@ class Tokenizer:
         if self.finished:
             return None
 
-        byte = self.pdf.byte()
-        if byte == None:
+        data = self.pdf.data
+        size = self.pdf.size
+        start = self.pdf.position
+        if start >= size:
             self.finished = True
             return None
 
-        if Tokenizer.CharacterClass(byte) == CHAR_WHITESPACE:
-            file_str = StringIO()
-            while byte != None and Tokenizer.CharacterClass(byte) == CHAR_WHITESPACE:
-                file_str.write(chr(byte))
-                byte = self.pdf.byte()
-            if byte != None:
-                self.pdf.unget(byte)
-            else:
-                self.finished = True
-            self.token = file_str.getvalue()
-            return (CHAR_WHITESPACE, self.token)
-        elif Tokenizer.CharacterClass(byte) == CHAR_REGULAR:
-            file_str = StringIO()
-            while byte != None and Tokenizer.CharacterClass(byte) == CHAR_REGULAR:
-                file_str.write(chr(byte))
-                byte = self.pdf.byte()
-            if byte != None:
-                self.pdf.unget(byte)
-            else:
-                self.finished = True
-            self.token = file_str.getvalue()
-            return (CHAR_REGULAR, self.token)
-        else:
-            if byte == 0x3C:
-                byte = self.pdf.byte()
-                if byte == 0x3C:
-                    return (CHAR_DELIMITER, '<<')
-                else:
-                    self.pdf.unget(byte)
-                    return (CHAR_DELIMITER, '<')
-            elif byte == 0x3E:
-                byte = self.pdf.byte()
-                if byte == 0x3E:
-                    return (CHAR_DELIMITER, '>>')
-                else:
-                    self.pdf.unget(byte)
-                    return (CHAR_DELIMITER, '>')
-            elif byte == 0x25:
-                file_str = StringIO()
-                while byte != None:
-                    file_str.write(chr(byte))
-                    if byte == 10 or byte == 13:
-                        byte = self.pdf.byte()
-                        break
-                    byte = self.pdf.byte()
-                if byte != None:
-                    if byte == 10:
-                        file_str.write(chr(byte))
-                    else:
-                        self.pdf.unget(byte)
-                else:
-                    self.finished = True
-                self.token = file_str.getvalue()
-                return (CHAR_DELIMITER, self.token)
+        byte = data[start]
+        if byte in WHITESPACE_BYTES:
+            end = start + 1
+            while end < size and data[end] in WHITESPACE_BYTES:
+                end += 1
+            self.pdf.position = end
+            return (CHAR_WHITESPACE, str(data[start:end], 'latin-1'))
+        elif byte not in DELIMITER_BYTES:
+            end = start + 1
+            while end < size and data[end] not in WHITESPACE_BYTES and data[end] not in DELIMITER_BYTES:
+                end += 1
+            self.pdf.position = end
+            return (CHAR_REGULAR, str(data[start:end], 'latin-1'))
+        elif byte == 0x3C or byte == 0x3E:
+            if start + 1 < size and data[start + 1] == byte:
+                self.pdf.position = start + 2
+                return (CHAR_DELIMITER, chr(byte) * 2)
+            self.pdf.position = start + 1
             return (CHAR_DELIMITER, chr(byte))
+        elif byte == 0x25:
+            end = start + 1
+            while end < size and data[end] != 10 and data[end] != 13:
+                end += 1
+            if end < size:
+                end += 1
+                if end < size and data[end] == 10:
+                    end += 1
+            self.pdf.position = end
+            return (CHAR_DELIMITER, str(data[start:end], 'latin-1'))
+        self.pdf.position = start + 1
+        return (CHAR_DELIMITER, chr(byte))
 
     def TokenIgnoreWhiteSpace(self):
         """
@@ -194,13 +417,91 @@ class Tokenizer:
     
         self.ungetted.append(token)
 
+    def Seek(self, position):
+        """
+        Seek discards saved tokens and continues tokenizing at the given absolute position.
+        """
+
+        self.ungetted = []
+        self.finished = False
+        self.pdf.seek(position)
+
+
+class RegexTokenizer(Tokenizer):
+    """
+    RegexTokenizer tokenizes a PDF file like Tokenizer, but classifies bytes with a lookup table and slices whole
+    runs of whitespace, regular characters and comments out of the buffer with compiled patterns.
+    """
+
+    @staticmethod
+    def CharacterClass(byte):
+        """
+        Returns whether the given byte is whitespace, delimiter or normal character.
+        """
+
+        return CHARACTER_CLASSES[byte]
+
+    def Token(self):
+        """
+        Token returns the next token in the PDF file.
+        """
+
+        if len(self.ungetted) != 0:
+            return self.ungetted.pop()
+
+        data = self.pdf.data
+        start = self.pdf.position
+        if start >= self.pdf.size:
+            self.finished = True
+            return None
+
+        byte = data[start]
+        characterClass = CHARACTER_CLASSES[byte]
+        if characterClass == CHAR_DELIMITER:
+            if byte == 0x25:
+                end = COMMENT_PATTERN.match(data, start).end()
+            elif (byte == 0x3C or byte == 0x3E) and data[start + 1:start + 2] == DOUBLE_BRACKETS[byte]:
+                end = start + 2
+            else:
+                self.pdf.position = start + 1
+                return (CHAR_DELIMITER, chr(byte))
+        else:
+            end = RUN_PATTERNS[characterClass].match(data, start).end()
+        self.pdf.position = end
+        return (characterClass, str(data[start:end], 'latin-1'))
+
+    def Tokens(self):
+        """
+        Tokens returns a list of all tokens in the PDF file.
+        """
+
+        tokens = []
+        while len(self.ungetted) != 0:
+            tokens.append(self.ungetted.pop())
+        append = tokens.append
+        for oMatch in TOKEN_PATTERN.finditer(self.pdf.data, self.pdf.position):
+            append((TOKEN_GROUP_CLASSES[oMatch.lastindex], str(oMatch.group(), 'latin-1')))
+        self.pdf.position = self.pdf.size
+        self.finished = True
+        return tokens
+
 
 class Parser:
-    def __init__(self, file, objstm=None):
+    def __init__(self, file, objstm=None, tokenizer=RegexTokenizer, lazy=False):
         self.context = CONTEXT_NONE
-        self.content = []
-        self.tokenizer = Tokenizer(file)
+        self.content = pdf_objects.TokenList()
+        self.tokenizer = tokenizer(file)
         self.objstm = objstm
+        self.lazy = lazy
+
+    def Seek(self, position):
+        """
+        Seek resets the parser so that the next call to GetObject parses the element at the given absolute position.
+        """
+
+        self.context = CONTEXT_NONE
+        self.content = pdf_objects.TokenList()
+        self.tokenizer.Seek(position)
 
     def GetObject(self):
         token = ""
@@ -241,29 +542,37 @@ class Parser:
     def HandleRegular(self, token):
         if self.context == CONTEXT_OBJ:
             if token[1] == 'endobj':
+                if stats.collector != None:
+                    stats.collector.Count('tokens', len(self.content))
                 self.oPDFElementIndirectObject = pdf_objects.IndirectObject(self.objectId, self.objectVersion, self.content, self.objstm)
                 self.context = CONTEXT_NONE
-                self.content = []
+                self.content = pdf_objects.TokenList()
                 return self.oPDFElementIndirectObject
             self.content.append(token)
+            if token[1] == 'stream' and self.IsStreamKeyword():
+                self.HandleStream()
             return None
         
         if self.context == CONTEXT_TRAILER:
             if token[1] == 'startxref' or token[1] == 'xref':
+                if stats.collector != None:
+                    stats.collector.Count('tokens', len(self.content))
                 self.oPDFElementTrailer = pdf_objects.Trailer(self.content)
                 self.tokenizer.unget(token)
                 self.context = CONTEXT_NONE
-                self.content = []
+                self.content = pdf_objects.TokenList()
                 return self.oPDFElementTrailer
             self.content.append(token)
             return None
 
         if self.context == CONTEXT_XREF:
             if token[1] == 'trailer' or token[1] == 'xref':
+                if stats.collector != None:
+                    stats.collector.Count('tokens', len(self.content))
                 self.oPDFElementXref = pdf_objects.Xref(self.content)
                 self.tokenizer.unget(token)
                 self.context = CONTEXT_NONE
-                self.content = []
+                self.content = pdf_objects.TokenList()
                 return self.oPDFElementXref
             self.content.append(token)
             return None
@@ -276,6 +585,8 @@ class Parser:
                     self.objectId = int(token[1], 10)
                     self.objectVersion = int(token2[1], 10)
                     self.context = CONTEXT_OBJ
+                    if self.lazy and len(self.tokenizer.ungetted) == 0:
+                        return self.HandleLazyObject()
                     return None
                 self.tokenizer.unget(token3)
             self.tokenizer.unget(token2)
@@ -283,12 +594,12 @@ class Parser:
         
         if token[1] == 'trailer':
             self.context = CONTEXT_TRAILER
-            self.content = [token]
+            self.content = pdf_objects.TokenList([token])
             return None
         
         if token[1] == 'xref':
             self.context = CONTEXT_XREF
-            self.content = [token]
+            self.content = pdf_objects.TokenList([token])
             return None
 
         if token[1] == 'startxref':
@@ -302,6 +613,91 @@ class Parser:
         return None
 
 
+    def DirectLength(self):
+        """
+        DirectLength returns the /Length of the stream dictionary collected so far, or None when it is missing or an
+        indirect reference.
+        """
+
+        return DirectLength(self.content)
+
+    def IsStreamKeyword(self):
+        """
+        IsStreamKeyword returns whether the stream token that ends the content collected so far is the stream keyword,
+        and not e.g. a word inside a string.
+        """
+
+        return pdf_objects.IsStreamKeyword(self.content.values, len(self.content) - 1)
+
+    def HandleStream(self):
+        """
+        HandleStream adds the body of the stream that starts at the current position to the content as a single
+        CHAR_STREAM token, so that binary data is never tokenized. It jumps over /Length bytes when the length is
+        direct and is followed by endstream, and otherwise searches for the endstream keyword.
+        """
+
+        if len(self.tokenizer.ungetted) != 0:
+            return
+        pdf = self.tokenizer.pdf
+        span = StreamBody(pdf.data, pdf.size, pdf.position, self.DirectLength())
+        if span == None:
+            return
+        bodyStart, bodyEnd = span
+        if bodyStart > pdf.position:
+            self.content.add(CHAR_WHITESPACE, str(pdf.data[pdf.position:bodyStart], 'latin-1'))
+        if bodyEnd > bodyStart:
+            self.content.add(CHAR_STREAM, str(pdf.data[bodyStart:bodyEnd], 'latin-1'))
+        pdf.seek(bodyEnd)
+
+    def HandleLazyObject(self):
+        """
+        HandleLazyObject finds the end of the object whose content starts at the current position by searching for
+        its stream and endobj keywords with FindKeyword. Only the dictionary is tokenized, to find /Length and /Type; the object
+        itself keeps the offsets and tokenizes its content when it is first needed.
+        """
+
+        pdf = self.tokenizer.pdf
+        data = pdf.data
+        contentStart = pdf.position
+        dictionaryEnd = None
+        objectType = None
+        position = contentStart
+        while True:
+            oMatch = FindKeyword(data, position)
+            if oMatch == None:
+                return None
+            if oMatch.group() == b'endobj':
+                break
+            dictionaryEnd = oMatch.start()
+            dictionary = NameTokens(data[contentStart:dictionaryEnd])
+            objectType = pdf_objects.FindType(dictionary)
+            span = StreamBody(data, pdf.size, oMatch.end(), DirectLength(dictionary))
+            if span == None:
+                return None
+            position = span[1]
+        contentEnd = oMatch.start()
+        if dictionaryEnd == None:
+            dictionaryEnd = contentEnd
+            objectType = FindType(data, contentStart, contentEnd)
+        pdf.seek(oMatch.end())
+        self.context = CONTEXT_NONE
+        return pdf_objects.LazyIndirectObject(self.objectId, self.objectVersion, pdf, contentStart, dictionaryEnd, contentEnd, objectType, self.objstm)
+
+    def GetObjectContent(self, id, version, position):
+        """
+        GetObjectContent returns the content tokens of the object with the given id and version whose content starts
+        at the given position.
+        """
+
+        self.Seek(position)
+        self.objectId = id
+        self.objectVersion = version
+        self.context = CONTEXT_OBJ
+        obj = self.GetObject()
+        if obj == None:
+            return []
+        return obj.content
+
     def HandleToken(self, token):
         if token == None:
             return None
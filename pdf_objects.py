@@ -1,6 +1,11 @@
+import array
 import decode
+import hashlib
+import parser
 import sys
 import re
+import stats
+import time
 import zlib
 
 PDF_ELEMENT_COMMENT = 1
@@ -13,6 +18,13 @@ PDF_ELEMENT_MALFORMED = 6
 CHAR_WHITESPACE = 1
 CHAR_DELIMITER = 2
 CHAR_REGULAR = 3
+CHAR_STREAM = 4
+
+# the classes of streams (see DecodePolicy) that the font destroyer needs decoded, and all classes
+DECODED_STREAMS = ('objstm', 'xref')
+STREAM_CLASSES = ('objstm', 'xref', 'image', 'font', 'form', 'metadata', 'embedded file', 'icc profile', 'content')
+FONT_PROGRAM_SUBTYPES = ('/Type1C', '/CIDFontType0C', '/OpenType')
+NOT_DECODED = 'Not decoded by the decode policy'
 
 def Canonicalize(sIn):
     if sIn == '':
@@ -38,14 +50,151 @@ def Canonicalize(sIn):
         return sCanonical
 
 
+def IsStreamKeyword(values, index):
+    """
+    IsStreamKeyword returns whether the stream token at index of the token values is the stream keyword, and not e.g.
+    a word inside a string, by checking the text up to it with parser.FindKeyword.
+    """
+    data = ''.join(values[:index + 1]).encode('latin-1')
+    oMatch = parser.FindKeyword(data, 0)
+    return oMatch != None and oMatch.end() == len(data)
+
+
+class TokenList:
+    """
+    TokenList stores tokens as two parallel columns, an array with the kind of each token and a list with its text,
+    instead of one (kind, text) tuple per token. Code that walks many tokens reads the kinds and values columns
+    directly; indexing and iterating still produce (kind, text) tuples for code that wants them. revision is
+    increased by every change made through the methods, and must be increased by code that changes the columns
+    directly, so that metadata cached about the tokens can be invalidated.
+    """
+
+    __slots__ = ('kinds', 'values', 'revision')
+
+    def __init__(self, tokens=()):
+        self.kinds = array.array('B')
+        self.values = []
+        self.revision = 0
+        for token in tokens:
+            self.kinds.append(token[0])
+            self.values.append(token[1])
+
+    @staticmethod
+    def FromColumns(kinds, values):
+        tokenList = TokenList()
+        tokenList.kinds = kinds
+        tokenList.values = values
+        return tokenList
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if type(index) == slice:
+            return TokenList.FromColumns(self.kinds[index], self.values[index])
+        return (self.kinds[index], self.values[index])
+
+    def __iter__(self):
+        return zip(self.kinds, self.values)
+
+    def __eq__(self, other):
+        if isinstance(other, TokenList):
+            return self.kinds == other.kinds and self.values == other.values
+        if not isinstance(other, list):
+            return NotImplemented
+        return len(other) == len(self.values) and list(self) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __add__(self, other):
+        other = AsTokenList(other)
+        return TokenList.FromColumns(self.kinds + other.kinds, self.values + other.values)
+
+    def __radd__(self, other):
+        return AsTokenList(other) + self
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def append(self, token):
+        self.kinds.append(token[0])
+        self.values.append(token[1])
+        self.revision += 1
+
+    def add(self, kind, value):
+        self.kinds.append(kind)
+        self.values.append(value)
+        self.revision += 1
+
+    def insert(self, index, token):
+        if index < 0:
+            index = max(0, len(self.values) + index)
+        self.kinds.insert(index, token[0])
+        self.values.insert(index, token[1])
+        self.revision += 1
+
+
+def AsTokenList(content):
+    if isinstance(content, TokenList):
+        return content
+    return TokenList(content)
+
+
 def CopyWithoutWhiteSpace(content):
-    result = []
-    for token in content:
-        if token[0] != CHAR_WHITESPACE:
-            result.append(token)
+    content = AsTokenList(content)
+    result = TokenList()
+    for i, kind in enumerate(content.kinds):
+        if kind != CHAR_WHITESPACE:
+            result.add(kind, content.values[i])
     return result
 
 
+def FindType(content):
+    content = AsTokenList(content)
+    kinds = content.kinds
+    values = content.values
+    dictionary = 0
+    result = ''
+    last = len(values) - 1
+    i = 0
+    while i <= last:
+        if kinds[i] == CHAR_DELIMITER:
+            if values[i] == '<<':
+                dictionary += 1
+            elif values[i] == '>>':
+                dictionary -= 1
+            elif dictionary == 1 and Canonicalize(values[i]) == '/Type':
+                # the value is the next token that is not whitespace
+                i += 1
+                while i <= last and kinds[i] == CHAR_WHITESPACE:
+                    i += 1
+                if i <= last:
+                    result = values[i]
+                break
+        i += 1
+    return Canonicalize(result)
+
+
+def SearchChunks(chunks, keyword, casesensitive):
+    """
+    SearchChunks returns True when keyword occurs in the data given as an iterable of chunks, also across the border
+    of two chunks.
+    """
+    if not casesensitive:
+        keyword = keyword.lower()
+    overlap = len(keyword) - 1
+    tail = ''
+    for chunk in chunks:
+        text = tail + str(chunk, 'latin-1')
+        if not casesensitive:
+            text = text.lower()
+        if keyword in text:
+            return True
+        tail = text[len(text) - overlap:] if overlap > 0 else ''
+    return False
+
+
 def FormatOutput(data):
     if sys.version_info[0] > 2:
         return ascii(data)
@@ -58,15 +207,19 @@ def IsNumeric(str):
 
 
 def TrimLWhiteSpace(data):
-    while data != [] and data[0][0] == CHAR_WHITESPACE:
-        data = data[1:]
-    return data
+    data = AsTokenList(data)
+    start = 0
+    while start < len(data) and data.kinds[start] == CHAR_WHITESPACE:
+        start += 1
+    return data[start:]
 
 
 def TrimRWhiteSpace(data):
-    while data != [] and data[-1][0] == CHAR_WHITESPACE:
-        data = data[:-1]
-    return data
+    data = AsTokenList(data)
+    end = len(data)
+    while end > 0 and data.kinds[end - 1] == CHAR_WHITESPACE:
+        end -= 1
+    return data[:end]
 
 
 class Comment:
@@ -104,13 +257,13 @@ class Trailer:
         self.content = content
 
     def Contains(self, keyword):
-        data = ''
-        for i in range(0, len(self.content)):
-            if self.content[i][1] == 'stream':
+        data = []
+        for value in self.content.values:
+            if value == 'stream':
                 break
             else:
-                data += Canonicalize(self.content[i][1])
-        return data.upper().find(keyword.upper()) != -1
+                data.append(Canonicalize(value))
+        return ''.join(data).upper().find(keyword.upper()) != -1
 
     def GetType(self):
         return 'Trailer'
@@ -138,51 +291,179 @@ class Xref:
         print('')
 
 
+class ObjectMetadata:
+    """
+    ObjectMetadata holds what IndirectObject.Analyze finds about the content of an object, together with the
+    content and its revision at that time. The stream dictionary tokens and the parsed dictionary are filled in when
+    first asked for.
+    """
+
+    __slots__ = ('content', 'revision', 'type', 'streamIndex', 'references', 'streamDictionary', 'dictionary')
+
+    def __init__(self, content, type, streamIndex, references):
+        self.content = content
+        self.revision = content.revision
+        self.type = type
+        self.streamIndex = streamIndex
+        self.references = references
+        self.streamDictionary = None
+        self.dictionary = None
+
+
+class DecodePolicy:
+    """
+    DecodePolicy decides which streams may be decoded. A stream is classified by the /Type and /Subtype and the keys
+    of its dictionary, and only the classes in allowed are decoded; the others are counted in the active statistics
+    with their undecoded size.
+    """
+
+    def __init__(self, allowed=DECODED_STREAMS):
+        self.allowed = allowed
+
+    @staticmethod
+    def Classify(dictionary):
+        """
+        Classify returns the class of a stream from its ParseDictionary: 'objstm', 'xref', 'image', 'font', 'form',
+        'metadata', 'embedded file', 'icc profile' or, for streams without any of these marks, 'content'.
+        """
+        def Name(key):
+            value = dictionary.Get(key)
+            if value == None or len(value) == 0 or type(value[0]) != str:
+                return None
+            return Canonicalize(value[0])
+
+        streamType = Name('/Type')
+        subtype = Name('/Subtype')
+        if streamType == '/ObjStm':
+            return 'objstm'
+        if streamType == '/XRef':
+            return 'xref'
+        if subtype == '/Image' or dictionary.Get('/BitsPerComponent') != None:
+            return 'image'
+        if subtype in FONT_PROGRAM_SUBTYPES or dictionary.Get('/Length1') != None or dictionary.Get('/Length2') != None:
+            return 'font'
+        if subtype == '/Form':
+            return 'form'
+        if streamType == '/Metadata':
+            return 'metadata'
+        if streamType == '/EmbeddedFile':
+            return 'embedded file'
+        if dictionary.Get('/N') != None and dictionary.Get('/Alternate') != None:
+            return 'icc profile'
+        return 'content'
+
+    def Allows(self, obj):
+        streamClass = DecodePolicy.Classify(obj.GetDictionary())
+        if streamClass in self.allowed:
+            return True
+        if stats.collector != None:
+            body = obj.StreamBody()
+            stats.collector.Count('streams not decoded %s' % streamClass)
+            stats.collector.Count('bytes not decoded', len(body) if body != None else 0)
+        return False
+
+
+# the policy that decides which streams are decoded when no policy is given, None decodes all streams
+decodePolicy = DecodePolicy()
+
+
 class IndirectObject:
     def __init__(self, id, version, content, objstm=None):
         self.type = PDF_ELEMENT_INDIRECT_OBJECT
         self.id = id
         self.version = version
-        self.content = content
+        self.content = AsTokenList(content)
         self.objstm = objstm
+        self.raw = None
+        self.metadata = None
         #fix stream for Ghostscript bug reported by Kurt
         if self.ContainsStream():
-            position = len(self.content) - 1
+            kinds = self.content.kinds
+            values = self.content.values
+            position = len(values) - 1
             if position < 0:
                 return
-            while self.content[position][0] == CHAR_WHITESPACE and position >= 0:
+            while position >= 0 and kinds[position] == CHAR_WHITESPACE:
                 position -= 1
             if position < 0:
                 return
-            if self.content[position][0] != CHAR_REGULAR:
+            if kinds[position] != CHAR_REGULAR:
                 return
-            if self.content[position][1] == 'endstream':
+            if values[position] == 'endstream':
                 return
-            if not self.content[position][1].endswith('endstream'):
+            if not values[position].endswith('endstream'):
                 return
-            self.content = self.content[0:position] + [(self.content[position][0], self.content[position][1][:-len('endstream')])] + [(self.content[position][0], 'endstream')] + self.content[position+1:]
+            values[position] = values[position][:-len('endstream')]
+            self.content.insert(position + 1, (CHAR_REGULAR, 'endstream'))
 
-    def GetType(self):
-        content = CopyWithoutWhiteSpace(self.content)
+    def Analyze(self):
+        """
+        Analyze returns the ObjectMetadata of the object: its type, the index of its stream keyword and its
+        references, found in one pass over the content. The result is cached until the content is replaced or its
+        revision changes.
+        """
+        content = self.content
+        metadata = self.metadata
+        if metadata != None and metadata.content is content and metadata.revision == content.revision:
+            return metadata
+
+        kinds = content.kinds
+        values = content.values
+        # the type is the first token after a /Type key of the outer dictionary, as in FindType
         dictionary = 0
-        result = ''
-        for i in range(0, len(content)):
-            if content[i][0] == CHAR_DELIMITER and content[i][1] == '<<':
-                dictionary += 1
-            if content[i][0] == CHAR_DELIMITER and content[i][1] == '>>':
-                dictionary -= 1
-            if dictionary == 1 and content[i][0] == CHAR_DELIMITER and Canonicalize(content[i][1]) == '/Type' and i < len(content) - 1:
-                result = content[i+1][1]
-                break
-        return Canonicalize(result)
+        objectType = ''
+        typeState = 0 # 0 searching, 1 /Type seen, 2 done
+        streamIndex = None
+        references = []
+        # kind and text of the previous two tokens that are not whitespace, for references like 12 0 R
+        kind1 = kind2 = None
+        value1 = value2 = None
+        for i, kind in enumerate(kinds):
+            if kind == CHAR_WHITESPACE:
+                continue
+            value = values[i]
+            if typeState == 1:
+                objectType = value
+                typeState = 2
+            elif typeState == 0 and kind == CHAR_DELIMITER:
+                if value == '<<':
+                    dictionary += 1
+                elif value == '>>':
+                    dictionary -= 1
+                elif dictionary == 1 and Canonicalize(value) == '/Type':
+                    typeState = 1
+            if kind == CHAR_REGULAR:
+                if value == 'R' and kind2 == CHAR_REGULAR and kind1 == CHAR_REGULAR and IsNumeric(value2) and IsNumeric(value1):
+                    references.append((value2, value1, value))
+                elif value == 'stream' and streamIndex == None and IsStreamKeyword(values, i):
+                    streamIndex = i
+            kind2, value2 = kind1, value1
+            kind1, value1 = kind, value
+
+        self.metadata = ObjectMetadata(content, Canonicalize(objectType), streamIndex, references)
+        return self.metadata
+
+    def GetType(self):
+        return self.Analyze().type
+
+    def GetDictionary(self):
+        """
+        GetDictionary returns the ParseDictionary of the object, or of its stream dictionary when it has a stream.
+        It is cached like the result of Analyze.
+        """
+        metadata = self.Analyze()
+        if metadata.dictionary == None:
+            metadata.dictionary = ParseDictionary(self.StreamDictionary() or self.content, False)
+        return metadata.dictionary
+
+    def RawContent(self):
+        """
+        RawContent returns the source bytes between obj and endobj, or None when they are not known.
+        """
+        return self.raw
 
     def GetReferences(self):
-        content = CopyWithoutWhiteSpace(self.content)
-        references = []
-        for i in range(0, len(content)):
-            if i > 1 and content[i][0] == CHAR_REGULAR and content[i][1] == 'R' and content[i-2][0] == CHAR_REGULAR and IsNumeric(content[i-2][1]) and content[i-1][0] == CHAR_REGULAR and IsNumeric(content[i-1][1]):
-                references.append((content[i-2][1], content[i-1][1], content[i][1]))
-        return references
+        return self.Analyze().references
 
     def References(self, index):
         for ref in self.GetReferences():
@@ -191,34 +472,62 @@ class IndirectObject:
         return False
 
     def ContainsStream(self):
-        for i in range(0, len(self.content)):
-            if self.content[i][0] == CHAR_REGULAR and self.content[i][1] == 'stream':
-                return self.content[0:i]
-        return False
+        """
+        ContainsStream returns a true value, the tokens of StreamDictionary for a tokenized object, when the object
+        has a stream, and False otherwise.
+        """
+        return self.StreamDictionary()
+
+    def StreamDictionary(self):
+        """
+        StreamDictionary returns the tokens before the stream keyword, or False when the object has no stream. The
+        tokens are cached and shared between calls, so they must not be changed.
+        """
+        metadata = self.Analyze()
+        if metadata.streamIndex == None:
+            return False
+        if metadata.streamDictionary == None:
+            metadata.streamDictionary = metadata.content[0:metadata.streamIndex]
+        return metadata.streamDictionary
 
     def Contains(self, keyword):
-        data = ''
-        for i in range(0, len(self.content)):
-            if self.content[i][1] == 'stream':
+        data = []
+        for value in self.content.values:
+            if value == 'stream':
                 break
             else:
-                data += Canonicalize(self.content[i][1])
-        return data.upper().find(keyword.upper()) != -1
+                data.append(Canonicalize(value))
+        return ''.join(data).upper().find(keyword.upper()) != -1
 
     def ContainsName(self, keyword):
-        for token in self.content:
-            if token[1] == 'stream':
+        kinds = self.content.kinds
+        for i, value in enumerate(self.content.values):
+            if value == 'stream':
                 return False
-            if token[0] == CHAR_DELIMITER and Canonicalize(token[1]) == keyword:
+            if kinds[i] == CHAR_DELIMITER and Canonicalize(value) == keyword:
                 return True
         return False
 
     def StreamContains(self, keyword, filter, casesensitive, regex, overridingfilters):
+        if self.StreamBody() != None and not self.MayDecode(filter, overridingfilters, self.StreamFilters()):
+            # a stream that may not be decoded is not searched
+            return False
+        if not regex:
+            # a keyword is searched in the decoded chunks of the stream, unless they cannot be decoded
+            try:
+                chunks = self.StreamChunks(filter, overridingfilters)
+                if chunks == None:
+                    return False
+                return SearchChunks(chunks, keyword, casesensitive)
+            except Exception:
+                pass
         if not self.ContainsStream():
             return False
         streamData = self.Stream(filter, overridingfilters)
         if filter and streamData == 'No filters':
             streamData = self.Stream(False, overridingfilters)
+        if type(streamData) != str:
+            streamData = streamData.decode('latin-1')
         if regex:
             return re.search(keyword, streamData, IIf(casesensitive, 0, re.I))
         elif casesensitive:
@@ -226,50 +535,127 @@ class IndirectObject:
         else:
             return keyword.lower() in streamData.lower()
 
-    def Stream(self, filter=True, overridingfilters=''):
+    def StreamFilters(self):
+        """
+        StreamFilters returns the canonical names of the filters of the stream, in the order they decode it.
+        """
+        value = self.GetDictionary().Get('/Filter') or []
+        return [Canonicalize(item) for item in value if type(item) == str and item.startswith('/')]
+
+    def MayDecode(self, filter, overridingfilters, filters, policy=None):
+        """
+        MayDecode returns False when the stream would be decoded, with its filters or with overridingfilters, but the
+        decode policy does not allow it. The policy is the module decodePolicy unless one is given.
+        """
+        if not filter or overridingfilters == 'raw' or (overridingfilters == '' and len(filters) == 0):
+            return True
+        if policy == None:
+            policy = decodePolicy
+        return policy == None or policy.Allows(self)
+
+    def StreamBody(self):
+        """
+        StreamBody returns the undecoded data of the stream, or None when the object has no stream.
+        """
+        metadata = self.Analyze()
+        if metadata.streamIndex == None:
+            return None
+        kinds = metadata.content.kinds
+        index = metadata.streamIndex + 1
+        if index < len(kinds) and kinds[index] == CHAR_WHITESPACE:
+            index += 1
+        if index < len(kinds) and kinds[index] == CHAR_STREAM:
+            return metadata.content.values[index]
+        data = self.Stream(False)
+        if type(data) != str:
+            return None
+        return data
+
+    def StreamChunks(self, filter=True, overridingfilters='', chunkSize=decode.CHUNK_SIZE, policy=None):
+        """
+        StreamChunks returns an iterator over the data of the stream, decoded like Stream but one chunk of about
+        chunkSize bytes at a time, or None when the object has no stream. A stream without filters is returned as it
+        is. It raises an Exception when the decode policy, see MayDecode, does not allow decoding the stream, and
+        decoding errors are raised while iterating.
+        """
+        data = self.StreamBody()
+        if data is None:
+            return None
+        chunks = decode.Chunks(data, chunkSize)
+        if not filter or overridingfilters == 'raw':
+            return chunks
+        if overridingfilters == '':
+            filters = self.StreamFilters()
+        else:
+            filters = [Canonicalize(filter) for filter in overridingfilters.split(' ')]
+        if not self.MayDecode(filter, overridingfilters, filters, policy):
+            raise Exception(NOT_DECODED)
+        return decode.DecodeChunks(chunks, filters, chunkSize)
+
+    def StreamHash(self, algorithm='md5', filter=True, chunkSize=decode.CHUNK_SIZE):
+        """
+        StreamHash returns the hex digest of the data of the stream, hashed chunk by chunk, or None when the object has
+        no stream.
+        """
+        chunks = self.StreamChunks(filter, '', chunkSize)
+        if chunks == None:
+            return None
+        oHash = hashlib.new(algorithm)
+        for chunk in chunks:
+            oHash.update(chunk)
+        return oHash.hexdigest()
+
+    def Stream(self, filter=True, overridingfilters='', policy=None):
         state = 'start'
         countDirectories = 0
-        data = ''
+        data = []
         filters = []
-        for i in range(0, len(self.content)):
+        kinds = self.content.kinds
+        for i, value in enumerate(self.content.values):
+            kind = kinds[i]
             if state == 'start':
-                if self.content[i][0] == CHAR_DELIMITER and self.content[i][1] == '<<':
+                if kind == CHAR_DELIMITER and value == '<<':
                     countDirectories += 1
-                if self.content[i][0] == CHAR_DELIMITER and self.content[i][1] == '>>':
+                if kind == CHAR_DELIMITER and value == '>>':
                     countDirectories -= 1
-                if countDirectories == 1 and self.content[i][0] == CHAR_DELIMITER and Canonicalize(self.content[i][1]) == '/Filter':
+                if countDirectories == 1 and kind == CHAR_DELIMITER and Canonicalize(value) == '/Filter':
                     state = 'filter'
-                elif countDirectories == 0 and self.content[i][0] == CHAR_REGULAR and self.content[i][1] == 'stream':
+                elif countDirectories == 0 and kind == CHAR_REGULAR and value == 'stream':
                     state = 'stream-whitespace'
             elif state == 'filter':
-                if self.content[i][0] == CHAR_DELIMITER and self.content[i][1][0] == '/':
-                    filters = [self.content[i][1]]
+                if kind == CHAR_DELIMITER and value[0] == '/':
+                    filters = [value]
                     state = 'search-stream'
-                elif self.content[i][0] == CHAR_DELIMITER and self.content[i][1] == '[':
+                elif kind == CHAR_DELIMITER and value == '[':
                     state = 'filter-list'
             elif state == 'filter-list':
-                if self.content[i][0] == CHAR_DELIMITER and self.content[i][1][0] == '/':
-                    filters.append(self.content[i][1])
-                elif self.content[i][0] == CHAR_DELIMITER and self.content[i][1] == ']':
+                if kind == CHAR_DELIMITER and value[0] == '/':
+                    filters.append(value)
+                elif kind == CHAR_DELIMITER and value == ']':
                     state = 'search-stream'
             elif state == 'search-stream':
-                if self.content[i][0] == CHAR_REGULAR and self.content[i][1] == 'stream':
+                if kind == CHAR_REGULAR and value == 'stream':
                     state = 'stream-whitespace'
             elif state == 'stream-whitespace':
-                if self.content[i][0] == CHAR_WHITESPACE:
-                    whitespace = self.content[i][1]
+                if kind == CHAR_WHITESPACE:
+                    whitespace = value
                     if whitespace.startswith('\x0D\x0A') and len(whitespace) > 2:
-                        data += whitespace[2:]
+                        data.append(whitespace[2:])
                     elif whitespace.startswith('\x0A') and len(whitespace) > 1:
-                        data += whitespace[1:]
+                        data.append(whitespace[1:])
                 else:
-                    data += self.content[i][1]
+                    data.append(value)
                 state = 'stream-concat'
             elif state == 'stream-concat':
-                if 'endstream' in self.content[i][1]:
-                    index = self.content[i][1].index('endstream')
-                    data += self.content[i][1][:index]
+                if kind == CHAR_STREAM:
+                    data.append(value)
+                elif 'endstream' in value:
+                    index = value.index('endstream')
+                    data.append(value[:index])
+                    data = ''.join(data)
 
+                    if not self.MayDecode(filter, overridingfilters, filters, policy):
+                        return NOT_DECODED
                     if filter:
                         if overridingfilters == '':
                             return self.Decompress(data, filters)
@@ -280,22 +666,24 @@ class IndirectObject:
                     else:
                         return data
                 else:
-                    data += self.content[i][1]
+                    data.append(value)
             else:
                 return 'Unexpected filter state'
         return filters
 
     def Decompress(self, data, filters):
+        data = decode.AsBytes(data)
         for filter in filters:
             cFilter = Canonicalize(filter)
+            start = time.perf_counter()
             if cFilter == '/FlateDecode' or cFilter == '/Fl':
                 try:
                     data = decode.FlateDecode(data)
                 except zlib.error as e:
                     message = 'FlateDecode decompress failed'
-                    if len(data) > 0 and ord(data[0]) & 0x0F != 8:
-                        message += ', unexpected compression method: %02x' % ord(data[0])
-                    return message + '. zlib.error %s' % e.message
+                    if len(data) > 0 and data[0] & 0x0F != 8:
+                        message += ', unexpected compression method: %02x' % data[0]
+                    return message + '. zlib.error %s' % e
             elif cFilter == '/ASCIIHexDecode' or cFilter == '/AHx':
                 try:
                     data = decode.ASCIIHexDecode(data)
@@ -303,7 +691,7 @@ class IndirectObject:
                     return 'ASCIIHexDecode decompress failed'
             elif cFilter == '/ASCII85Decode' or cFilter == '/A85':
                 try:
-                    data = decode.ASCII85Decode(data.rstrip('>'))
+                    data = decode.ASCII85Decode(data)
                 except:
                     return 'ASCII85Decode decompress failed'
             elif cFilter == '/LZWDecode' or cFilter == '/LZW':
@@ -320,6 +708,8 @@ class IndirectObject:
             # elif i.startswith('/DCT')                       # DCTDecode
             else:
                 return 'Unsupported filter: %s' % repr(filters)
+            if stats.collector != None:
+                stats.collector.AddTime('decode %s' % cFilter, time.perf_counter() - start)
         if len(filters) == 0:
             return 'No filters'
         else:
@@ -331,30 +721,254 @@ class IndirectObject:
             print(' Containing /ObjStm: %d %d' % self.objstm)
         print(' Type: %s' % Canonicalize(self.GetType()))
         print(' Referencing: %s' % ', '.join(map(lambda x: '%s %s %s' % x, self.GetReferences())))
-        dataPrecedingStream = self.ContainsStream()
-        oPDFParseDictionary = None
-        if dataPrecedingStream:
+        if self.ContainsStream():
             print(' Contains stream')
-            oPDFParseDictionary = ParseDictionary(dataPrecedingStream, False)
-        else:
-            oPDFParseDictionary = ParseDictionary(self.content, False)
         print('')
-        oPDFParseDictionary.PrettyPrint('  ')
+        self.GetDictionary().PrettyPrint('  ')
         print('')
 
 
+class LazyIndirectObject(IndirectObject):
+    """
+    LazyIndirectObject is an IndirectObject that only keeps the offsets of its content in the document, together with
+    its type. The content tokens are built the first time they are needed and kept afterwards.
+    """
+
+    def __init__(self, id, version, document, start, dictionaryEnd, end, type, objstm=None):
+        self.type = PDF_ELEMENT_INDIRECT_OBJECT
+        self.id = id
+        self.version = version
+        self.objstm = objstm
+        self.document = document
+        self.start = start
+        self.dictionaryEnd = dictionaryEnd
+        self.end = end
+        self.objectType = type
+        self.tokens = None
+        self.raw = None
+        self.metadata = None
+
+    @property
+    def content(self):
+        if self.tokens is None:
+            oPDFParser = parser.Parser(parser.Document(self.document.data), self.objstm)
+            self.tokens = oPDFParser.GetObjectContent(self.id, self.version, self.start)
+        return self.tokens
+
+    @content.setter
+    def content(self, content):
+        self.tokens = content
+
+    def IsMaterialized(self):
+        return self.tokens is not None
+
+    def RawContent(self):
+        return memoryview(self.document.data)[self.start:self.end]
+
+    def GetType(self):
+        if self.tokens is None:
+            return self.objectType
+        return IndirectObject.GetType(self)
+
+    def ContainsStream(self):
+        # the parser only ends the dictionary before the end of the content at a stream keyword
+        if self.tokens is None:
+            return self.dictionaryEnd != self.end
+        return IndirectObject.ContainsStream(self)
+
+    def StreamDictionary(self):
+        # the stream dictionary of an object that was not tokenized is tokenized without the stream
+        if self.tokens is None:
+            return self.dictionaryEnd != self.end and self.DictionaryTokens()
+        return IndirectObject.StreamDictionary(self)
+
+    def DictionaryTokens(self):
+        return parser.NameTokens(self.document.data[self.start:self.dictionaryEnd])
+
+    def GetReferences(self):
+        # the references of an object that was not tokenized are found without tokenizing the stream
+        if self.tokens is None and self.dictionaryEnd != self.end:
+            return IndirectObject(self.id, self.version, self.DictionaryTokens()).GetReferences()
+        return IndirectObject.GetReferences(self)
+
+    def GetDictionary(self):
+        # the stream dictionary of an object that was not tokenized is parsed without tokenizing the stream
+        if self.tokens is None and self.dictionaryEnd != self.end:
+            return ParseDictionary(self.DictionaryTokens(), False)
+        return IndirectObject.GetDictionary(self)
+
+    def StreamBody(self):
+        """
+        StreamBody returns a memoryview of the stream in the document when the object was not tokenized.
+        """
+        if self.tokens is not None:
+            return IndirectObject.StreamBody(self)
+        if self.dictionaryEnd == self.end:
+            return None
+        data = self.document.data
+        span = parser.StreamBody(data, self.document.size, self.dictionaryEnd + len('stream'), parser.DirectLength(self.DictionaryTokens()))
+        if span == None:
+            return None
+        return memoryview(data)[span[0]:span[1]]
+
+
+class ObjectStream:
+    """
+    ObjectStream gives random access to the objects stored in an /ObjStm. The stream is decoded and its /N and
+    /First header is parsed once; objects are then cut out of a memoryview of the decoded data by index.
+    """
+
+    def __init__(self, obj):
+        self.objstm = (obj.id, obj.version)
+        oPDFParseDictionary = obj.GetDictionary()
+        numberOfObjects = int(oPDFParseDictionary.Get('/N')[0])
+        self.first = int(oPDFParseDictionary.Get('/First')[0])
+        data = obj.Stream()
+        if data == 'No filters':
+            data = obj.Stream(False)
+        if type(data) == str:
+            data = data.encode('latin-1')
+        self.data = memoryview(data)
+        indexes = [int(value) for value in bytes(self.data[:self.first]).split()]
+        if len(indexes) % 2 != 0 or len(indexes) // 2 != numberOfObjects:
+            raise Exception('Error in index of /ObjStm stream')
+        self.numbers = array.array('q', indexes[0::2])
+        self.offsets = array.array('q', indexes[1::2])
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def GetData(self, index):
+        """
+        GetData returns a memoryview of the text of the object at the given index.
+        """
+        start = self.first + self.offsets[index]
+        if index + 1 < len(self.offsets):
+            end = self.first + self.offsets[index + 1]
+        else:
+            end = len(self.data)
+        return self.data[start:end]
+
+    def GetObject(self, index):
+        """
+        GetObject parses the object at the given index.
+        """
+        return ObjectStream.NewObject(self.numbers[index], self.GetData(index), self.objstm)
+
+    @staticmethod
+    def NewObject(number, data, objstm):
+        """
+        NewObject parses the text of an object of an /ObjStm. Like an object read from the file, its content starts
+        and ends with a whitespace token.
+        """
+        raw = b'\n' + data + b'\n'
+        obj = IndirectObject(number, 0, parser.NameTokens(raw), objstm)
+        obj.raw = raw
+        return obj
+
+    def Index(self, number):
+        """
+        Index returns the index of the object with the given number, or None.
+        """
+        try:
+            return self.numbers.index(number)
+        except ValueError:
+            return None
+
+    def Objects(self):
+        for index in range(len(self.numbers)):
+            yield self.GetObject(index)
+
+    @staticmethod
+    def StreamObjects(obj, chunkSize=decode.CHUNK_SIZE, wanted=None):
+        """
+        StreamObjects yields the objects stored in an /ObjStm in order, like Objects, but decodes the stream one chunk
+        at a time and only keeps the objects that are not complete yet, so that memory is bounded by the chunk size
+        and the largest object instead of by the decoded stream. It falls back to a decoded ObjectStream when the
+        offsets are not in increasing order or the stream cannot be decoded in chunks. When wanted is given, it flags
+        by index the objects to yield, and the others are skipped without being parsed.
+        """
+        count = 0
+        try:
+            for object in ObjectStream.ReadObjects(obj, chunkSize, wanted):
+                yield object
+                count += 1
+            return
+        except Exception:
+            if count > 0:
+                raise
+        oObjectStream = ObjectStream(obj)
+        for index in range(len(oObjectStream)):
+            if wanted == None or (index < len(wanted) and wanted[index]):
+                yield oObjectStream.GetObject(index)
+
+    @staticmethod
+    def ReadObjects(obj, chunkSize, wanted=None):
+        objstm = (obj.id, obj.version)
+        oPDFParseDictionary = obj.GetDictionary()
+        numberOfObjects = int(oPDFParseDictionary.Get('/N')[0])
+        first = int(oPDFParseDictionary.Get('/First')[0])
+        chunks = obj.StreamChunks(chunkSize=chunkSize)
+        if chunks == None:
+            return
+        buffer = bytearray()
+        for chunk in chunks:
+            buffer += chunk
+            if len(buffer) >= first:
+                break
+        indexes = [int(value) for value in bytes(buffer[:first]).split()]
+        if len(indexes) % 2 != 0 or len(indexes) // 2 != numberOfObjects:
+            raise Exception('Error in index of /ObjStm stream')
+        numbers = indexes[0::2]
+        offsets = indexes[1::2]
+        if offsets != sorted(offsets):
+            raise Exception('Offsets of /ObjStm stream not in order')
+        del buffer[:first]
+        # the offset of the first byte of buffer, relative to /First
+        position = 0
+        for index in range(numberOfObjects):
+            if index + 1 < numberOfObjects:
+                end = offsets[index + 1]
+                while position + len(buffer) < end:
+                    chunk = next(chunks, None)
+                    if chunk == None:
+                        break
+                    buffer += chunk
+            else:
+                for chunk in chunks:
+                    buffer += chunk
+                end = position + len(buffer)
+            if wanted == None or (index < len(wanted) and wanted[index]):
+                data = bytes(buffer[offsets[index] - position:end - position])
+                yield ObjectStream.NewObject(numbers[index], data, objstm)
+            del buffer[:end - position]
+            position = end
+
+
 class ParseDictionary:
+    """
+    ParseDictionary parses the dictionary in the given content into a list of (key, value) pairs in document order,
+    parsed, where a value is a list of token texts or, for a nested dictionary, a list of pairs again. The tokens are
+    walked once with an index, and the keys of the outer dictionary are indexed for Get.
+    """
+
     def __init__(self, content, nocanonicalizedoutput):
-        self.content = content
+        self.content = AsTokenList(content)
         self.nocanonicalizedoutput = nocanonicalizedoutput
         dataTrimmed = TrimLWhiteSpace(TrimRWhiteSpace(self.content))
-        if dataTrimmed == []:
+        if len(dataTrimmed) == 0:
             self.parsed = None
         elif self.isOpenDictionary(dataTrimmed[0]) and (self.isCloseDictionary(dataTrimmed[-1]) or self.couldBeCloseDictionary(dataTrimmed[-1])):
             self.parsed = self.ParseDictionary(dataTrimmed)[0]
         else:
             self.parsed = None
         # print("self.parsed: ", self.parsed)
+        self.keys = {}
+        if self.parsed != None:
+            for key, value in self.parsed:
+                # like a scan of the pairs, Get returns the first value of a repeated key
+                if key not in self.keys:
+                    self.keys[key] = value
 
     def isOpenDictionary(self, token):
         return token[0] == CHAR_DELIMITER and token[1] == '<<'
@@ -365,53 +979,66 @@ class ParseDictionary:
     def couldBeCloseDictionary(self, token):
         return token[0] == CHAR_DELIMITER and token[1].rstrip().endswith('>>')
 
-    def ParseDictionary(self, tokens):
+    def ParseDictionary(self, tokens, index=0):
+        """
+        ParseDictionary parses the dictionary opening at tokens[index] and returns it with the index of its closing
+        >>, or None and the index of the token where parsing stopped. Nested dictionaries are parsed by recursion on
+        the same tokens.
+        """
         state = 0 # start
         dictionary = []
-        while tokens != []:
+        kinds = tokens.kinds
+        values = tokens.values
+        while index < len(values):
+            kind = kinds[index]
+            text = values[index]
             if state == 0:
-                if self.isOpenDictionary(tokens[0]):
+                if kind == CHAR_DELIMITER and text == '<<':
                     state = 1
                 else:
-                    return None, tokens
+                    return None, index
             elif state == 1:
-                if self.isOpenDictionary(tokens[0]):
+                if kind == CHAR_DELIMITER and text == '<<':
                     pass
-                elif self.isCloseDictionary(tokens[0]):
-                    return dictionary, tokens
-                elif tokens[0][0] != CHAR_WHITESPACE:
-                    key = Canonicalize(tokens[0][1])
+                elif kind == CHAR_DELIMITER and text == '>>':
+                    return dictionary, index
+                elif kind != CHAR_WHITESPACE:
+                    key = Canonicalize(text)
                     value = []
                     state = 2
             elif state == 2:
-                if self.isOpenDictionary(tokens[0]):
-                    value, tokens = self.ParseDictionary(tokens)
+                if kind == CHAR_DELIMITER and text == '<<':
+                    value, index = self.ParseDictionary(tokens, index)
                     dictionary.append((key, value))
                     state = 1
-                elif self.isCloseDictionary(tokens[0]):
+                elif kind == CHAR_DELIMITER and text == '>>':
                     dictionary.append((key, value))
-                    return dictionary, tokens
-                elif value == [] and tokens[0][0] == CHAR_WHITESPACE:
+                    return dictionary, index
+                elif value == [] and kind == CHAR_WHITESPACE:
                     pass
-                elif value == [] and tokens[0][1] == '[':
-                    value.append(tokens[0][1])
-                elif value != [] and value[0] == '[' and tokens[0][1] != ']':
-                    value.append(tokens[0][1])
-                elif value != [] and value[0] == '[' and tokens[0][1] == ']':
-                    value.append(tokens[0][1])
+                elif value == [] and text == '[':
+                    value.append(text)
+                elif value != [] and value[0] == '[' and text != ']':
+                    value.append(text)
+                elif value != [] and value[0] == '[' and text == ']':
+                    value.append(text)
                     dictionary.append((key, value))
                     value = []
                     state = 1
-                elif value == [] and tokens[0][1] == '(':
-                    value.append(tokens[0][1])
-                elif value != [] and value[0] == '(' and tokens[0][1] != ')':
-                    if tokens[0][1][0] == '%':
-                        tokens = [tokens[0]] + parser.Tokenizer(StringIO(tokens[0][1][1:])).Tokens() + tokens[1:]
+                elif value == [] and text == '(':
+                    value.append(text)
+                elif value != [] and value[0] == '(' and text != ')':
+                    if text[0] == '%':
+                        # a % inside a string is not a comment: the rest of the text is tokenized again, in place
+                        comment = AsTokenList(parser.Tokenizer(text[1:].encode('latin-1')).Tokens())
+                        kinds[index + 1:index + 1] = comment.kinds
+                        values[index + 1:index + 1] = comment.values
+                        tokens.revision += 1
                         value.append('%')
                     else:
-                        value.append(tokens[0][1])
-                elif value != [] and value[0] == '(' and tokens[0][1] == ')':
-                    value.append(tokens[0][1])
+                        value.append(text)
+                elif value != [] and value[0] == '(' and text == ')':
+                    value.append(text)
                     balanced = 0
                     for item in value:
                         if item == '(':
@@ -424,14 +1051,15 @@ class ParseDictionary:
                         dictionary.append((key, value))
                         value = []
                         state = 1
-                elif value != [] and tokens[0][1][0] == '/':
+                elif value != [] and text[0] == '/':
                     dictionary.append((key, value))
-                    key = Canonicalize(tokens[0][1])
+                    key = Canonicalize(text)
                     value = []
                     state = 2
                 else:
-                    value.append(Canonicalize(tokens[0][1]))
-            tokens = tokens[1:]
+                    value.append(Canonicalize(text))
+            index += 1
+        return None, index
 
     def Retrieve(self):
         return self.parsed
@@ -464,10 +1092,7 @@ class ParseDictionary:
         self.PrettyPrintSub(prefix, self.parsed)
 
     def Get(self, select):
-        for key, value in self.parsed:
-            if key == select:
-                return value
-        return None
+        return self.keys.get(select)
 
     def GetNestedSub(self, dictionary, select):
         for key, value in dictionary:
@@ -0,0 +1,87 @@
+import json
+import threading
+
+# the collector of the document being processed, None when statistics are off
+collector = None
+
+
+class Statistics:
+    """
+    Statistics collects named counters, and timers that add up the calls and seconds of a named operation. The
+    instrumented code reaches the active instance through the module-level collector, and does nothing when it is
+    None.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+
+    def Count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def AddTime(self, name, seconds, calls=1):
+        with self.lock:
+            previousCalls, previousSeconds = self.timers.get(name, (0, 0.0))
+            self.timers[name] = (previousCalls + calls, previousSeconds + seconds)
+
+    def Snapshot(self):
+        """
+        Snapshot returns the counters and timers as a dictionary that can be pickled, printed as JSON or merged into
+        another collector.
+        """
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'timers': dict((name, {'calls': calls, 'seconds': seconds}) for name, (calls, seconds) in self.timers.items()),
+            }
+
+    def Merge(self, snapshot):
+        """
+        Merge adds the counters and timers of a snapshot, e.g. one taken in a worker process.
+        """
+        for name, amount in snapshot['counters'].items():
+            self.Count(name, amount)
+        for name, timer in snapshot['timers'].items():
+            self.AddTime(name, timer['seconds'], timer['calls'])
+
+    def Summary(self, title):
+        """
+        Summary returns the counters and timers as lines of text for people to read.
+        """
+        snapshot = self.Snapshot()
+        lines = ['Statistics for %s:' % title]
+        for name in sorted(snapshot['counters']):
+            lines.append('  %-40s %12d' % (name, snapshot['counters'][name]))
+        for name in sorted(snapshot['timers']):
+            timer = snapshot['timers'][name]
+            lines.append('  %-40s %12.4f s  %d calls' % (name, timer['seconds'], timer['calls']))
+        return '\n'.join(lines)
+
+    def JSONLine(self, title):
+        """
+        JSONLine returns the counters and timers as a single line of JSON, with the document name under 'document'.
+        """
+        snapshot = self.Snapshot()
+        snapshot['document'] = title
+        return json.dumps(snapshot, sort_keys=True)
+
+
+def Start():
+    """
+    Start makes a new Statistics the active collector and returns it.
+    """
+    global collector
+    collector = Statistics()
+    return collector
+
+
+def Stop():
+    """
+    Stop turns statistics off and returns the collector that was active.
+    """
+    global collector
+    previous = collector
+    collector = None
+    return previous
@@ -0,0 +1,182 @@
+import json
+import math
+import optparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import generate
+
+__description__ = 'stress runs the font destroyer over synthetic documents of growing size and fails on superlinear time or memory'
+
+MAX_TIME_EXPONENT = 1.15
+MAX_MEMORY_EXPONENT = 1.3
+# the peak memory of the scenarios that stream their largest parts must not grow with the swept parameter
+FLAT_MEMORY_EXPONENT = 0.1
+# the time of a run is the best CPU time of this many runs, so that other load on the machine does not tilt the time
+# exponent
+TIME_RUNS = 3
+# below these, timings and memory growth are dominated by noise and fixed costs, and are not checked
+MIN_CHECKED_SECONDS = 0.2
+MIN_CHECKED_MEMORY_KB = 1024
+
+# Each scenario sweeps one parameter of generate.GeneratePDF over the given values (multiplied by --scale), with the
+# other parameters fixed, runs the font destroyer with the given options and checks the memory exponent against the
+# given limit, or against --max-memory-exponent when it is None.
+SCENARIOS = [
+    ('objects', 'objects', [2500, 5000, 10000, 20000], {'pages': 10, 'fonts': 10}, {}, None),
+    ('objstm', 'objects', [2500, 5000, 10000, 20000], {'pages': 10, 'fonts': 10, 'objectsPerStream': 100}, {'xref': True}, None),
+    ('compress', 'objects', [2500, 5000, 10000, 20000], {'pages': 10, 'fonts': 10}, {'compress': True}, None),
+    ('pages', 'pages', [500, 1000, 2000, 4000], {'objects': 0, 'fonts': 4, 'streamSize': 1024, 'filters': ('flate', 'lzw', 'ascii85', 'runlength', 'none')}, {'reserialize': True}, None),
+    ('widths', 'widths', [2500, 5000, 10000, 20000], {'objects': 0, 'pages': 2, 'fonts': 20}, {'reserialize': True}, FLAT_MEMORY_EXPONENT),
+    ('dictionary', 'widths', [1000, 2000, 4000, 8000], {'objects': 0, 'pages': 2, 'fonts': 4}, {'print': True}, None),
+    ('streams', 'streamSize', [2 ** 20, 2 ** 21, 2 ** 22, 2 ** 23], {'objects': 0, 'pages': 4, 'fonts': 2, 'filters': ('none', 'flate')}, {}, FLAT_MEMORY_EXPONENT),
+]
+
+
+def Exponent(sizes, values):
+    """
+    Exponent returns the slope of the least-squares line through the points (log size, log value), i.e. k in
+    value ~ size ** k.
+    """
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(value, 1e-9)) for value in values]
+    meanX = sum(xs) / len(xs)
+    meanY = sum(ys) / len(ys)
+    denominator = sum((x - meanX) ** 2 for x in xs)
+    if denominator == 0:
+        return 0.0
+    return sum((x - meanX) * (y - meanY) for x, y in zip(xs, ys)) / denominator
+
+
+def MeasureRun(options, input, output):
+    """
+    MeasureRun runs the font destroyer with the given options (a dict) on input and returns the best CPU time of
+    TIME_RUNS runs, the peak memory allocated by Python during a further run under tracemalloc, and the number of
+    objects found in the output. It is meant to run in a fresh process (see Run).
+    """
+    import destroyer
+    import parser
+    import xref
+
+    values = {'print': False}
+    values.update(options)
+    seconds = None
+    for run in range(TIME_RUNS):
+        start = time.process_time()
+        result = destroyer.FontDestroyer(optparse.Values(values)).UpdatePDF(input, output)
+        elapsed = time.process_time() - start
+        if result == False:
+            raise Exception('No document catalog found in %s' % input)
+        seconds = elapsed if seconds == None else min(seconds, elapsed)
+    tracemalloc.start()
+    destroyer.FontDestroyer(optparse.Values(values)).UpdatePDF(input, output)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    oCrossReference = xref.CrossReference(parser.Parser(output, lazy=True))
+    objects = len([number for number in range(len(oCrossReference)) if oCrossReference.Kind(number) in (xref.XREF_ENTRY_IN_USE, xref.XREF_ENTRY_COMPRESSED)])
+    return {'seconds': seconds, 'memory_kb': peak // 1024, 'objects': objects}
+
+
+def Run(options, input, output):
+    """
+    Run measures one run of the font destroyer in a child process, started in this directory so that it finds
+    EmptyToUnicode.txt.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, os.path.abspath(__file__), '--child', json.dumps(options), input, output]
+    oProcess = subprocess.run(command, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if oProcess.returncode != 0:
+        raise Exception('Font destroyer failed on %s:\n%s' % (input, oProcess.stderr))
+    return json.loads(oProcess.stdout.strip().splitlines()[-1])
+
+
+def RunScenario(scenario, scale, directory, maxTimeExponent, maxMemoryExponent):
+    """
+    RunScenario generates the documents of one scenario, runs the font destroyer on each and checks how its time and
+    memory grow with the input size. It returns a list of failure messages.
+    """
+    name, parameter, values, fixed, options, scenarioMemoryExponent = scenario
+    failures = []
+    sizes = []
+    seconds = []
+    memory = []
+    for value in values:
+        value = max(1, int(value * scale))
+        arguments = dict(fixed)
+        arguments[parameter] = value
+        input = os.path.join(directory, '%s-%d.pdf' % (name, value))
+        output = os.path.join(directory, '%s-%d-output.pdf' % (name, value))
+        objects = generate.GeneratePDF(input, **arguments)
+        result = Run(options, input, output)
+        size = os.path.getsize(input)
+        print('%-10s %-10s %10d %12d %8d %10.3f %12s' % (name, parameter, value, size, objects, result['seconds'], result['memory_kb']))
+        if result['objects'] < objects:
+            failures.append('%s: output of %s has %d objects, expected at least %d' % (name, input, result['objects'], objects))
+        sizes.append(size)
+        seconds.append(result['seconds'])
+        memory.append(result['memory_kb'])
+        os.remove(input)
+        os.remove(output)
+
+    exponent = Exponent(sizes, seconds)
+    if max(seconds) >= MIN_CHECKED_SECONDS and exponent > maxTimeExponent:
+        failures.append('%s: time grows as size ** %.2f (limit %.2f)' % (name, exponent, maxTimeExponent))
+    print('%-10s time exponent %.2f' % (name, exponent))
+    # flat memory is checked however small it stays
+    if scenarioMemoryExponent != None:
+        maxMemoryExponent = min(maxMemoryExponent, scenarioMemoryExponent)
+    if max(memory) >= MIN_CHECKED_MEMORY_KB or scenarioMemoryExponent != None:
+        exponent = Exponent(sizes, [max(kb, 1) for kb in memory])
+        if exponent > maxMemoryExponent:
+            failures.append('%s: memory grows as size ** %.2f (limit %.2f)' % (name, exponent, maxMemoryExponent))
+        print('%-10s memory exponent %.2f' % (name, exponent))
+    return failures
+
+
+def Main():
+    """Main runs the selected scenarios and exits with status 1 when any of them fails."""
+
+    oParser = optparse.OptionParser(usage='usage: %prog [options] [scenario ...]\n' + __description__)
+    oParser.add_option('-s', '--scale', type='float', default=1.0, help='multiply the swept values by this factor (default: %default)')
+    oParser.add_option('-t', '--max-time-exponent', type='float', default=MAX_TIME_EXPONENT, help='fail when time grows faster than size ** this (default: %default)')
+    oParser.add_option('-m', '--max-memory-exponent', type='float', default=MAX_MEMORY_EXPONENT, help='fail when memory grows faster than size ** this, or than the lower limit of a scenario (default: %default)')
+    oParser.add_option('-d', '--directory', type='string', default=None, help='directory for the generated documents (default: a temporary directory)')
+    oParser.add_option('--child', type='string', default=None, help=optparse.SUPPRESS_HELP)
+    (options, args) = oParser.parse_args()
+
+    if options.child != None:
+        print(json.dumps(MeasureRun(json.loads(options.child), args[0], args[1])))
+        return
+
+    scenarios = [scenario for scenario in SCENARIOS if args == [] or scenario[0] in args]
+    if scenarios == []:
+        oParser.error('no scenario selected, choose from: %s' % ', '.join(scenario[0] for scenario in SCENARIOS))
+
+    directory = options.directory
+    if directory == None:
+        directory = tempfile.mkdtemp(prefix='stress-')
+    failures = []
+    try:
+        print('%-10s %-10s %10s %12s %8s %10s %12s' % ('scenario', 'parameter', 'value', 'bytes', 'objects', 'seconds', 'memory KB'))
+        for scenario in scenarios:
+            failures += RunScenario(scenario, options.scale, directory, options.max_time_exponent, options.max_memory_exponent)
+    finally:
+        if options.directory == None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print('')
+    for failure in failures:
+        print('FAILED  %s' % failure)
+    print('%d scenarios, %d failures' % (len(scenarios), len(failures)))
+    if failures != []:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    Main()
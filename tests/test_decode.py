@@ -0,0 +1,104 @@
+import random
+import unittest
+import zlib
+
+import decode
+import generate
+import parser
+import pdf_objects
+from test_parser import BuildPDF
+
+
+def ContentStream(lines=20000):
+    """
+    ContentStream returns the text of a page that inflates to a few hundred KB, in several deflate blocks.
+    """
+    generator = random.Random(1)
+    return b''.join(b'%d %d Td (word %d) Tj\n' % (generator.randrange(600), generator.randrange(800), line) for line in range(lines))
+
+
+def Inflate(data, chunkSize=4096):
+    """
+    Inflate decodes data with the FlateDecoder of DecodeChunks, fed in chunks of 1000 bytes.
+    """
+    return b''.join(decode.DecodeChunks(decode.Chunks(data, 1000), ['/FlateDecode'], chunkSize))
+
+
+class TestFlateRecovery(unittest.TestCase):
+    def setUp(self):
+        self.plain = ContentStream()
+        self.compressed = zlib.compress(self.plain)
+
+    def testTruncatedInBlock(self):
+        data = self.compressed[:len(self.compressed) // 2]
+        output, lost = decode.FlateRecover(data)
+        self.assertEqual(lost, 0)
+        self.assertTrue(len(output) > 0)
+        self.assertTrue(self.plain.startswith(output))
+        self.assertEqual(decode.FlateDecode(data), output)
+        self.assertEqual(Inflate(data), output)
+
+    def testShortTruncated(self):
+        data = self.compressed[:decode.FLATE_MIN_RECOVERED]
+        self.assertRaises(zlib.error, decode.FlateDecode, data)
+        self.assertRaises(zlib.error, Inflate, data)
+        self.assertRaises(zlib.error, Inflate, b'')
+
+    def testCorruptedChecksum(self):
+        data = self.compressed[:-2] + b'\xff\xff'
+        output, lost = decode.FlateRecover(data)
+        self.assertTrue(lost <= decode.FLATE_MAX_LOST)
+        self.assertEqual(output, self.plain)
+        self.assertEqual(decode.FlateDecode(data), self.plain)
+        self.assertEqual(Inflate(data), self.plain)
+
+    def testCorruptedTail(self):
+        data = self.compressed[:-100] + b'\x0f' * 100
+        output, lost = decode.FlateRecover(data)
+        self.assertTrue(lost > decode.FLATE_MAX_LOST)
+        self.assertTrue(self.plain.startswith(output))
+        self.assertRaises(zlib.error, decode.FlateDecode, data)
+        self.assertRaises(zlib.error, Inflate, data)
+
+    def testIntact(self):
+        self.assertEqual(decode.FlateRecover(self.compressed), (self.plain, 0))
+        self.assertEqual(Inflate(self.compressed), self.plain)
+        self.assertEqual(Inflate(self.compressed, 100), self.plain)
+
+
+class TestLZW(unittest.TestCase):
+    def setUp(self):
+        # a few thousand distinct words fill the table of 4096 codes long before the end of the data
+        generator = random.Random(2)
+        words = [bytes(generator.randrange(97, 123) for i in range(generator.randrange(2, 9))) for word in range(3000)]
+        self.plain = b' '.join(generator.choice(words) for word in range(20000))
+
+    def testFullTable(self):
+        data = generate.LZWEncode(self.plain, clear=False)
+        self.assertEqual(decode.LZWDecode(data), self.plain)
+        self.assertEqual(b''.join(decode.DecodeChunks(decode.Chunks(data, 777), ['/LZWDecode'], 1000)), self.plain)
+
+    def testClearedTable(self):
+        data = generate.LZWEncode(self.plain)
+        self.assertEqual(decode.LZWDecode(data), self.plain)
+        self.assertEqual(b''.join(decode.DecodeChunks(decode.Chunks(data, 777), ['/LZWDecode'], 1000)), self.plain)
+
+
+class TestDecodePolicy(unittest.TestCase):
+
+    def testExplicitPolicy(self):
+        data = zlib.compress(b'BT ET')
+        oPDFParser = parser.Parser(parser.Document(BuildPDF([b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(data), data)])))
+        object = oPDFParser.GetObject()
+        while object.type != pdf_objects.PDF_ELEMENT_INDIRECT_OBJECT:
+            object = oPDFParser.GetObject()
+        policy = pdf_objects.decodePolicy
+        self.assertEqual(object.Stream(), pdf_objects.NOT_DECODED)
+        self.assertEqual(object.Stream(policy=pdf_objects.DecodePolicy(pdf_objects.STREAM_CLASSES)), b'BT ET')
+        self.assertEqual(b''.join(object.StreamChunks(policy=pdf_objects.DecodePolicy(pdf_objects.STREAM_CLASSES))), b'BT ET')
+        self.assertRaises(Exception, object.StreamChunks)
+        self.assertIs(pdf_objects.decodePolicy, policy)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import io
+import optparse
+import os
+import shutil
+import tempfile
+import unittest
+
+import destroyer
+import generate
+import parser
+import write
+import xref
+from test_parser import BuildPDF, STREAM_IN_STRING
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class DestroyerTestCase(unittest.TestCase):
+    """
+    DestroyerTestCase runs the font destroyer from the repository, where it finds EmptyToUnicode.txt, and writes its
+    outputs to a temporary directory.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='fontdestroy-test-')
+        self.cwd = os.getcwd()
+        os.chdir(REPOSITORY)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def Path(self, name, data=None):
+        path = os.path.join(self.directory, name)
+        if data != None:
+            with open(path, 'wb') as f:
+                f.write(data)
+        return path
+
+    def Destroy(self, input, name='output.pdf', **options):
+        values = {'print': False}
+        values.update(options)
+        output = self.Path(name)
+        self.assertTrue(destroyer.FontDestroyer(optparse.Values(values)).UpdatePDF(input, output))
+        return output
+
+
+class TestRewrite(DestroyerTestCase):
+
+    def testStreamInsideString(self):
+        output = self.Destroy(self.Path('input.pdf', BuildPDF(STREAM_IN_STRING)))
+        oCrossReference = xref.CrossReference(parser.Parser(output, lazy=True))
+        for number in range(1, 6):
+            self.assertNotEqual(oCrossReference.GetObject(number), None)
+        self.assertEqual(oCrossReference.GetObject(1).GetType(), '/Catalog')
+
+
+class TestWriteFont(unittest.TestCase):
+    # the endings of a font dictionary, and whether /ToUnicode can be added without tokenizing the font
+    ENDINGS = [
+        (b'/Widths [500 600] >>', True),
+        (b'/Widths [500 600]>>', True),
+        (b'/A << /B 1 >>>>', True),
+        (b'/A <41>>>', False),
+        (b'/A 1 % comment >>', False),
+        (b'/A 1 >>\n% comment', False),
+        (b'/A (x\r% y) >>', False),
+        (b'/A (x%\r y) >>', True),
+        (b'/A 1 >>\x00\r\n', True),
+    ]
+
+    def Font(self, ending):
+        data = BuildPDF([b'<< /Type /Catalog >>', b'<< /Type /Font /Subtype /Type1 ' + ending])
+        oPDFParser = parser.Parser(parser.Document(data), lazy=True)
+        objects = []
+        object = oPDFParser.GetObject()
+        while object != None:
+            if object.type == destroyer.PDF_ELEMENT_INDIRECT_OBJECT and object.id == 2:
+                objects.append(object)
+            object = oPDFParser.GetObject()
+        return objects[0]
+
+    def testSameAsTokens(self):
+        for compress in (False, True):
+            for ending, spliced in self.ENDINGS:
+                object = self.Font(ending)
+                self.assertEqual(destroyer.FontDestroyer.ToUnicodePosition(object) != None, spliced, ending)
+                outputs = []
+                for writeFont in (destroyer.FontDestroyer.WriteFont, lambda writer, object: writer.writeObject(object)):
+                    outfile = io.BytesIO()
+                    writer = write.Writer(outfile, destroyer.FontDestroyer.FormatFont, compress=compress)
+                    writeFont(writer, self.Font(ending))
+                    writer.close()
+                    outputs.append((outfile.getvalue(), writer.compressedObjects))
+                self.assertEqual(outputs[0], outputs[1], ending)
+
+
+class TestParallel(DestroyerTestCase):
+
+    def testSameAsSequential(self):
+        # streams larger than write.COPY_RANGE_THRESHOLD between runs of small objects
+        input = self.Path('input.pdf')
+        generate.GeneratePDF(input, objects=1000, pages=3, fonts=4, streamSize=1200 * 1024, filters=('none',))
+        for options in ({}, {'reserialize': True}, {'compress': True}):
+            with open(self.Destroy(input, 'sequential.pdf', **options), 'rb') as f:
+                sequential = f.read()
+            with open(self.Destroy(input, 'parallel.pdf', workers=3, **options), 'rb') as f:
+                self.assertTrue(f.read() == sequential, options)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+import graph
+import parser
+from test_parser import BuildPDF
+
+# page 4 inherits the font 7 from the /Resources of its parent 3, page 5 has a font of its own and page 6 is in a
+# sibling subtree whose fonts neither page reaches
+INHERITED_RESOURCES = [
+    b'<< /Type /Catalog /Pages 2 0 R >>',
+    b'<< /Type /Pages /Kids [3 0 R 9 0 R] /Count 3 /Resources << /Font << /F0 10 0 R >> >> >>',
+    b'<< /Type /Pages /Parent 2 0 R /Kids [4 0 R 5 0 R] /Count 2 /Resources << /Font << /F1 7 0 R >> >> >>',
+    b'<< /Type /Page /Parent 3 0 R >>',
+    b'<< /Type /Page /Parent 3 0 R /Resources << /Font << /F2 8 0 R >> >> >>',
+    b'<< /Type /Page /Parent 9 0 R /Resources << /Font << /F3 11 0 R >> >> >>',
+    b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>',
+    b'<< /Type /Pages /Parent 2 0 R /Kids [6 0 R] /Count 1 >>',
+    b'<< /Type /Font /Subtype /Type1 /BaseFont /Symbol >>',
+    b'<< /Type /Font /Subtype /Type1 /BaseFont /Times-Roman >>',
+]
+
+
+def ParseElements(data):
+    oPDFParser = parser.Parser(parser.Document(data))
+    elements = []
+    element = oPDFParser.GetObject()
+    while element != None:
+        elements.append(element)
+        element = oPDFParser.GetObject()
+    return elements
+
+
+class TestFontsOfPage(unittest.TestCase):
+    def setUp(self):
+        self.oGraph = graph.BuildGraph(ParseElements(BuildPDF(INHERITED_RESOURCES)))
+
+    def testPages(self):
+        self.assertEqual(self.oGraph.Pages(), [4, 5, 6])
+
+    def testInheritedFonts(self):
+        self.assertEqual(self.oGraph.FontsOfPage(0), [7, 10])
+        self.assertEqual(self.oGraph.FontsOfPage(1), [7, 8, 10])
+        self.assertEqual(self.oGraph.FontsOfPage(2), [10, 11])
+
+    def testOutOfRange(self):
+        self.assertRaises(Exception, self.oGraph.FontsOfPage, 3)
+
+    def testReferencing(self):
+        self.assertEqual(list(self.oGraph.Referencing(2)), [1, 3, 9])
+        self.assertEqual(list(self.oGraph.Referencing(3)), [2, 4, 5])
+        self.assertEqual(list(self.oGraph.Referencing(10)), [2])
+        self.assertEqual(list(self.oGraph.Referencing(1)), [])
+        self.assertEqual(list(self.oGraph.Referencing(self.oGraph.size)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
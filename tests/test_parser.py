@@ -0,0 +1,79 @@
+import unittest
+
+import parser
+
+PDF_ELEMENT_INDIRECT_OBJECT = 2
+
+
+def BuildPDF(objects, generations={}):
+    """
+    BuildPDF returns a PDF document holding the given object contents as objects 1, 2, ... with a cross-reference
+    table and a trailer naming object 1 as /Root. generations maps object numbers to generations other than 0.
+    """
+    data = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, content in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b'%d %d obj\n%s\nendobj\n' % (number, generations.get(number, 0), content)
+    startxref = len(data)
+    data += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for number, offset in enumerate(offsets, 1):
+        data += b'%010d %05d n \n' % (offset, generations.get(number, 0))
+    data += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, startxref)
+    return bytes(data)
+
+
+STREAM_IN_STRING = [
+    b'<< /Type /Catalog /Pages 2 0 R /Lang (live stream) >>',
+    b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+    b'<< /Type /Page /Parent 2 0 R /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>',
+    b'<< /Length 5 >>\nstream\nBT ET\nendstream',
+    b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+]
+
+
+def ParseObjects(data, lazy):
+    oPDFParser = parser.Parser(parser.Document(data), lazy=lazy)
+    objects = []
+    object = oPDFParser.GetObject()
+    while object != None:
+        if object.type == PDF_ELEMENT_INDIRECT_OBJECT:
+            objects.append(object)
+        object = oPDFParser.GetObject()
+    return objects
+
+
+class TestStreamKeyword(unittest.TestCase):
+
+    def testStreamInsideStringIsNotAKeyword(self):
+        objects = ParseObjects(BuildPDF(STREAM_IN_STRING), False)
+        self.assertEqual([object.id for object in objects], [1, 2, 3, 4, 5])
+        self.assertEqual([object.GetType() for object in objects], ['/Catalog', '/Pages', '/Page', '', '/Font'])
+        self.assertFalse(objects[0].ContainsStream())
+        self.assertTrue(objects[3].ContainsStream())
+        self.assertEqual(objects[3].Stream(False).strip(), 'BT ET')
+
+    def testLazyStreamInsideStringIsNotAKeyword(self):
+        data = BuildPDF(STREAM_IN_STRING)
+        objects = ParseObjects(data, True)
+        self.assertEqual([object.id for object in objects], [1, 2, 3, 4, 5])
+        catalog = objects[0]
+        self.assertEqual(catalog.dictionaryEnd, catalog.end)
+        self.assertTrue(data[catalog.start:catalog.end].strip().endswith(b'(live stream) >>'))
+        self.assertEqual(objects[3].StreamBody().tobytes(), b'BT ET')
+
+    def testFindKeyword(self):
+        cases = [
+            (b'<< /A (x \\) stream) >>\nstream\nab\nendstream\nendobj', b'stream', 23),
+            (b'<< /A <73747265616d> /B [(stream)] % stream\n>>stream\nab\nendstream\nendobj', b'stream', 46),
+            (b'(stream ( nested ) stream) endobj', b'endobj', 27),
+            (b'<< /L (endobj) >> endobj', b'endobj', 18),
+            (b'<< /A << /B 1 >> stream >> endobj', b'endobj', 27),
+        ]
+        for data, keyword, start in cases:
+            oMatch = parser.FindKeyword(data, 0)
+            self.assertEqual((oMatch.group(), oMatch.start()), (keyword, start), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import io
+import re
+import unittest
+
+import parser
+import write
+import xref
+from test_destroyer import DestroyerTestCase
+from test_parser import BuildPDF, STREAM_IN_STRING
+
+TEST_FILE = 'test_files/icml2006.pdf'
+
+
+def Startxref(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    return data, int(re.findall(rb'startxref\s+(\d+)', data)[-1])
+
+
+class TestXrefStream(DestroyerTestCase):
+
+    def assertStartxrefOnObject(self, path):
+        data, startxref = Startxref(path)
+        self.assertRegex(data[startxref:startxref + 20], rb'^\d+ 0 obj')
+        xref.CrossReference(parser.Parser(path, lazy=True))
+
+    def testCompress(self):
+        self.assertStartxrefOnObject(self.Destroy(TEST_FILE, compress=True))
+
+    def testIncrementalOfXrefStream(self):
+        compressed = self.Destroy(TEST_FILE, 'compressed.pdf', compress=True)
+        self.assertStartxrefOnObject(self.Destroy(compressed, incremental=True))
+
+    def testIncrementalCompressRaisesHeader(self):
+        input = self.Path('input.pdf', BuildPDF(STREAM_IN_STRING))
+        output = self.Destroy(input, incremental=True, compress=True)
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(9), b'%PDF-1.5\n')
+        self.assertStartxrefOnObject(output)
+
+
+class TestGenerations(DestroyerTestCase):
+
+    def BuildInput(self):
+        objects = list(STREAM_IN_STRING)
+        objects[2] = objects[2].replace(b'/F1 5 0 R', b'/F1 5 3 R')
+        return self.Path('input.pdf', BuildPDF(objects, {5: 3}))
+
+    def assertFontGeneration(self, output):
+        oCrossReference = xref.CrossReference(parser.Parser(output, lazy=True))
+        self.assertEqual(oCrossReference.Kind(5), xref.XREF_ENTRY_IN_USE)
+        self.assertEqual(oCrossReference.generations[5], 3)
+        self.assertEqual(oCrossReference.GetObject(5).version, 3)
+
+    def testIncremental(self):
+        self.assertFontGeneration(self.Destroy(self.BuildInput(), incremental=True))
+
+    def testIncrementalCompress(self):
+        self.assertFontGeneration(self.Destroy(self.BuildInput(), incremental=True, compress=True))
+
+    def testRewrite(self):
+        self.assertFontGeneration(self.Destroy(self.BuildInput(), workers=2))
+
+
+class TestCopyObject(unittest.TestCase):
+
+    def testCompressWithoutTokens(self):
+        oCrossReference = xref.CrossReference(parser.Parser(parser.Document(BuildPDF(STREAM_IN_STRING)), lazy=True))
+        writer = write.Writer(io.BytesIO(), lambda obj: obj, compress=True)
+        for number in oCrossReference.InUse():
+            object = oCrossReference.GetObject(number)
+            writer.copyObject(object)
+            self.assertFalse(object.IsMaterialized())
+            self.assertEqual(number in writer.compressedObjects, number != 4)
+        writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
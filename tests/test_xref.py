@@ -0,0 +1,81 @@
+import unittest
+
+import parser
+import xref
+from test_destroyer import DestroyerTestCase
+from test_parser import BuildPDF, STREAM_IN_STRING
+
+
+def BuildHybridPDF():
+    """
+    BuildHybridPDF returns a hybrid-reference PDF: objects 4 and 5 are stored in the object stream 6 and listed as
+    free in the xref table, and the xref stream 7, named by /XRefStm in the trailer, lists them as compressed.
+    """
+    objects = {
+        1: b'<< /Type /Catalog /Pages 2 0 R >>',
+        2: b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        3: b'<< /Type /Page /Parent 2 0 R /Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> >>',
+    }
+    font = b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>'
+    header = b'4 0 5 %d ' % len(font)
+    objects[6] = b'<< /Type /ObjStm /N 2 /First %d /Length %d >>\nstream\n%s%s%s\nendstream' % (len(header), len(header) + 2 * len(font), header, font, font)
+
+    data = bytearray(b'%PDF-1.5\n')
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(data)
+        data += b'%d 0 obj\n%s\nendobj\n' % (number, objects[number])
+    rows = bytes([2, 0, 6, 0, 2, 0, 6, 1])
+    offsets[7] = len(data)
+    data += b'7 0 obj\n<< /Type /XRef /Size 8 /W [1 2 1] /Index [4 2] /Length %d >>\nstream\n%s\nendstream\nendobj\n' % (len(rows), rows)
+
+    startxref = len(data)
+    data += b'xref\n0 8\n0000000000 65535 f \n'
+    for number in range(1, 8):
+        if number in (4, 5):
+            data += b'0000000000 00000 f \n'
+        else:
+            data += b'%010d 00000 n \n' % offsets[number]
+    data += b'trailer\n<< /Size 8 /Root 1 0 R /XRefStm %d >>\nstartxref\n%d\n%%%%EOF\n' % (offsets[7], startxref)
+    return bytes(data)
+
+
+class TestHybridReference(DestroyerTestCase):
+
+    def testTrailerAndCompressedEntries(self):
+        oCrossReference = xref.CrossReference(parser.Parser(parser.Document(BuildHybridPDF()), lazy=True))
+        self.assertEqual(xref.Integers(oCrossReference.trailer.Get('/Root')), [1, 0])
+        self.assertFalse(oCrossReference.xrefStream)
+        self.assertEqual(oCrossReference.Kind(4), xref.XREF_ENTRY_COMPRESSED)
+        self.assertEqual(oCrossReference.Kind(5), xref.XREF_ENTRY_COMPRESSED)
+        self.assertEqual(oCrossReference.GetObject(5).GetType(), '/Font')
+
+    def testIncremental(self):
+        output = self.Destroy(self.Path('hybrid.pdf', BuildHybridPDF()), incremental=True)
+        oCrossReference = xref.CrossReference(parser.Parser(output, lazy=True))
+        self.assertEqual(xref.Integers(oCrossReference.trailer.Get('/Root')), [1, 0])
+        self.assertEqual(oCrossReference.Kind(4), xref.XREF_ENTRY_IN_USE)
+        self.assertIn('/ToUnicode', ''.join(oCrossReference.GetObject(4).content.values))
+
+
+class TestRawObjects(unittest.TestCase):
+
+    def testSameAsParsed(self):
+        for data in (BuildPDF(STREAM_IN_STRING), BuildHybridPDF()):
+            oCrossReference = xref.CrossReference(parser.Parser(parser.Document(data), lazy=True))
+            objects = list(oCrossReference.InUseObjects())
+            self.assertEqual([object.id for object in objects], oCrossReference.InUse())
+            for object in objects:
+                self.assertFalse(object.IsMaterialized())
+                parsed = oCrossReference.GetObject(object.id)
+                self.assertEqual((object.version, object.start, object.dictionaryEnd, object.end, object.GetType()), (parsed.version, parsed.start, parsed.dictionaryEnd, parsed.end, parsed.GetType()))
+
+    def testWrongOffset(self):
+        oCrossReference = xref.CrossReference(parser.Parser(parser.Document(BuildPDF(STREAM_IN_STRING)), lazy=True))
+        self.assertEqual(oCrossReference.GetRawObject(2, oCrossReference.fields[3]).id, 2)
+        oCrossReference.fields[2] += 1
+        self.assertEqual(oCrossReference.GetRawObject(2, oCrossReference.fields[3]), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,22 +1,32 @@
+import os
 import sys
 import zlib
 import platform
 import re
 
+import pdf_objects
+
 #Convert 2 Bytes If Python 3
 def C2BIP3(string):
     if sys.version_info[0] > 2:
-        if type(string) == bytes:
-            return string
+        if type(string) == str:
+            return string.encode('latin-1')
         else:
-            return bytes([ord(x) for x in string])
+            return string
     else:
         return string
 
 
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+OBJECTS_PER_STREAM = 100
+COPY_RANGE_THRESHOLD = 1024 * 1024
+
+
 def FormatOutput(data, raw):
         if raw:
-            if type(data) == type([]):
+            if isinstance(data, pdf_objects.TokenList):
+                return ''.join(data.values)
+            elif type(data) == type([]):
                 return ''.join(map(lambda x: x[1], data))
             else:
                 return data
@@ -26,6 +36,31 @@ def FormatOutput(data, raw):
             return repr(data)
 
 
+def Subsections(numbers):
+    """
+    Subsections returns (first, count) pairs covering the given object numbers with runs of consecutive numbers.
+    """
+    subsections = []
+    for number in sorted(numbers):
+        if subsections != [] and subsections[-1][0] + subsections[-1][1] == number:
+            subsections[-1] = (subsections[-1][0], subsections[-1][1] + 1)
+        else:
+            subsections.append((number, 1))
+    return subsections
+
+
+def UpgradeHeader(data):
+    """
+    UpgradeHeader returns the start of a PDF document with a %PDF-1.0 to %PDF-1.4 header in its first kilobyte
+    raised to %PDF-1.5, which xref streams and object streams need. Only the version digit changes, so that offsets
+    into the document stay valid.
+    """
+    oMatch = re.search(rb'%PDF-1\.([0-4])\s', bytes(data[:1024]))
+    if oMatch == None:
+        return data
+    return bytes(data[:oMatch.start(1)]) + b'5' + bytes(data[oMatch.end(1):])
+
+
 def SplitByLength(input, length):
     result = []
     while len(input) > length:
@@ -36,67 +71,318 @@ def SplitByLength(input, length):
 
 
 class Writer:
-    def __init__(self, filename, formatFunc):
+    def __init__(self, file, formatFunc, bufferSize=DEFAULT_BUFFER_SIZE, compress=False):
         """
-        __init__ creates all necessary structures to write a PDF. It also creates a blank file with the given filename.
+        __init__ creates all necessary structures to write a PDF. file is either a filename, in which case a blank file
+        with that name is created, or a writable binary stream (file, pipe, BytesIO ...). Output is collected in a
+        buffer of bufferSize bytes and the current offset is tracked in memory. With compress, objects without a
+        stream are packed into Flate-compressed object streams and the cross-reference table is written as an xref
+        stream.
         """
-        self.filename = filename
         self.formatFunc = formatFunc
         self.indirectObjects = {}
-        fPDF = open(self.filename, 'w')
-        fPDF.close()
+        # the generations of the objects in indirectObjects that are not 0
+        self.generations = {}
+        self.compress = compress
+        self.compressedObjects = {}
+        self.objectStreams = {}
+        self.size = 0
+        self.bufferSize = bufferSize
+        self.buffer = []
+        self.buffered = 0
+        if type(file) == str:
+            self.filename = file
+            self.outfile = open(file, 'wb')
+            self.ownsFile = True
+            self.offset = 0
+        else:
+            self.filename = getattr(file, 'name', None)
+            self.outfile = file
+            self.ownsFile = False
+            try:
+                self.offset = file.tell()
+            except (AttributeError, OSError, ValueError):
+                self.offset = 0
 
     def appendBinary(self, str):
-        fPDF = open(self.filename, 'ab')
-        fPDF.write(C2BIP3(str))
-        fPDF.close()
-    
+        data = C2BIP3(str)
+        if len(data) >= self.bufferSize:
+            self.flush()
+            self.outfile.write(data)
+            self.offset += len(data)
+            return
+        self.buffer.append(data)
+        self.buffered += len(data)
+        self.offset += len(data)
+        if self.buffered >= self.bufferSize:
+            self.flush()
+
+    def copyRange(self, document, start, end):
+        """
+        copyRange appends the bytes start to end of the given parser.Document. Large ranges of a memory-mapped input
+        are copied by the kernel with os.copy_file_range when the output is a real file.
+        """
+        if end - start >= COPY_RANGE_THRESHOLD and hasattr(os, 'copy_file_range') and document.fileno() != None:
+            try:
+                outfileno = self.outfile.fileno()
+            except (AttributeError, OSError, ValueError):
+                outfileno = None
+            if outfileno != None:
+                self.flush()
+                position = start
+                try:
+                    while position < end:
+                        copied = os.copy_file_range(document.fileno(), outfileno, end - position, position)
+                        if copied == 0:
+                            break
+                        position += copied
+                except OSError:
+                    pass
+                self.offset += position - start
+                start = position
+        if start < end:
+            self.appendBinary(memoryview(document.data)[start:end])
+
     def appendString(self, str):
-        fPDF = open(self.filename, 'a')
-        fPDF.write(str)
-        fPDF.close()
+        self.appendBinary(str.encode('latin-1'))
+
+    def flush(self):
+        if self.buffer != []:
+            # the pieces are written as they are, joining them would copy the whole buffer
+            self.outfile.writelines(self.buffer)
+            self.buffer = []
+            self.buffered = 0
+        self.outfile.flush()
+
+    def close(self):
+        """
+        close writes out the buffer, and closes the output file if the writer opened it.
+        """
+        self.flush()
+        if self.ownsFile:
+            self.outfile.close()
 
     def filesize(self):
-        fPDF = open(self.filename, 'rb')
-        fPDF.seek(0, 2)
-        size = fPDF.tell()
-        fPDF.close()
-        return size
-        
+        return self.offset
+
     def isWindows(self):
         return platform.system() in ('Windows', 'Microsoft')
 
     def writeComment(self, comment):
         commentStr = repr(comment)
+        if self.compress:
+            # xref streams and object streams need PDF 1.5
+            oMatch = re.match(r'%PDF-1\.([0-4])(\s)', commentStr)
+            if oMatch:
+                commentStr = '%PDF-1.5' + commentStr[oMatch.end(1):]
         if not commentStr.startswith('%%EOF'):
             self.appendString(commentStr)
 
     def writeObject(self, object):
-        dataPrecedingStream = object.ContainsStream()
+        dataPrecedingStream = object.StreamDictionary()
         if dataPrecedingStream:
             compressed = object.Stream(False)
             dictionary = FormatOutput(dataPrecedingStream, True)
             self.writeStream(object.id, object.version, compressed, dictionary)
+        elif self.compress and object.version == 0:
+            self.writeCompressedObject(object.id, self.formatFunc(object).strip())
         else:
             self.writeIndirectObject(object.id, object.version, self.formatFunc(object).strip())
 
+    def copyObject(self, object):
+        """
+        copyObject writes the object with its source bytes instead of re-serializing its tokens, and falls back to
+        writeObject when those bytes are not known.
+        """
+        raw = object.RawContent()
+        if raw == None:
+            self.writeObject(object)
+        elif self.compress and object.version == 0 and not object.ContainsStream():
+            self.writeCompressedObject(object.id, str(raw, 'latin-1').strip())
+        else:
+            self.appendString("\n")
+            self.recordObject(object.id, object.version)
+            self.appendString("%d %d obj" % (object.id, object.version))
+            if isinstance(object, pdf_objects.LazyIndirectObject):
+                self.copyRange(object.document, object.start, object.end)
+            else:
+                self.appendBinary(raw)
+            self.appendString("endobj\n")
+
+    def spliceObject(self, object, position, insertion):
+        """
+        spliceObject writes a lazy object without a stream with the string insertion added at the given offset of its
+        content in the document. The bytes around it are copied from the input instead of re-serializing the tokens,
+        and the result is the same as writeObject on the content with the insertion.
+        """
+        data = object.document.data
+        start = object.start
+        end = object.end
+        while start < position and chr(data[start]).isspace():
+            start += 1
+        while end > position and chr(data[end - 1]).isspace():
+            end -= 1
+        if self.compress and object.version == 0:
+            self.writeCompressedObject(object.id, str(data[start:position], 'latin-1') + insertion + str(data[position:end], 'latin-1'))
+        else:
+            self.appendString("\n")
+            self.recordObject(object.id, object.version)
+            self.appendString("%d %d obj\n" % (object.id, object.version))
+            self.copyRange(object.document, start, position)
+            self.appendString(insertion)
+            self.copyRange(object.document, position, end)
+            self.appendString("\nendobj\n")
+
+    def writeCompressedObject(self, index, io):
+        """
+        writeCompressedObject keeps the given object to be written into an object stream by writeXrefAndTrailer.
+        """
+        self.indirectObjects.pop(index, None)
+        self.generations.pop(index, None)
+        self.compressedObjects.pop(index, None)
+        self.compressedObjects[index] = io
+
+    def writeSerializedObjects(self, data, indirectObjects, compressedObjects, generations={}):
+        """
+        writeSerializedObjects appends objects serialized by another Writer that started at offset 0, e.g. one writing
+        to a BytesIO in a worker process, taking over its object offsets (moved to the current offset), generations
+        and pending compressed objects.
+        """
+        start = self.filesize()
+        for index, offset in indirectObjects.items():
+            self.compressedObjects.pop(index, None)
+            self.indirectObjects[index] = start + offset
+            if index in generations:
+                self.generations[index] = generations[index]
+            else:
+                self.generations.pop(index, None)
+        for index, io in compressedObjects.items():
+            self.writeCompressedObject(index, io)
+        self.appendBinary(data)
+
+    def recordObject(self, index, version):
+        """
+        recordObject records that the object with the given number and generation starts at the current offset.
+        """
+        self.compressedObjects.pop(index, None)
+        self.indirectObjects[index] = self.filesize()
+        if version != 0:
+            self.generations[index] = version
+        else:
+            self.generations.pop(index, None)
+
     def writeIndirectObject(self, index, version, io):
         self.appendString("\n")
-        self.indirectObjects[index] = self.filesize()
+        self.recordObject(index, version)
         self.appendString("%d %d obj\n%s\nendobj\n" % (index, version, io))
 
     def writeStream(self, index, version, streamdata, dictionary):
         self.appendString("\n")
-        self.indirectObjects[index] = self.filesize()
+        self.recordObject(index, version)
         self.appendString(("%d %d obj\n" + dictionary + "\nstream\n") % (index, version))
         self.appendBinary(streamdata)
         self.appendString("\nendstream\nendobj\n")
 
     def writeXrefAndTrailer(self, rootId, rootVersion, info=None):
-        xrefdata = self.writeXref()
         root = ("%d %d R") % (rootId, rootVersion)
+        if self.compress:
+            self.writeObjectStreams()
+            self.writeXrefStream(root, info)
+            return
+        xrefdata = self.writeXref()
         self.writeTrailer(xrefdata[0], xrefdata[1], root, info)
 
+    def writeUpdateXrefAndTrailer(self, root, previous, info=None, documentId=None):
+        """
+        writeUpdateXrefAndTrailer ends an incremental update: its cross-reference section only lists the objects
+        written by this writer and its trailer points to the previous section with /Prev.
+        """
+        if self.compress:
+            self.writeObjectStreams()
+            self.writeXrefStream(root, info, previous, documentId)
+            return
+        self.appendString("\n")
+        startxref = self.filesize()
+        self.appendString("xref\n")
+        if self.isWindows():
+            eol = '\n'
+        else:
+            eol = ' \n'
+        for first, count in Subsections(self.indirectObjects.keys()):
+            self.appendString("%d %d\n" % (first, count))
+            for i in range(first, first + count):
+                self.appendString("%010d %05d n%s" % (self.indirectObjects[i], self.generations.get(i, 0), eol))
+        trailer = "trailer\n<<\n /Size %d\n /Root %s\n" % (self.nextObjectNumber(), root)
+        if info != None:
+            trailer += " /Info %s\n" % info
+        if documentId != None:
+            trailer += " /ID %s\n" % documentId
+        self.appendString(trailer + " /Prev %d\n>>\nstartxref\n%d\n%%%%EOF\n" % (previous, startxref))
+
+    def nextObjectNumber(self):
+        return max(list(self.indirectObjects.keys()) + list(self.compressedObjects.keys()) + list(self.objectStreams.keys()) + [0, self.size - 1]) + 1
+
+    def writeObjectStreams(self):
+        """
+        writeObjectStreams packs the kept objects into object streams of at most OBJECTS_PER_STREAM objects, numbered
+        after the highest object number in use.
+        """
+        pending = list(self.compressedObjects.items())
+        number = self.nextObjectNumber()
+        for start in range(0, len(pending), OBJECTS_PER_STREAM):
+            header = []
+            body = []
+            offset = 0
+            for position, (index, io) in enumerate(pending[start:start + OBJECTS_PER_STREAM]):
+                header.append('%d %d' % (index, offset))
+                body.append(io + '\n')
+                offset += len(io) + 1
+                self.objectStreams[index] = (number, position)
+            header = ' '.join(header) + '\n'
+            streamdata = zlib.compress((header + ''.join(body)).encode('latin-1'))
+            dictionary = '<<\n /Type /ObjStm\n /N %d\n /First %d\n /Filter /FlateDecode\n /Length %d\n>>' % (len(body), len(header), len(streamdata))
+            self.writeStream(number, 0, streamdata, dictionary)
+            number += 1
+        self.compressedObjects = {}
+
+    def writeXrefStream(self, root, info=None, previous=None, documentId=None):
+        """
+        writeXrefStream writes a /Type /XRef stream holding both the cross-reference entries and the trailer keys.
+        For an incremental update (previous is the offset of the previous section) only the objects written by this
+        writer are listed.
+        """
+        self.appendString("\n")
+        # the offset writeStream will record for the xref stream, after the newline it starts with
+        startxref = self.filesize() + 1
+        index = self.nextObjectNumber()
+        self.indirectObjects[index] = startxref
+        size = index + 1
+        if previous == None:
+            subsections = [(0, size)]
+        else:
+            subsections = Subsections(list(self.indirectObjects.keys()) + list(self.objectStreams.keys()))
+        width = max(1, (max(startxref, size).bit_length() + 7) // 8)
+        rows = bytearray()
+        for first, count in subsections:
+            for i in range(first, first + count):
+                if i in self.indirectObjects:
+                    rows += b'\x01' + self.indirectObjects[i].to_bytes(width, 'big') + self.generations.get(i, 0).to_bytes(2, 'big')
+                elif i in self.objectStreams:
+                    rows += b'\x02' + self.objectStreams[i][0].to_bytes(width, 'big') + self.objectStreams[i][1].to_bytes(2, 'big')
+                else:
+                    rows += b'\x00' + bytes(width) + b'\xff\xff'
+        streamdata = zlib.compress(bytes(rows))
+        dictionary = '<<\n /Type /XRef\n /Size %d\n /W [1 %d 2]\n /Root %s\n' % (size, width, root)
+        if previous != None:
+            dictionary += ' /Index [%s]\n /Prev %d\n' % (' '.join('%d %d' % subsection for subsection in subsections), previous)
+        if info != None:
+            dictionary += ' /Info %s\n' % info
+        if documentId != None:
+            dictionary += ' /ID %s\n' % documentId
+        dictionary += ' /Filter /FlateDecode\n /Length %d\n>>' % len(streamdata)
+        self.writeStream(index, 0, streamdata, dictionary)
+        self.appendString("startxref\n%d\n%%%%EOF\n" % self.indirectObjects[index])
+
     def writeTrailer(self, startxref, size, root, info=None):
         if info == None:
             self.appendString("trailer\n<<\n /Size %d\n /Root %s\n>>\nstartxref\n%d\n%%%%EOF\n" % (size, root, startxref))
@@ -117,7 +403,7 @@ class Writer:
             eol = ' \n'
         for i in range(0, max+1):
             if i in self.indirectObjects:
-                self.appendString("%010d %05d n%s" % (self.indirectObjects[i], 0, eol))
+                self.appendString("%010d %05d n%s" % (self.indirectObjects[i], self.generations.get(i, 0), eol))
             else:
                 self.appendString("0000000000 65535 f%s" % eol)
         return (startxref, (max+1))
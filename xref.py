@@ -0,0 +1,331 @@
+import array
+import bisect
+import re
+
+import decode
+import parser
+import pdf_objects
+
+XREF_ENTRY_UNKNOWN = -1
+XREF_ENTRY_FREE = 0
+XREF_ENTRY_IN_USE = 1
+XREF_ENTRY_COMPRESSED = 2
+
+PDF_ELEMENT_INDIRECT_OBJECT = 2
+PDF_ELEMENT_XREF = 3
+PDF_ELEMENT_TRAILER = 4
+
+TAIL_SIZE = 1024
+STARTXREF_PATTERN = re.compile(rb'startxref\s+(\d+)')
+OBJECT_HEADER_PATTERN = re.compile(rb'[\x00\t\n\x0c\r ]*(\d+)[\x00\t\n\x0c\r ]+(\d+)[\x00\t\n\x0c\r ]+obj(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])')
+STREAM_END_PATTERN = re.compile(rb'endstream[\x00\t\n\x0c\r ]*endobj')
+
+
+def Integers(value):
+    """
+    Integers returns the integers found in a value list produced by ParseDictionary, e.g. [1 3 1] or 12 0 R.
+    """
+
+    if value == None:
+        return []
+    return [int(item) for item in value if type(item) == str and item.isdigit()]
+
+
+def FindStartxref(document):
+    """
+    FindStartxref returns the offset named by the last startxref keyword in the tail of the document.
+    """
+
+    start = max(0, document.size - TAIL_SIZE)
+    tail = bytes(document.data[start:document.size])
+    oMatch = None
+    for oMatch in STARTXREF_PATTERN.finditer(tail):
+        pass
+    if oMatch == None:
+        raise Exception('No startxref found in the last %d bytes' % TAIL_SIZE)
+    return int(oMatch.group(1))
+
+
+class CrossReference:
+    """
+    CrossReference indexes the indirect objects of a PDF document by object number. It follows startxref to the
+    newest xref table or xref stream and then the /Prev chain, so that objects can be parsed individually by seeking
+    to them instead of scanning the whole file.
+    """
+
+    def __init__(self, oPDFParser):
+        """
+        __init__ reads every cross-reference section of the document parsed by the given parser.
+        """
+
+        self.parser = oPDFParser
+        self.document = oPDFParser.tokenizer.pdf
+        # Parallel arrays indexed by object number, with the fields of an xref stream entry: the entry type, the
+        # byte offset (or the number of the containing /ObjStm) and the generation (or the index in the /ObjStm)
+        self.kinds = array.array('b')
+        self.fields = array.array('q')
+        self.generations = array.array('l')
+        self.trailer = None
+        self.xrefStream = False
+        self.objectStream = None
+        # the offsets of the cross-reference sections, which end the object before them like the next object does
+        self.sections = set()
+        self.startxref = FindStartxref(self.document)
+
+        visited = set()
+        offset = self.startxref
+        while offset != None and offset not in visited:
+            visited.add(offset)
+            offset = self.ReadSection(offset)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def Grow(self, size):
+        """
+        Grow extends the index so that it can hold object numbers smaller than size.
+        """
+
+        missing = size - len(self.kinds)
+        if missing > 0:
+            self.kinds.extend([XREF_ENTRY_UNKNOWN] * missing)
+            self.fields.extend([0] * missing)
+            self.generations.extend([0] * missing)
+
+    def Set(self, number, kind, field, generation, replaceable=()):
+        """
+        Set records an entry unless a newer section already did, since sections are read from newest to oldest, and
+        returns whether it did. Entries of the numbers in replaceable are overwritten.
+        """
+
+        self.Grow(number + 1)
+        if self.kinds[number] == XREF_ENTRY_UNKNOWN or number in replaceable:
+            self.kinds[number] = kind
+            self.fields[number] = field
+            self.generations[number] = generation
+            return True
+        return False
+
+    def ReadSection(self, offset, replaceable=()):
+        """
+        ReadSection reads the xref table or xref stream at the given offset and returns the offset of the previous
+        section, or None. The entries of the numbers in replaceable are overwritten by an xref stream.
+        """
+
+        self.sections.add(offset)
+        self.parser.Seek(offset)
+        element = self.parser.GetObject()
+        if element != None and element.type == PDF_ELEMENT_XREF:
+            free = self.ReadTable(element)
+            trailer = self.parser.GetObject()
+            if trailer == None or trailer.type != PDF_ELEMENT_TRAILER:
+                raise Exception('No trailer after xref table at offset %d' % offset)
+            oPDFParseDictionary = pdf_objects.ParseDictionary(trailer.content[1:], False)
+            if self.trailer == None:
+                self.trailer = oPDFParseDictionary
+            # hybrid-reference files keep the entries of their compressed objects in a separate xref stream, and
+            # list them as free in the table for readers that do not know xref streams
+            xrefStream = Integers(oPDFParseDictionary.Get('/XRefStm'))
+            if xrefStream:
+                self.ReadSection(xrefStream[0], free)
+        elif element != None and element.type == PDF_ELEMENT_INDIRECT_OBJECT and element.GetType() == '/XRef':
+            oPDFParseDictionary = self.ReadStream(element, replaceable)
+            if self.trailer == None:
+                self.xrefStream = True
+        else:
+            raise Exception('No cross-reference section at offset %d' % offset)
+
+        if self.trailer == None:
+            self.trailer = oPDFParseDictionary
+        self.Grow(max(Integers(oPDFParseDictionary.Get('/Size')) or [0]))
+        previous = Integers(oPDFParseDictionary.Get('/Prev'))
+        if previous:
+            return previous[0]
+        return None
+
+    def ReadTable(self, element):
+        """
+        ReadTable records the entries of a classic xref table and returns the set of numbers it recorded as free.
+        """
+
+        values = pdf_objects.CopyWithoutWhiteSpace(element.content[1:]).values
+        free = set()
+        i = 0
+        while i + 1 < len(values):
+            first = int(values[i])
+            count = int(values[i + 1])
+            i += 2
+            for number in range(first, first + count):
+                if i + 2 >= len(values):
+                    raise Exception('Truncated xref subsection starting at object %d' % first)
+                if values[i + 2] == 'n':
+                    self.Set(number, XREF_ENTRY_IN_USE, int(values[i]), int(values[i + 1]))
+                elif self.Set(number, XREF_ENTRY_FREE, int(values[i]), int(values[i + 1])):
+                    free.add(number)
+                i += 3
+        return free
+
+    def ReadStream(self, element, replaceable=()):
+        """
+        ReadStream records the entries of an xref stream and returns its dictionary. The entries of the numbers in
+        replaceable are overwritten.
+        """
+
+        oPDFParseDictionary = element.GetDictionary()
+        widths = Integers(oPDFParseDictionary.Get('/W'))
+        if len(widths) != 3:
+            raise Exception('Invalid /W in xref stream %d' % element.id)
+        index = Integers(oPDFParseDictionary.Get('/Index'))
+        if index == []:
+            index = [0, max(Integers(oPDFParseDictionary.Get('/Size')) or [0])]
+
+        data = element.Stream()
+        if data == 'No filters':
+            data = element.Stream(False)
+        if type(data) == str:
+            data = data.encode('latin-1')
+        decodeParms = oPDFParseDictionary.Get('/DecodeParms')
+        if decodeParms and type(decodeParms[0]) == tuple:
+            parameters = dict((key, Integers(value)) for key, value in decodeParms)
+            predictor = (parameters.get('/Predictor') or [1])[0]
+            columns = (parameters.get('/Columns') or [1])[0]
+            data = decode.UndoPredictor(data, predictor, columns)
+
+        rowSize = sum(widths)
+        position = 0
+        for i in range(0, len(index) - 1, 2):
+            for number in range(index[i], index[i] + index[i + 1]):
+                if position + rowSize > len(data):
+                    raise Exception('Truncated xref stream %d' % element.id)
+                fields = []
+                for width in widths:
+                    value = 0
+                    for byte in data[position:position + width]:
+                        value = (value << 8) | byte
+                    fields.append(value)
+                    position += width
+                if widths[0] == 0:
+                    fields[0] = XREF_ENTRY_IN_USE
+                if fields[0] in (XREF_ENTRY_FREE, XREF_ENTRY_IN_USE, XREF_ENTRY_COMPRESSED):
+                    self.Set(number, fields[0], fields[1], fields[2], replaceable)
+        return oPDFParseDictionary
+
+    def Kind(self, number):
+        """
+        Kind returns the entry type recorded for the given object number.
+        """
+
+        if number < 0 or number >= len(self.kinds):
+            return XREF_ENTRY_UNKNOWN
+        return self.kinds[number]
+
+    def InUse(self):
+        """
+        InUse returns the numbers of the objects stored directly in the file, ordered by their offset.
+        """
+
+        numbers = [number for number in range(len(self.kinds)) if self.kinds[number] == XREF_ENTRY_IN_USE]
+        numbers.sort(key=lambda number: self.fields[number])
+        return numbers
+
+    def InUseObjects(self):
+        """
+        InUseObjects yields the objects stored directly in the file, in file order. With a lazy parser each object is
+        taken by GetRawObject from its offset to the next object or cross-reference section, and only the objects it
+        cannot delimit are parsed with GetObject.
+        """
+
+        numbers = self.InUse()
+        boundaries = sorted(set(self.fields[number] for number in numbers) | self.sections | {self.document.size})
+        for number in numbers:
+            obj = None
+            if self.parser.lazy:
+                index = bisect.bisect_right(boundaries, self.fields[number])
+                if index < len(boundaries):
+                    obj = self.GetRawObject(number, boundaries[index])
+            if obj == None:
+                obj = self.GetObject(number)
+            if obj != None:
+                yield obj
+
+    def GetRawObject(self, number, end):
+        """
+        GetRawObject returns the object with the given number, stored directly in the file before end, as a
+        LazyIndirectObject without tokenizing it: the header is matched at the recorded offset, the stream or endobj
+        keyword is found with parser.FindKeyword, and the content of an object with a stream ends at the last
+        endstream endobj in the last TAIL_SIZE bytes before end. Only the dictionary is read, up to its /Type. It
+        returns None when the object is not delimited like that.
+        """
+
+        data = self.document.data
+        oMatch = OBJECT_HEADER_PATTERN.match(data, self.fields[number], end)
+        if oMatch == None or int(oMatch.group(1)) != number:
+            return None
+        version = int(oMatch.group(2))
+        start = oMatch.end()
+        oMatch = parser.FindKeyword(data, start)
+        if oMatch == None or oMatch.end() > end:
+            return None
+        dictionaryEnd = oMatch.start()
+        contentEnd = dictionaryEnd
+        if oMatch.group() == b'stream':
+            contentEnd = None
+            for oMatch in STREAM_END_PATTERN.finditer(data, max(oMatch.end(), end - TAIL_SIZE), end):
+                contentEnd = oMatch.end() - len(b'endobj')
+            if contentEnd == None:
+                return None
+        return pdf_objects.LazyIndirectObject(number, version, self.document, start, dictionaryEnd, contentEnd, parser.FindType(data, start, dictionaryEnd))
+
+    def Objects(self):
+        """
+        Objects yields the current revision of every object in use: first the objects stored directly in the file,
+        in file order, then the compressed objects grouped by the /ObjStm holding them.
+        """
+
+        for obj in self.InUseObjects():
+            yield obj
+        compressed = {}
+        for number in range(len(self.kinds)):
+            if self.kinds[number] == XREF_ENTRY_COMPRESSED:
+                compressed.setdefault(self.fields[number], []).append(number)
+        for objstmNumber in sorted(compressed):
+            for number in compressed[objstmNumber]:
+                obj = self.GetObject(number)
+                if obj != None:
+                    yield obj
+
+    def GetObject(self, number):
+        """
+        GetObject seeks to and parses the indirect object with the given number. It returns None if the object is
+        free, unknown or not found at the recorded offset.
+        """
+
+        kind = self.Kind(number)
+        if kind == XREF_ENTRY_IN_USE:
+            self.parser.Seek(self.fields[number])
+            obj = self.parser.GetObject()
+            if obj == None or obj.type != PDF_ELEMENT_INDIRECT_OBJECT or obj.id != number:
+                return None
+            return obj
+        if kind == XREF_ENTRY_COMPRESSED:
+            return self.GetCompressedObject(number)
+        return None
+
+    def GetCompressedObject(self, number):
+        """
+        GetCompressedObject parses an object stored inside an /ObjStm, keeping the last /ObjStm around for
+        neighbouring lookups.
+        """
+
+        objstmNumber = self.fields[number]
+        if self.objectStream == None or self.objectStream.objstm[0] != objstmNumber:
+            objstm = self.GetObject(objstmNumber)
+            if objstm == None or not objstm.ContainsStream():
+                return None
+            self.objectStream = pdf_objects.ObjectStream(objstm)
+        index = self.generations[number]
+        if index >= len(self.objectStream) or self.objectStream.numbers[index] != number:
+            index = self.objectStream.Index(number)
+            if index == None:
+                return None
+        return self.objectStream.GetObject(index)